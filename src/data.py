@@ -9,23 +9,30 @@
 
 #%%
 #TODO: #2 Factories by making dispatch work (may need data structure for datetime.date, int)
-#TODO: #3 Make it easier for outputs to be applied irregularly (e.g. every other time step, or once a month, etc.)
 #endregion
 
 #region Dependencies
 #%%
-import copy
+import sys
+import math
+import numbers
+import calendar
 import datetime
 from enum import IntEnum
 from dataclasses import dataclass
-from typing import OrderedDict, Protocol, Union, Callable, List, Dict, Any
+from typing import OrderedDict, Protocol, Union, Callable, List, Dict, Tuple, Set, Iterable, Any, Iterator, NamedTuple
+from collections import ChainMap
+from collections.abc import Mapping, Sequence
 from multipledispatch import dispatch
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+import src.utilities as utilities
+
 #%%
-@dataclass
 class Category(IntEnum):
     '''A enum describing if a variable is an inflow, outflow or neither.'''
     INFLOW = 0
@@ -44,7 +51,7 @@ class IVariable(Protocol):
         '''Returns value of additional data parameter.'''   
     def print(self):
         '''Prints a string representation of the parameter.'''  
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Input:
     '''An immutable TimeStep input'''
     value: Any
@@ -59,7 +66,6 @@ class Input:
             return f'{self.value} [{self.category.name.lower()}{", output" if self.isoutput else ""}]'
         else:
             return f'{self.value}' 
-@dataclass
 class RunOrder(IntEnum):
     '''An enum for callable output extensions.'''
     PRE_OPERATIONS = 0
@@ -70,11 +76,21 @@ class RunOrder(IntEnum):
 class Output:
     '''An immutable TimeStep output.'''
     fn: Callable[['TimeSeries', int], Dict[str, Any]]
-    '''A function that accepts an input and produces a Dict[str, Any] suitable for converting into a Dict[str, Input]'''
+    '''
+    A function that accepts the simulated timesteps and the index of the current timestep, and produces a Dict[str, Any] suitable for converting into a Dict[str, Input].
+    The index is the position of the timestep in the simulation, in a streamed simulation only the most recent timesteps can be read (see Simulation.stream()).
+    '''
     category: Category
     '''Labels the output as an inflow, outflow or neither for the purposes of computing storage and summation of results.'''
     runorder: RunOrder = RunOrder.PRE_OPERATIONS
     '''Defines if the value should be computed before or after operations in a Simulation()'''    
+    reads: Union[Tuple[str, ...], None] = None
+    '''The names of the variables read by the fn function, None (by default) if they are not declared. Outputs that only read exogenous inputs are computed before the simulation loop (see TimeSeries.precompute_outputs()).'''
+    vectorized: Union[Callable[['TimeSeries'], Dict[str, np.ndarray]], None] = None
+    '''An optional function that computes the output for every timestep at once from the input TimeSeries columns, returning an array of values for each output variable.'''
+    def isexogenous(self, exogenous: Set[str]) -> bool:
+        '''True if the output declares that it only reads the exogenous variables, False otherwise.'''
+        return self.reads != None and all(k in exogenous for k in self.reads)
     def run(self, ts: 'TimeSeries', t: int) -> Dict[str, Input]:
         '''Runs the fn function the results are converted into a Dict[str, Input].'''
         return {k: Input(value=v, category=self.category, isoutput=True) for k, v in self.fn(ts, t).items()}
@@ -92,30 +108,96 @@ class Output:
             starting_position [int]: the first time period with the duplicated output.
         Returns:
             A List[Output] where the output is duplicated at specified regular intervals.
-        Note: 
-            The resulting list will contain intervals of None between intervals of the duplicated output.
+        Note:
+            The resulting list will contain intervals of None between intervals of the duplicated output, use every() to schedule the output without building a list.
         '''
-        out = copy.deepcopy(self)
-        return [out if i == starting_position or (i - starting_position) % t == 0 else None for i in range(n)]  
+        schedule = self.every(t, starting_position)
+        return [self if schedule.isdue(i) else None for i in range(n)]
+    def every(self, period: int = 1, offset: int = 0) -> 'Scheduled':
+        '''Schedules the output to run every period timesteps starting at the offset timestep (see schedule_outputs()).'''
+        return Scheduled(self, period, offset)
     def print(self) -> str:
         '''Returns a simple string describing when the output is computed.'''
         return f'{"" if self.category == Category.OTHER else self.category.name.lower()} computed {self.runorder.name.lower()}'
+SUMMED_CATEGORIES = (Category.INFLOW, Category.OUTFLOW, Category.STORAGE)
+'''The Input.Category values that are summed by TimeStep.totals(), in the order of their Category values.'''
+def sum_categories(inputs: Dict[str, Input]) -> List[float]:
+    '''Sums the inputs by Input.Category, returning a list of the inflow, outflow and storage totals.'''
+    totals = [0, 0, 0]
+    for v in inputs.values():
+        if v.category in SUMMED_CATEGORIES:
+            totals[v.category] += v.value
+    return totals
+MAX_INPUT_LAYERS: int = 8
+'''The number of TimeStep.addinputs() layers that are shared before they are collapsed into a single dictionary of inputs.'''
+class CalendarDay(NamedTuple):
+    '''The water year calendar facts for a single date.'''
+    dowy: int
+    '''The day of the water year (see utilities.datetime_to_dowy()).'''
+    water_year: int
+    '''The water year, which starts on 1 October of the previous calendar year.'''
+    month: int
+    '''The calendar month.'''
+    isleap: bool
+    '''True if the date's calendar year is a leap year, False otherwise.'''
+    @staticmethod
+    def from_date(date: datetime.date) -> 'CalendarDay':
+        return CalendarDay(utilities.datetime_to_dowy(date), date.year + (date.month >= 10), date.month, calendar.isleap(date.year))
+@dataclass(frozen=True)
+class Calendar:
+    '''The water year calendar facts for each date in a TimeSeries, as arrays computed with vectorized datetime64 arithmetic.'''
+    dowy: np.ndarray
+    '''The day of the water year.'''
+    water_year: np.ndarray
+    '''The water year, which starts on 1 October of the previous calendar year.'''
+    month: np.ndarray
+    '''The calendar month.'''
+    isleap: np.ndarray
+    '''True where the date's calendar year is a leap year.'''
+    @staticmethod
+    def from_dates(dates: List[datetime.date]) -> 'Calendar':
+        '''Builds the calendar for a list of dates (datetime.date, datetime.datetime or pandas.Timestamp values), raising a ValueError for integer timesteps.'''
+        if not all(isinstance(d, datetime.date) for d in dates):
+            raise ValueError('The calendar requires dated timesteps, integer timesteps have no calendar and result in an error.')
+        days = np.asarray(dates, dtype='datetime64[D]')
+        years = days.astype('datetime64[Y]')
+        doy = (days - years).astype(int) + 1
+        month = days.astype('datetime64[M]').astype(int) % 12 + 1
+        year = years.astype(int) + 1970
+        isleap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+        oct01 = 274 + isleap
+        return Calendar(np.where(doy < oct01, doy + 92, doy - (oct01 - 1)), year + (month >= 10), month, isleap)
+    def __len__(self) -> int:
+        return len(self.dowy)
+    def __getitem__(self, t: int) -> CalendarDay:
+        return CalendarDay(self.dowy.item(t), self.water_year.item(t), self.month.item(t), self.isleap.item(t))
 class TimeStep:
-    '''A mutable container holding a single time step's inputs and outputs.'''
+    '''A mutable container holding a single time step's inputs and outputs, or a lightweight view over a single row of a TimeSeries.'''
+    __slots__ = ('_date', '_inputs', '_outputs', '_series', '_row', '_totals', '_day')
     def __init__(self, date: Union[datetime.date, int], inputs: Dict[str,Input], outputs: Dict[str,Output] = None):
         self._date = date
-        cnt = sum([1 if v.category.name == Category.STORAGE else 0 for v in inputs.values()])
+        cnt = sum([1 if v.category == Category.STORAGE else 0 for v in inputs.values()])
         if cnt < 2:
             self._inputs = inputs
         else:
             raise ValueError(f'The proposed timestep: {self.print_date()}, contains more than one storage value in its inputs resulting in an error.')   
         self._outputs = self.sort_outputs(outputs)
-        # def sort_by_runorder_category(key: str):
-        #     ro = outputs[key].run_order.name
-        #     return 0 + outputs[key].category.value if ro == RunOrder.PRE_OPERATIONS.name else 10 + outputs[key].category.value 
-        # self._outputs = OrderedDict(sorted(outputs, key=sort_by_runorder_category)) if outputs !=None else OrderedDict()
-        #self._outputs = OrderedDict(sorted(outputs, key= lambda k: (outputs[k].run_order, outputs[k].category))) if outputs != None else OrderedDict()    
-    def sort_outputs(self, outputs: Dict[str, Output]) -> OrderedDict[str, Output]:
+        self._series, self._row = None, None
+        self._totals = sum_categories(inputs)
+        self._day = None
+    @classmethod
+    def view(cls, series: 'TimeSeries', row: int) -> 'TimeStep':
+        '''Returns a TimeStep that reads its inputs from a single row of the TimeSeries columns, without copying them.'''
+        step = cls.__new__(cls)
+        step._date = series._dates[row]
+        step._inputs = _RowInputs(series, row)
+        step._outputs = series._outputs.get(row, OrderedDict())
+        step._series, step._row = series, row
+        step._totals = None
+        step._day = None
+        return step
+    @staticmethod
+    def sort_outputs(outputs: Dict[str, Output]) -> OrderedDict[str, Output]:
         if outputs == None:
             return OrderedDict()
         else:
@@ -130,29 +212,71 @@ class TimeStep:
         '''The time step or date.'''
         return self._date
     @property
+    def calendar(self) -> CalendarDay:
+        '''The water year calendar facts for the time step date, read from the TimeSeries.calendar for time steps that come from a TimeSeries.'''
+        if self._day is None:
+            self._day = self._series.calendar[self._row] if self._series is not None else CalendarDay.from_date(self._date)
+        return self._day
+    @property
     def inputs(self) -> Dict[str, Input]:
         '''A dictionary of named input variables.'''
         return self._inputs
     @inputs.setter
     def inputs(self, inputs: Dict[str, Input]) -> Dict[str, Input]:
         self._inputs = inputs
+        self._series, self._row = None, None
+        self._totals = sum_categories(inputs)
     @property
     def outputs(self) -> OrderedDict[str, Output]:
         '''An ordered (first by Output.RunOrder then by Output.isoutflow) dictionary of computable variables.'''
         return self._outputs
+    @property
+    def isview(self) -> bool:
+        '''True if the time step reads its inputs from a TimeSeries row, False otherwise.'''
+        return self._series is not None
+    def totals(self) -> List[float]:
+        '''The inflow, outflow and storage sums (indexed by Category), which are kept up to date as inputs are added.'''
+        if self._totals is None:
+            self._totals = [self._series.total(c).item(self._row) for c in SUMMED_CATEGORIES]
+        return self._totals
+    def total(self, category: Category) -> float:
+        '''Sums the values of all inputs with the specified Input.Category.'''
+        if category in SUMMED_CATEGORIES:
+            return self.totals()[category]
+        return sum([v.value for v in self.inputs.values() if v.category == category])
     def inflows(self) -> float:
         '''Uses the Input.Category field to sum all inflow values.'''
-        return sum([self.inputs[k].value for k in self.inputs.keys() if self.inputs[k].category.name == Category.INFLOW.name])
+        return self.total(Category.INFLOW)
     def outflows(self) -> float:
         '''Uses the Input.Category field to sum all outflow values.'''
-        return sum([self.inputs[k].value for k in self.inputs.keys() if self.inputs[k].category.name == Category.OUTFLOW.name])
+        return self.total(Category.OUTFLOW)
     def storage(self):
         '''Uses the Input.Category field to sum all storage values.'''
-        return sum([self.inputs[k].value for k in self.inputs.keys() if self.inputs[k].category.name == Category.STORAGE.name])
+        return self.total(Category.STORAGE)
     def addinputs(self, new_inputs: Dict[str, Input]) -> 'TimeStep':
-        '''Creates an new independent object based on self, plus new inputs (primarily by running outputs) to the timestep's existing inputs.'''
-        result = copy.deepcopy(self)
-        result.inputs = result._inputs | new_inputs
+        '''Creates a new TimeStep with the new inputs (primarily from running outputs) layered over the timestep's existing inputs, which are shared rather than copied.'''
+        totals, stale = list(self.totals()), set()
+        for k, v in new_inputs.items():
+            old = self._inputs.get(k)
+            if old is not None and old.category in SUMMED_CATEGORIES:
+                if isinstance(old.value, numbers.Real) and math.isfinite(old.value):
+                    totals[old.category] -= old.value
+                else: # nan, inf or non-numeric values can't be subtracted from the total.
+                    stale.add(old.category)
+            if v.category in SUMMED_CATEGORIES:
+                if isinstance(v.value, numbers.Real):
+                    totals[v.category] += v.value
+                else:
+                    stale.add(v.category)
+        maps = self._inputs.maps if isinstance(self._inputs, ChainMap) else [self._inputs]
+        result = TimeStep.__new__(TimeStep)
+        result._date, result._outputs = self._date, self._outputs
+        result._series, result._row = None, None
+        result._day = self._day if self._series is None or self._series._calendar is None else self._series._calendar[self._row]
+        result._inputs = ChainMap(dict(new_inputs), *maps) if len(maps) < MAX_INPUT_LAYERS else ChainMap(dict(ChainMap(new_inputs, *maps)))
+        for c in stale:
+            totals[c] = sum([v.value for v in result._inputs.values() if v.category == c])
+        result._totals = totals
         return result
     def print_date(self):
         return self.date.strftime("%d %b %Y") if isinstance(self.date, datetime.date) else self.date
@@ -166,38 +290,257 @@ class TimeStep:
     def print(self, verbose: bool = False) -> str:
         '''Print a string representation of the data.'''
         return f'{self.print_date()} ({self.print_data(verbose=verbose)})'
+def to_column(values: List[Any], present: Union[np.ndarray, None] = None) -> np.ndarray:
+    '''
+    Converts a list of values into a TimeSeries column.
+    Args:
+        values [List[Any]]: the values, missing values should be listed as nan.
+        present [np.ndarray]: an optional boolean array marking the values that are not missing.
+    Returns:
+        A float array for numeric values with missing entries, an int or bool array for complete integer or boolean values, and an object array otherwise.
+    '''
+    iscomplete = present is None or bool(present.all())
+    try:
+        kind = np.asarray(values if iscomplete else [v for v, p in zip(values, present) if p]).dtype.kind
+    except ValueError:
+        kind = 'O'
+    if kind == 'f' or kind in 'iu' and not iscomplete:
+        return np.asarray(values, dtype=float)
+    if kind in 'iu' or kind == 'b' and iscomplete:
+        return np.asarray(values)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+class _RowInputs(Mapping):
+    '''A read only Dict[str, Input] over a single row of TimeSeries columns, Input objects are only built when a value is requested.'''
+    __slots__ = ('_series', '_row')
+    def __init__(self, series: 'TimeSeries', row: int):
+        self._series, self._row = series, row
+    def __getitem__(self, key: str) -> Input:
+        if not self._series.ispresent(key, self._row):
+            raise KeyError(key)
+        isoutput = self._series._isoutput[key]
+        return Input(value=self._series._columns[key].item(self._row), category=self._series._categories[key], isoutput=bool(isoutput[self._row]))
+    def __iter__(self):
+        return (k for k in self._series._columns if self._series.ispresent(k, self._row))
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+class _TimeStepRows(Sequence):
+    '''A read only List[TimeStep] of row views over a TimeSeries.'''
+    __slots__ = ('_series',)
+    def __init__(self, series: 'TimeSeries'):
+        self._series = series
+    def __getitem__(self, t: Union[int, slice]) -> Union[TimeStep, List[TimeStep]]:
+        if isinstance(t, slice):
+            return [TimeStep.view(self._series, i) for i in range(*t.indices(len(self)))]
+        if t < 0:
+            t += len(self)
+        if not 0 <= t < len(self):
+            raise IndexError(f'The timestep index: {t} is outside of the timeseries with {len(self)} timesteps.')
+        return TimeStep.view(self._series, t)
+    def __len__(self) -> int:
+        return len(self._series)
 class TimeSeries:
     '''
-    A mutable container holding a list of timestep data.
+    A columnar container holding timestep data, with one array per variable, a Category for each variable, and the outputs for each timestep.
     '''
     #TODO: Check to make sure other outputs requiring initialization have starting value.
     # add factory that allows or initial Timestep, then all other timesteps, also for irregular pattern to some inputs, outputs (e.g. every x timesteps include y in list)
     #TODO: Check for some consistency inputs, though outputs may be computed on irregular time steps.
     def __init__(self, timesteps: List[TimeStep]):
-        self.timesteps: List[TimeStep] = timesteps
-        self.storage_key: str = self.find_storage_key()
+        names: Dict[str, Category] = {}
+        for t in timesteps:
+            for k, v in t.inputs.items():
+                names.setdefault(k, v.category)
+        columns, masks, isoutput = {}, {}, {}
+        for k in names:
+            present = np.array([k in t.inputs for t in timesteps], dtype=bool)
+            columns[k] = to_column([t.inputs[k].value if k in t.inputs else np.nan for t in timesteps], present)
+            masks[k] = None if present.all() else present
+            isoutput[k] = np.array([t.inputs[k].isoutput if k in t.inputs else False for t in timesteps], dtype=bool)
+        outputs = {i: t.outputs for i, t in enumerate(timesteps) if t.outputs}
+        self._build([t.date for t in timesteps], columns, names, isoutput, masks, outputs)
+    def _build(self, dates: List[Union[datetime.date, int]], columns: Dict[str, np.ndarray], categories: Dict[str, Category],
+               isoutput: Dict[str, np.ndarray], masks: Dict[str, Union[np.ndarray, None]], outputs: Dict[int, Dict[str, Output]], storage_key: Union[str, None] = None) -> None:
+        self._dates = dates
+        self._columns = columns
+        self._categories = categories
+        self._isoutput = isoutput
+        self._masks = masks
+        self._outputs = outputs
+        self._totals: Dict[Category, np.ndarray] = {}
+        self._calendar: Union[Calendar, None] = None
+        self.storage_key: str = self.find_storage_key() if storage_key == None else storage_key
+    @classmethod
+    def from_columns(cls, dates: List[Union[datetime.date, int]], columns: Dict[str, Any], categories: Dict[str, Category],
+                     isoutput: Union[Dict[str, Any], None] = None, outputs: Union[Dict[int, Dict[str, Output]], None] = None, storage_key: Union[str, None] = None,
+                     masks: Union[Dict[str, Union[np.ndarray, None]], None] = None) -> 'TimeSeries':
+        '''
+        Builds a TimeSeries directly from column data.
+        Args:
+            dates [List[datetime.date, int]]: the time step dates.
+            columns [Dict[str, array like]]: the values for each named variable, missing values are marked with nan.
+            categories [Dict[str, Category]]: the Category of each named variable.
+            isoutput [Dict[str, array like]]: optional flags marking values computed by an Output, False by default.
+            outputs [Dict[int, Dict[str, Output]]]: optional outputs keyed by their time step index, or an OutputPlan (see schedule_outputs()) which is shared rather than copied.
+            storage_key [str]: optional name of the storage variable, by default it is found in the first time step.
+            masks [Dict[str, array like]]: optional flags marking the time steps in which a variable is present, by default variables are present in every time step.
+        Returns:
+            A TimeSeries.
+        '''
+        ts = cls.__new__(cls)
+        masks = {} if masks == None else masks
+        isoutput = {} if isoutput == None else isoutput
+        outputs = {} if outputs == None else outputs
+        ts._build(list(dates), {k: np.asarray(v) for k, v in columns.items()}, dict(categories),
+                  {k: np.asarray(isoutput[k], dtype=bool) if k in isoutput else np.zeros(len(dates), dtype=bool) for k in columns},
+                  {k: None if masks.get(k) is None else np.asarray(masks[k], dtype=bool) for k in columns}, outputs if isinstance(outputs, OutputPlan) else {i: TimeStep.sort_outputs(v) for i, v in outputs.items() if v}, storage_key)
+        return ts
+    def with_columns(self, columns: Dict[str, Any], categories: Dict[str, Category]) -> 'TimeSeries':
+        '''
+        Returns a TimeSeries with added (or replaced) variables, which shares the existing columns, outputs and calendar rather than copying them.
+        Args:
+            columns [Dict[str, array like]]: the values for each added variable.
+            categories [Dict[str, Category]]: the Category of each added variable.
+        Returns:
+            A TimeSeries.
+        '''
+        kept = [k for k in self._columns if k not in columns]
+        ts = TimeSeries.from_columns(self._dates, {k: self._columns[k] for k in kept} | columns, {k: self._categories[k] for k in kept} | categories,
+                                     {k: self._isoutput[k] for k in kept}, self._outputs, self.storage_key, {k: self._masks[k] for k in kept})
+        ts._calendar = self._calendar
+        return ts
+    def precompute_outputs(self, state: Iterable[str] = ()) -> 'TimeSeries':
+        '''
+        Computes the outputs that only read exogenous inputs (see Output.reads) for the full record, before a simulation loop.
+        Exogenous inputs are the variables that are present in every timestep, other than the storage variable and the state variables, as well as the values of precomputed outputs.
+        Pre operations outputs are added to the timestep in which they are computed and post operations outputs to the following timestep, as in the Simulation loop.
+        Args:
+            state [Iterable[str]]: the names of variables computed by the simulation (e.g. the reservoir outlet names).
+        Returns:
+            A TimeSeries with the precomputed values as variables and without the precomputed outputs, this timeseries if no outputs can be precomputed.
+        '''
+        state = set(state) | {self.storage_key}
+        exogenous = {k for k in self._columns if k not in state and self._masks[k] is None}
+        scheduled = self._scheduled_outputs()
+        n, precomputed, working = len(self), set(), self
+        columns, categories = dict(self._columns), dict(self._categories)
+        isoutput, masks = dict(self._isoutput), dict(self._masks)
+        for name, (output, rows) in scheduled.items():
+            if output == None or not output.isexogenous(exogenous):
+                continue
+            shift = 1 if output.runorder == RunOrder.POST_OPERATIONS else 0
+            rows = rows[rows + shift < n]
+            if output.vectorized != None:
+                computed = {k: np.asarray(v)[rows] for k, v in output.vectorized(working).items()}
+            else:
+                steps = working.timesteps
+                results = [output.fn(steps, r) for r in rows.tolist()]
+                computed = {k: to_column([x[k] for x in results]) for k in (results[0] if results else {})}
+            for k, v in computed.items():
+                exists = k in columns
+                column = np.array(columns[k], dtype=float) if exists else np.full(n, np.nan)
+                flags = np.array(isoutput[k]) if exists else np.zeros(n, dtype=bool)
+                present = (np.ones(n, dtype=bool) if masks[k] is None else np.array(masks[k])) if exists else np.zeros(n, dtype=bool)
+                column[rows + shift], flags[rows + shift], present[rows + shift] = v, True, True
+                columns[k], categories[k], isoutput[k], masks[k] = column, output.category, flags, None if present.all() else present
+                exogenous.add(k)
+            precomputed.add(name)
+            if computed:
+                # later outputs can read the precomputed values, so they are evaluated on a series that contains them.
+                working = TimeSeries.from_columns(self._dates, columns, categories, isoutput, None, self.storage_key, masks)
+                working._calendar = self._calendar
+        if not precomputed:
+            return self
+        if isinstance(self._outputs, OutputPlan):
+            outputs = self._outputs.without(precomputed)
+        else:
+            outputs = {row: {k: v for k, v in x.items() if k not in precomputed} for row, x in self._outputs.items()}
+        ts = TimeSeries.from_columns(self._dates, columns, categories, isoutput, outputs, self.storage_key, masks)
+        ts._calendar = self._calendar
+        return ts
+    def _scheduled_outputs(self) -> Dict[str, Tuple[Union[Output, None], np.ndarray]]:
+        '''Returns the output (None if it differs between rows) and the array of rows in which it is run for each output name.'''
+        if isinstance(self._outputs, OutputPlan):
+            return {name: (x.output, self._outputs.rows(name)) for name, x in self._outputs.schedule.items()}
+        rows: Dict[str, List[int]] = {}
+        for row in sorted(self._outputs):
+            for name in self._outputs[row]:
+                rows.setdefault(name, []).append(row)
+        scheduled = {}
+        for name, r in rows.items():
+            output = self._outputs[r[0]][name]
+            scheduled[name] = (None if any(self._outputs[i][name] != output for i in r) else output, np.array(r, dtype=int))
+        return scheduled
+    def __len__(self) -> int:
+        return len(self._dates)
+    def __getitem__(self, t: int) -> TimeStep:
+        return self.timesteps[t]
+    @property
+    def timesteps(self) -> Sequence[TimeStep]:
+        '''A read only list of TimeStep views over the rows of the timeseries.'''
+        return _TimeStepRows(self)
+    @property
+    def variables(self) -> List[str]:
+        '''The names of the timeseries variables.'''
+        return list(self._columns.keys())
+    def category(self, vname: str) -> Category:
+        '''Returns the Category of the named variable.'''
+        return self._categories[vname]
+    @property
+    def hasoutputs(self) -> bool:
+        '''True if any time step has outputs, False otherwise.'''
+        return bool(self._outputs)
+    def isoutput(self, vname: str) -> np.ndarray:
+        '''Returns an array of flags marking the values of the named variable that are computed by an Output.'''
+        return self._isoutput[vname]
+    def mask(self, vname: str) -> Union[np.ndarray, None]:
+        '''Returns an array of flags marking the time steps in which the named variable is present, or None if it is present in every time step.'''
+        return self._masks[vname]
+    def ispresent(self, vname: str, t: int) -> bool:
+        '''True if the named variable has a value at the time step index t, False otherwise.'''
+        if vname not in self._masks:
+            return False
+        mask = self._masks[vname]
+        return True if mask is None else bool(mask[t])
     def find_storage_key(self) -> str:
         '''Identifies the storage key for the time sereies. Note: only one storage key can be used across all the time steps in the time series.'''
-        storage_keys = [str(k) for k, v in self.timesteps[0].inputs.items() if v.category.name == Category.STORAGE.name]
+        storage_keys = [str(k) for k, v in self._categories.items() if v == Category.STORAGE and len(self) > 0 and self.ispresent(k, 0)]
         if len(storage_keys) == 1:
             return storage_keys[0]
         else:
             raise ValueError('A storage value is not provided in the first timestep to initialize storage, this results in an error.')
     def dates(self) -> List[Union[datetime.date, int]]:
         '''Returns a list of timeseries dates.'''
-        return [t.date for t in self.timesteps]
-    def input(self, vname: str) -> List[Input]:
-        '''Returns a list of Inputs with the specified variable name.'''
-        return [t.inputs[vname].value for t in self.timesteps]
-    def inflows(self) -> List[float]:
-        '''Returns a list of inflows summed by timestep.'''
-        return [sum([t.inputs[k].value for k in t.inputs.keys() if t.inputs[k].category.name == Category.INFLOW.name]) for t in self.timesteps]
-    def outflows(self) -> List[float]:
-        '''Returns a list of outflows summed by timestep.'''
-        return [sum([t.inputs[k].value for k in t.inputs.keys() if t.inputs[k].category.name == Category.OUTFLOW.name]) for t in self.timesteps]
-    def storage(self) -> List[float]: 
-        '''Returns a list of storage values by timestep.'''
-        return [sum([t.inputs[k].value for k in t.inputs.keys() if t.inputs[k].category.name == Category.STORAGE.name]) for t in self.timesteps]           
+        return self._dates
+    @property
+    def calendar(self) -> Calendar:
+        '''The water year calendar for the timeseries dates, built on first use (see Calendar.from_dates()).'''
+        if self._calendar is None:
+            self._calendar = Calendar.from_dates(self._dates)
+        return self._calendar
+    def input(self, vname: str) -> np.ndarray:
+        '''Returns an array of values for the specified variable name.'''
+        return self._columns[vname]
+    def total(self, category: Category) -> np.ndarray:
+        '''Returns an array of the values with the specified Category summed by timestep (the result is cached).'''
+        if category not in self._totals:
+            total = np.zeros(len(self))
+            for k, v in self._categories.items():
+                if v == category:
+                    mask = self._masks[k]
+                    total = total + (self._columns[k] if mask is None else np.where(mask, self._columns[k], 0))
+            self._totals[category] = total
+        return self._totals[category]
+    def inflows(self) -> np.ndarray:
+        '''Returns an array of inflows summed by timestep.'''
+        return self.total(Category.INFLOW)
+    def outflows(self) -> np.ndarray:
+        '''Returns an array of outflows summed by timestep.'''
+        return self.total(Category.OUTFLOW)
+    def storage(self) -> np.ndarray: 
+        '''Returns an array of storage values by timestep.'''
+        return self.total(Category.STORAGE)
     def plot(self, *args):
         outplots = len(args)
         fig, ax = plt.subplots(nrows=3 + outplots, ncols=1, sharex=True, figsize=(10, 10))
@@ -208,35 +551,195 @@ class TimeSeries:
         for i in range(3): ax[i].set_ylabel('volume')
         i: int = 1
         for name in args:
-            ax[i + 2].step(self.dates(), [self.timesteps[t].inputs[name].value for t in range(len(self.timesteps))], where='post', label=name)
+            ax[i + 2].step(self.dates(), self.input(name), where='post', label=name)
             ax[i + 2].set_ylabel(name)
             i += 1
         #plt.ylabel('volume')
         fig.legend(frameon=False)
     
     @staticmethod
-    def from_dataframe(df: pd.DataFrame, outputs: Union[List[Dict[str, Output]], None] = None):
-        if outputs != None and len(outputs) != len(df): raise ValueError('The inputs and request outputs are not of equal length generating an error')
-        t = 0
-        ts = []
-        for idx, row in df.iterrows():
-            inputs = {}
-            for name in df.columns:
-                cat: Category
-                if 'inflow' in name:
-                    cat = Category.INFLOW
-                elif 'outflow' in name:
-                    cat = Category.OUTFLOW
-                elif 'storage' in name:
-                    cat = Category.STORAGE
-                else: #has none of the above tags in the name
-                    cat = Category.OTHER
-                inputs[name] = Input(value=row[name], category=cat, isoutput=pd.isna(row[name]))
-            if outputs == None or outputs[t] == None:
-                ts.append(TimeStep(date=idx, inputs=inputs, outputs=None))
-            else:
-                ts.append(TimeStep(date=idx, inputs=inputs, outputs=outputs[t]))
-        return TimeSeries(ts)
+    def from_dataframe(df: pd.DataFrame, outputs: Union[List[Dict[str, Union[Output, None]]], Dict[str, Union[Output, List[Union[Output, None]]]], None] = None, copy: bool = True, storage_key: Union[str, None] = None) -> 'TimeSeries':
+        '''
+        Builds a TimeSeries from a DataFrame indexed by date, converting each column to an array in a single pass.
+        Args:
+            df [pd.DataFrame]: the input data, the Category of each column is assigned by its name (see category_from_name()). Missing (nan) values are marked as outputs.
+            outputs [List[Dict[str, Output]] or Dict[str, Output] or Dict[str, List[Output]]]: optional outputs (see schedule_outputs()).
+            copy [bool]: if False the columns share the DataFrame's column buffers wherever pandas allows it, so later changes to the DataFrame are seen by the TimeSeries. True by default.
+            storage_key [str]: optional name of the storage variable, used when the first row has no storage value (e.g. for chunks after the first in read_csv()). By default it is found in the first row.
+        Returns:
+            A TimeSeries.
+        '''
+        columns = {name: df[name].to_numpy(copy=copy) for name in df.columns}
+        ts = TimeSeries.__new__(TimeSeries)
+        ts._build(df.index.tolist(), columns, {name: category_from_name(name) for name in df.columns},
+                  {name: pd.isna(v) for name, v in columns.items()}, {name: None for name in df.columns}, schedule_outputs(outputs, len(df)), storage_key)
+        return ts
+def category_from_name(name: str) -> Category:
+    '''Assigns a Category to a variable based on the 'inflow', 'outflow' or 'storage' tags in its name, other variables are assigned Category.OTHER.'''
+    if 'inflow' in name:
+        return Category.INFLOW
+    elif 'outflow' in name:
+        return Category.OUTFLOW
+    elif 'storage' in name:
+        return Category.STORAGE
+    else: #has none of the above tags in the name
+        return Category.OTHER
+@dataclass(frozen=True)
+class Scheduled:
+    '''An Output that is run every period timesteps, starting at the offset timestep (see Output.every()).'''
+    output: Output
+    '''The scheduled output.'''
+    period: int = 1
+    '''The number of timesteps between runs of the output, 1 (every timestep) by default.'''
+    offset: int = 0
+    '''The index of the first timestep in which the output is run, 0 by default.'''
+    def __post_init__(self) -> None:
+        if self.period < 1 or self.offset < 0:
+            raise ValueError(f'The output period: {self.period} must be at least 1 and the offset: {self.offset} must be non-negative, causing an error.')
+    def isdue(self, row: int) -> bool:
+        '''True if the output is run in the timestep at the row index, False otherwise.'''
+        return row >= self.offset and (row - self.offset) % self.period == 0
+MAX_PLAN_CYCLE: int = 4096
+'''The longest cycle of rows (the least common multiple of the output periods) that an OutputPlan compiles when it is built, the plans for longer cycles are compiled as they are reached.'''
+class OutputPlan(Mapping):
+    '''
+    A read only Dict[int, Dict[str, Output]] compiled from a schedule that records each output once, with its period and offset (see Scheduled).
+    The outputs are sorted once when the plan is built. The sorted outputs due in a row are shared by every row in which the same outputs are due,
+    so no sorting happens during a simulation and the plan's memory grows with the cycle of output periods rather than the number of rows.
+    '''
+    __slots__ = ('_schedule', '_n', '_start', '_cycle', '_plans', '_len')
+    def __init__(self, schedule: Dict[str, Scheduled], n: int):
+        '''
+        Args:
+            schedule [Dict[str, Scheduled]]: the scheduled outputs (values) labeled by output name (key).
+            n [int]: the number of timesteps.
+        Returns:
+            None (instantiates an instance of the OutputPlan class)
+        '''
+        order = TimeStep.sort_outputs({k: v.output for k, v in schedule.items()})
+        self._schedule: Dict[str, Scheduled] = {k: schedule[k] for k in order}
+        self._n, self._len = n, None
+        self._plans: Dict[Tuple[str, ...], Dict[str, Output]] = {}
+        # after the last offset, the outputs due in each row repeat every lcm(periods) rows.
+        self._start = max((x.offset for x in schedule.values()), default=0)
+        cycle = math.lcm(*(x.period for x in schedule.values())) if schedule else 1
+        self._cycle = [self._plan(self._start + i) for i in range(cycle)] if cycle <= MAX_PLAN_CYCLE else None
+    def _plan(self, row: int) -> Union[Dict[str, Output], None]:
+        '''Returns the shared sorted outputs due in the row, None if no outputs are due.'''
+        key = tuple(k for k, x in self._schedule.items() if x.isdue(row))
+        if not key:
+            return None
+        plan = self._plans.get(key)
+        if plan == None:
+            plan = self._plans[key] = {k: self._schedule[k].output for k in key}
+        return plan
+    def _lookup(self, row: int) -> Union[Dict[str, Output], None]:
+        if not 0 <= row < self._n:
+            return None
+        if self._cycle == None or row < self._start:
+            return self._plan(row)
+        return self._cycle[(row - self._start) % len(self._cycle)]
+    def __getitem__(self, row: int) -> Dict[str, Output]:
+        plan = self._lookup(row)
+        if plan == None:
+            raise KeyError(row)
+        return plan
+    def __iter__(self) -> Iterator[int]:
+        return (row for row in range(self._n) if self._lookup(row) != None)
+    def __len__(self) -> int:
+        if self._len == None:
+            self._len = sum(1 for _ in self)
+        return self._len
+    def __bool__(self) -> bool:
+        return any(x.offset < self._n for x in self._schedule.values())
+    @property
+    def schedule(self) -> Dict[str, Scheduled]:
+        '''The scheduled outputs, in the order they are run.'''
+        return self._schedule
+    @property
+    def names(self) -> List[str]:
+        '''The output names, in the order they are run.'''
+        return list(self._schedule)
+    def rows(self, name: str) -> np.ndarray:
+        '''Returns the row indices in which the named output is run.'''
+        x = self._schedule[name]
+        return np.arange(x.offset, self._n, x.period)
+    def without(self, names: Iterable[str]) -> 'OutputPlan':
+        '''Returns a plan without the named outputs.'''
+        names = set(names)
+        return OutputPlan({k: v for k, v in self._schedule.items() if k not in names}, self._n)
+def schedule_outputs(outputs: Union[List[Dict[str, Union[Output, None]]], Dict[str, Union[Output, Scheduled, List[Union[Output, None]]]], None], n: int) -> Mapping:
+    '''
+    Converts outputs into the sorted outputs for each row of a TimeSeries with n rows, identical sets of outputs are sorted once and shared.
+    Args:
+        outputs: one of the following
+            Dict[str, Output or Scheduled]: outputs that are run on every timestep, or every period timesteps (see Output.every()), compiled into an OutputPlan.
+            Dict[str, List[Output]]: a list of n Output (or None) values for each output name (see Output.to_dict(values_list=True)).
+            List[Dict[str, Output]]: a list of n dictionaries of outputs, None values are ignored (see Output.to_dict()).
+        n [int]: the number of timesteps.
+    Returns:
+        A Dict[int, Dict[str, Output]] containing the sorted outputs for rows with outputs.
+    '''
+    if outputs == None:
+        return {}
+    if isinstance(outputs, dict):
+        if all(isinstance(v, (Output, Scheduled)) for v in outputs.values()):
+            return OutputPlan({k: v if isinstance(v, Scheduled) else Scheduled(v) for k, v in outputs.items()}, n)
+        rows = {}
+        for k, v in outputs.items():
+            if len(v) != n: raise ValueError(f'The {k} outputs list has {len(v)} items but the timeseries has {n} timesteps generating an error.')
+            for i in np.flatnonzero(np.not_equal(np.array(v, dtype=object), None)).tolist():
+                rows.setdefault(i, {})[k] = v[i]
+    else:
+        if len(outputs) != n: raise ValueError('The inputs and request outputs are not of equal length generating an error')
+        rows = {i: {k: v for k, v in d.items() if v != None} for i, d in enumerate(outputs) if d}
+    shared = {}
+    for i, d in rows.items():
+        if d:
+            key = tuple((k, id(v)) for k, v in d.items())
+            rows[i] = shared[key] if key in shared else shared.setdefault(key, TimeStep.sort_outputs(d))
+    return {i: d for i, d in rows.items() if d}
+def read_csv(path: str, chunksize: int = 10000, storage: Union[float, None] = None, outputs: Union[Dict[str, Output], None] = None,
+             parse: Union[Callable[[pd.DataFrame], pd.DataFrame], None] = None, **kwargs) -> Iterator['TimeSeries']:
+    '''
+    Reads a csv file of timestep data in chunks, so long records can be simulated without being held in memory (see Simulation.simulate_chunks()).
+    Args:
+        path [str]: path to the csv file, by default the first column is read as the date index (see kwargs).
+        chunksize [int]: the number of rows in each chunk, 10,000 by default.
+        storage [float]: optional initial storage, added as a 'storage' variable in the first row. Otherwise the file must contain a storage column with a value in its first row.
+        outputs [Dict[str, Output]]: optional outputs run on every timestep.
+        parse [Callable[[pd.DataFrame], pd.DataFrame]]: optional function applied to each chunk before it is converted (e.g. parse_usace_export()).
+        kwargs: passed to pandas.read_csv(), index_col=0, parse_dates=True and encoding='utf-8-sig' are used unless they are provided.
+    Returns:
+        A generator yielding a TimeSeries for each chunk. Column names are stripped and lower cased before categories are assigned (see category_from_name()).
+    '''
+    kwargs = {'index_col': 0, 'parse_dates': True, 'encoding': 'utf-8-sig'} | kwargs
+    storage_key: Union[str, None] = None
+    with pd.read_csv(path, chunksize=chunksize, **kwargs) as reader:
+        for df in reader:
+            df = parse(df) if parse != None else df
+            if len(df) == 0: continue
+            df.columns = [str(name).strip().lower() for name in df.columns]
+            if storage != None:
+                df['storage'] = np.nan
+                if storage_key == None: df.iloc[0, df.columns.get_loc('storage')] = storage
+            ts = TimeSeries.from_dataframe(df, outputs, copy=False, storage_key=storage_key)
+            storage_key = ts.storage_key
+            yield ts
+def parse_usace_export(df: pd.DataFrame, rename: Union[Dict[str, str], None] = None) -> pd.DataFrame:
+    '''
+    Parses a chunk of a USACE data export (e.g. dam_inflows.csv) read with: skiprows=[1, 2, 3], index_col=None, parse_dates=False and usecols limited to the 'Date / Time' column and value columns.
+    Args:
+        df [pd.DataFrame]: the raw chunk.
+        rename [Dict[str, str]]: optional new names for the value columns, keyed by their export names with spaces removed (e.g. {'WILSONDAMFLOW-INEXTENDED': 'inflow'}).
+    Returns:
+        A DataFrame indexed by date, rows with non-numeric values are dropped.
+    '''
+    df.columns = df.columns.str.replace(' ', '')
+    df = df.rename(columns={'Date/Time': 'date'} | ({} if rename == None else rename))
+    dates = pd.to_datetime(df['date'].astype(str).str.rsplit(',', n=1).str[0].to_numpy())
+    values = df.drop(columns=['date']).apply(pd.to_numeric, errors='coerce').set_axis(dates)
+    return values[values.notna().all(axis=1)]
 def inputs_dictionary_from_categoryname(inputs: List[Input]) -> Dict[str, Input]:
     '''Puts a list of inputs into a dictionary for a single timestep.'''
     result = {}
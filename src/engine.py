@@ -0,0 +1,240 @@
+#region Header
+# %% [markdown]
+# # Engine
+# This file provides an array based simulation engine for the built-in operations policies:
+# operations.passive_operations, operations.standard_operating_proceedures and operations.Rule_Curve.operate.
+# The storage recursion for these policies is plain arithmetic, so the whole horizon is run as a single loop
+# over preallocated arrays rather than through TimeStep objects. The results match Simulation.simulate().
+# Other policies that provide an operate_batch function (see operations.Operations) run one vectorized call per timestep.
+# simulate_ensemble() runs many inflow traces together, updating storage and releases as vectors across the ensemble members.
+#
+# Author: John Kucharski | Date: 16 October 2026
+#
+# Status: open
+# Testing: partial
+#endregion
+
+#region Dependencies
+#%%
+import sys
+import datetime
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Callable, Union
+
+import numpy as np
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.data import Category, Calendar, Input, TimeStep, TimeSeries, category_from_name
+from src.outlet import Outlet, OutletBank
+from src.reservoir import Reservoir
+import src.operations as operations
+#endregion
+
+#%%
+PASSIVE = 'passive'
+'''Identifies the operations.passive_operations() policy.'''
+STANDARD_OPERATING_PROCEEDURES = 'standard_operating_proceedures'
+'''Identifies the operations.standard_operating_proceedures() policy.'''
+RULE_CURVE = 'rule_curve'
+'''Identifies the operations.Rule_Curve.operate() policy.'''
+
+def policy(f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]]) -> Union[str, None]:
+    '''
+    Identifies built-in operations policies.
+    Args:
+        f_operations [Callable[[TimeStep, List[Outlet]], Dict[str, float]]]: the operations function passed to a Simulation.
+    Returns:
+        PASSIVE, STANDARD_OPERATING_PROCEEDURES or RULE_CURVE for built-in policies, None otherwise.
+    '''
+    if f_operations is operations.passive_operations:
+        return PASSIVE
+    if f_operations is operations.standard_operating_proceedures:
+        return STANDARD_OPERATING_PROCEEDURES
+    if isinstance(getattr(f_operations, '__self__', None), operations.Rule_Curve) and f_operations.__func__ is operations.Rule_Curve.operate:
+        return RULE_CURVE
+    return None
+
+def outlet_table(outlets: Union[OutletBank, List[Outlet]]) -> Union[OutletBank, None]:
+    '''
+    Finds the table of outlets used by the engine, sorted by location as they are in the built-in policies.
+    Args:
+        outlets [OutletBank or List[Outlet]]: the reservoir outlets, typically Reservoir.outlet_bank.
+    Returns:
+        The outlets as an OutletBank if each outlet uses the default Outlet.release_above_location() max release function or a RatingTable, None otherwise.
+    '''
+    bank = outlets if isinstance(outlets, OutletBank) else OutletBank(outlets)
+    return bank if bank.istabulated else None
+
+def supports(timeseries: TimeSeries, reservoir: Reservoir, f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]]) -> bool:
+    '''
+    True if the simulation can be run by the array engine, False otherwise.
+    This requires either a built-in operations policy or a policy with an operate_batch function (see operations.batch_operations()), outlet names that are not timeseries variables,
+    timesteps without outputs, and (for the Rule_Curve policy) dated timesteps.
+    '''
+    name = policy(f_operations)
+    if name == None and operations.batch_operations(f_operations) == None or timeseries.hasoutputs:
+        return False
+    if any(x.name in timeseries.variables for x in reservoir.outlet_bank):
+        return False
+    if name == STANDARD_OPERATING_PROCEEDURES and not all(k in timeseries.variables and timeseries.mask(k) is None for k in ['demand', 'capacity']):
+        return False
+    if name == RULE_CURVE and not all(isinstance(d, datetime.date) for d in timeseries.dates()):
+        return False
+    return True
+
+def simulate(timeseries: TimeSeries, reservoir: Reservoir, f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]]) -> TimeSeries:
+    '''
+    Simulates an operations policy with preallocated arrays.
+    Built-in policies with table based outlets (see outlet_table()) run as a loop over floats, other policies run one operate_batch() call per timestep (see operations.batch_operations()).
+    Args:
+        timeseries [TimeSeries]: the simulation inputs, which must not contain outputs (see supports()).
+        reservoir [Reservoir]: the reservoir.
+        f_operations [Callable]: operations.passive_operations, operations.standard_operating_proceedures, a Rule_Curve.operate method, or a policy with an operate_batch function.
+    Returns:
+        A TimeSeries containing the same values as Simulation.simulate().
+    '''
+    if not supports(timeseries, reservoir, f_operations):
+        raise ValueError('The simulation uses an operations policy, outlets or outputs that are not supported by the array engine, causing an error.')
+    name, outlets, n = policy(f_operations), outlet_table(reservoir.outlet_bank), len(timeseries)
+    if name == None or outlets == None:
+        key = timeseries.storage_key
+        dated = all(isinstance(d, datetime.date) for d in timeseries.dates())
+        inputs = {k: timeseries.input(k)[np.newaxis] for k in timeseries.variables if k != key}
+        storages, releases = _simulate_batch(operations.batch_operations(f_operations), reservoir.outlet_bank, timeseries.inflows()[np.newaxis], timeseries.outflows()[np.newaxis],
+                                             timeseries.storage()[:1], inputs, timeseries.calendar.dowy if dated else None)
+        return _results(timeseries, storages[0], {k: v[0] for k, v in releases.items()})
+    inflows, outflows = timeseries.inflows().tolist(), timeseries.outflows().tolist()
+    locations, curves = outlets.locations.tolist(), outlets.ratings
+    releases = np.zeros((len(outlets), n))
+    storages = np.empty(n)
+    if name == PASSIVE:
+        storage = timeseries.storage().item(0)
+        for t in range(n):
+            storages[t] = storage
+            available, total = inflows[t] + storage - outflows[t], outflows[t]
+            for i, (location, curve) in enumerate(zip(locations, curves)):
+                release = (available - location if available > location else 0) if curve is None else curve(available)
+                releases[i, t] = release
+                available, total = available - release, total + release
+            storage = inflows[t] + storage - total
+    else:
+        if name == STANDARD_OPERATING_PROCEEDURES:
+            demands, capacities = timeseries.input('demand').tolist(), timeseries.input('capacity').tolist()
+        else:
+            targets = f_operations.__self__.target_volumes(timeseries.calendar.dowy).tolist()
+        storage = timeseries.storage().item(0)
+        for t in range(n):
+            storages[t] = storage
+            available, total = inflows[t] + storage - outflows[t], outflows[t]
+            if name == STANDARD_OPERATING_PROCEEDURES:
+                demand, capacity = demands[t], capacities[t]
+                target = max(demand, available - capacity) if capacity < available else min(available, demand)
+            else:
+                target = available - targets[t]
+            for i, (location, curve) in enumerate(zip(locations, curves)):
+                if target > 0 and (name == STANDARD_OPERATING_PROCEEDURES or available > 0):
+                    release = min(target, (available - location if available > location else 0) if curve is None else curve(available))
+                    releases[i, t] = release
+                    available, target, total = available - release, target - release, total + release
+            storage = inflows[t] + storage - total
+    return _results(timeseries, storages, {x.name: releases[i] for i, x in enumerate(outlets)})
+
+def _results(timeseries: TimeSeries, storages: np.ndarray, releases: Dict[str, np.ndarray]) -> TimeSeries:
+    '''Combines the simulation inputs, computed storage and outlet releases into a TimeSeries of results.'''
+    key = timeseries.storage_key
+    columns = {k: timeseries.input(k) for k in timeseries.variables}
+    categories = {k: timeseries.category(k) for k in timeseries.variables}
+    isoutput = {k: timeseries.isoutput(k) for k in timeseries.variables}
+    masks = {k: timeseries.mask(k) for k in timeseries.variables if k != key}
+    storage = np.array(timeseries.input(key), dtype=float)
+    storage[1:] = storages[1:]
+    columns[key], isoutput[key] = storage, np.concatenate([timeseries.isoutput(key)[:1], np.ones(len(storage) - 1, dtype=bool)])
+    for k, v in releases.items():
+        columns[k], categories[k], isoutput[k] = v, Category.OUTFLOW, np.ones(len(v), dtype=bool)
+    return TimeSeries.from_columns(timeseries.dates(), columns, categories, isoutput, masks=masks)
+
+#%%
+@dataclass
+class Ensemble:
+    '''Ensemble simulation results, each array has one row per ensemble member and one column per timestep.'''
+    dates: List[Union[datetime.date, int]]
+    '''The timestep dates.'''
+    storage: np.ndarray
+    '''The storage at the start of each timestep.'''
+    releases: np.ndarray
+    '''The total release returned by the operations policy (the sum of the releases in outlets).'''
+    outlets: Dict[str, np.ndarray]
+    '''The release from each outlet, labeled with the Outlet.name (and any other release names returned by the operations policy).'''
+
+def simulate_ensemble(reservoir: Reservoir, f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]], inflows: np.ndarray, storage: Union[float, np.ndarray],
+                      dates: Union[List[Union[datetime.date, int]], None] = None, inputs: Union[Dict[str, np.ndarray], None] = None) -> Ensemble:
+    '''
+    Simulates the same reservoir and operations policy over many inflow traces, advancing all of the ensemble members together in a single timestep loop.
+    Args:
+        reservoir [Reservoir]: the reservoir.
+        f_operations [Callable[[TimeStep, List[Outlet]], Dict[str, float]]]: the operations policy. Policies with an operate_batch function (see operations.batch_operations()) are updated as vectors,
+            other policies are called once per member in each timestep.
+        inflows [np.ndarray]: an inflow matrix with one row per trace and one column per timestep.
+        storage [float or np.ndarray]: the initial storage, either shared by all members or one value per member.
+        dates [List[datetime.date or int]]: optional timestep dates, required by the Rule_Curve policy. The timestep index by default.
+        inputs [Dict[str, np.ndarray]]: optional additional inputs (e.g. 'demand' and 'capacity' for the standard operating proceedures policy), with one value per timestep or one row per member.
+            Categories are assigned by name (see data.category_from_name()).
+    Returns:
+        An Ensemble of storage and release arrays.
+    '''
+    inflows = np.atleast_2d(np.asarray(inflows, dtype=float))
+    m, n = inflows.shape
+    dates = list(range(n)) if dates == None else list(dates)
+    inputs = {k: np.broadcast_to(np.asarray(v), (m, n)) for k, v in ({} if inputs == None else inputs).items()}
+    categories = {k: category_from_name(k) for k in inputs}
+    exogenous = {c: sum((v.astype(float) for k, v in inputs.items() if categories[k] == c), np.zeros((m, n))) for c in (Category.INFLOW, Category.OUTFLOW)}
+    totalinflows, outflows = inflows + exogenous[Category.INFLOW], exogenous[Category.OUTFLOW]
+    s = np.broadcast_to(np.asarray(storage, dtype=float), (m,)).copy()
+    f_batch, outlets = operations.batch_operations(f_operations), reservoir.outlet_bank
+    if f_batch != None:
+        dowy = Calendar.from_dates(dates).dowy if all(isinstance(d, datetime.date) for d in dates) else None
+        storages, releases = _simulate_batch(f_batch, outlets, totalinflows, outflows, s, inputs, dowy)
+        return Ensemble(dates, storages, sum(releases.values(), np.zeros((m, n))), releases)
+    storages, releases = np.empty((m, n)), {x.name: np.zeros((m, n)) for x in outlets}
+    for t in range(n):
+        storages[:, t] = s
+        total = outflows[:, t].copy()
+        for i in range(m):
+            step = TimeStep(dates[t], inputs={'inflow': Input(inflows[i, t]), 'storage': Input(s[i], category=Category.STORAGE)} |
+                            {k: Input(v[i, t], category=categories[k]) for k, v in inputs.items()})
+            for k, v in f_operations(step, outlets).items():
+                if k not in releases: # policies can release through names that are not outlets, as in Simulation.operate().
+                    releases[k] = np.zeros((m, n))
+                releases[k][i, t] = v
+                total[i] += v
+        s = totalinflows[:, t] + s - total
+    return Ensemble(dates, storages, sum(releases.values(), np.zeros((m, n))), releases)
+
+def _simulate_batch(f_batch: Callable[[Dict[str, np.ndarray], OutletBank], Dict[str, np.ndarray]], outlets: OutletBank, inflows: np.ndarray, outflows: np.ndarray, storage: np.ndarray,
+                    inputs: Dict[str, np.ndarray], dowy: Union[np.ndarray, None]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    '''
+    Runs the storage recursion for many states at once with an operate_batch function (see operations.Operations.operate_batch()).
+    Args:
+        inflows, outflows [np.ndarray]: the total inflows and (exogenous) outflows, with one row per state and one column per timestep.
+        storage [np.ndarray]: the initial storage of each state.
+        inputs [Dict[str, np.ndarray]]: the named inputs passed to f_batch, with the same shape as the inflows.
+        dowy [np.ndarray]: the day of the water year for each timestep, None for undated timesteps.
+    Returns:
+        The storage at the start of each timestep, and the release from each outlet (and any other release names returned by f_batch), with one row per state.
+    '''
+    m, n = inflows.shape
+    storages, releases = np.empty((m, n)), {x.name: np.zeros((m, n)) for x in outlets}
+    s = storage.copy()
+    for t in range(n):
+        storages[:, t] = s
+        states = {k: v[:, t] for k, v in inputs.items()} | {'inflow': inflows[:, t], 'outflow': outflows[:, t], 'storage': s}
+        if dowy is not None:
+            states['dowy'] = dowy[t]
+        total = outflows[:, t]
+        for k, v in f_batch(states, outlets).items():
+            if k not in releases: # policies can release through names that are not outlets, as in Simulation.operate().
+                releases[k] = np.zeros((m, n))
+            releases[k][:, t] = v
+            total = total + v
+        s = inflows[:, t] + s - total
+    return storages, releases
@@ -1,15 +1,211 @@
+#region Header
+# %% [markdown]
+# # Node
+# This file simulates networks of reservoirs (e.g. cascades), in which the releases from upstream reservoirs flow into downstream reservoirs.
+# The network is a directed acyclic graph of (reservoir, operations) nodes, which is put in topological order once.
+# Because no reservoir's releases can flow back upstream, each reservoir is simulated over the full horizon in that order (with the array engine where possible, see Simulation.simulate()),
+# which gives the same results as advancing every reservoir one timestep at a time.
+# The releases routed into each reservoir are summed in a preallocated array, which is added to its timeseries as the 'upstream' inflow.
+# Releases can be lagged and attenuated on their way downstream by a channel reach (see routing.py) on the edge, which routes the full release array at once.
+# The graph is also split into branches: chains of reservoirs that release only into the next reservoir in the chain. Branches that do not depend on each other (e.g. separate tributaries)
+# can be simulated at the same time on worker processes (see Network.simulate_parallel()), their releases are joined at the confluence reservoirs that start the downstream branches.
+# Nodes are pickled and sent to the workers, so their operations policies and timeseries must be picklable (see scenarios.py).
+#
+# Author: John Kucharski | Date: 16 October 2026
+#
+# Status: open
+# Testing: partial
+#endregion
+
+#region Dependencies
+#%%
 import sys
-sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
-from simulation import Simulation
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Callable, Union
 
+import numpy as np
 import networkx as nx
 
-G = nx.Graph()
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.data import Category, TimeStep, TimeSeries
+from src.outlet import Outlet
+from src.reservoir import Reservoir
+from src.simulation import Simulation
+from src.routing import Reach
+#endregion
+
+#%%
+UPSTREAM = 'upstream'
+'''The name of the inflow variable holding the releases routed into a reservoir from upstream reservoirs.'''
 
+@dataclass
 class Node:
-    def __init__(self, sim: Simulation):
-        self._name = sim.reservoir.name
-        self._node = G.add(sim)
+    '''A reservoir in a network.'''
+    name: str
+    '''Labels the node, the names must be unique within a network.'''
+    reservoir: Reservoir
+    '''The reservoir.'''
+    f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]]
+    '''The reservoir operations policy.'''
+    timeseries: TimeSeries
+    '''The local inputs (e.g. local inflows and the initial storage), which must not contain the 'upstream' variable.'''
+
+class Network:
+    '''
+    A directed acyclic graph of reservoirs, connected by edges from upstream to downstream reservoirs.
+    '''
+    def __init__(self, nodes: List[Node], edges: List[Union[Tuple[str, str], Tuple[str, str, float]]], reaches: Union[Dict[Tuple[str, str], Reach], None] = None) -> None:
+        '''
+        Args:
+            nodes [List[Node]]: the reservoirs.
+            edges [List[Tuple[str, str]] or List[Tuple[str, str, float]]]: (upstream, downstream) node name pairs, with an optional fraction of the upstream releases routed along the edge (1 by default).
+                The fractions leaving a node must not sum to more than 1, the remainder leaves the network.
+            reaches [Dict[Tuple[str, str], Reach]]: optional channel reaches (e.g. routing.Muskingum) keyed by their (upstream, downstream) edge, releases along other edges arrive in the same timestep.
+        Returns:
+            None (instantiates an instance of the Network class)
+        '''
+        graph = nx.DiGraph()
+        for node in nodes:
+            if node.name in graph:
+                raise ValueError(f'The node name: {node.name} is not unique, causing an error.')
+            if UPSTREAM in node.timeseries.variables:
+                raise ValueError(f'The node: {node.name} timeseries contains the reserved {UPSTREAM} variable, causing an error.')
+            graph.add_node(node.name, node=node)
+        for edge in edges:
+            upstream, downstream, fraction = edge if len(edge) == 3 else (*edge, 1.0)
+            missing = [x for x in (upstream, downstream) if x not in graph]
+            if missing:
+                raise ValueError(f'The edge: {edge} connects the nodes: {missing} which are not in the network, causing an error.')
+            graph.add_edge(upstream, downstream, fraction=float(fraction), reach=None)
+        for edge, reach in ({} if reaches == None else reaches).items():
+            if edge not in graph.edges:
+                raise ValueError(f'The reach on the edge: {edge} is not on an edge in the network, causing an error.')
+            graph.edges[edge]['reach'] = reach
+        if not nx.is_directed_acyclic_graph(graph):
+            raise ValueError(f'The network contains the cycle: {nx.find_cycle(graph)}, causing an error.')
+        for name in graph:
+            if sum(f for _, _, f in graph.out_edges(name, data='fraction')) > 1 + 1e-9:
+                raise ValueError(f'The fractions of the releases routed from the node: {name} sum to more than 1, causing an error.')
+        lengths = {len(node.timeseries) for node in nodes}
+        if len(lengths) > 1:
+            raise ValueError(f'The node timeseries have different lengths: {sorted(lengths)}, causing an error.')
+        self._graph = graph
+        self._schedule: List[str] = list(nx.topological_sort(graph))
+        self._branches: List[List[str]] = []
+        index: Dict[str, int] = {}
+        for name in self._schedule:
+            upstream = list(graph.predecessors(name))
+            if len(upstream) == 1 and graph.out_degree(upstream[0]) == 1:
+                index[name] = index[upstream[0]]
+                self._branches[index[name]].append(name)
+            else:
+                index[name] = len(self._branches)
+                self._branches.append([name])
+        self._branch_index = index
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        '''The network graph, each node stores its Node under the 'node' attribute and each edge stores its 'fraction' and 'reach' (None for no routing).'''
+        return self._graph
+    @property
+    def schedule(self) -> List[str]:
+        '''The node names in topological order (i.e. each node is listed after every node upstream of it).'''
+        return self._schedule
+    @property
+    def branches(self) -> List[List[str]]:
+        '''
+        The network split into chains of nodes, in which each node (except the last) routes releases only into the next node and each node (except the first) receives releases only from the previous node.
+        Branches are listed in topological order, a branch can be simulated once every branch upstream of its first node has been simulated.
+        '''
+        return self._branches
+    def node(self, name: str) -> Node:
+        return self._graph.nodes[name]['node']
+    def upstream(self, name: str) -> List[str]:
+        '''The names of the nodes that route releases directly into the named node.'''
+        return list(self._graph.predecessors(name))
+    def downstream(self, name: str) -> List[Tuple[str, float]]:
+        '''The (name, fraction) pairs of the nodes that the named node routes releases directly into.'''
+        return [(v, f) for _, v, f in self._graph.out_edges(name, data='fraction')]
+    def reach(self, upstream: str, downstream: str) -> Union[Reach, None]:
+        '''The channel reach between two nodes, None if releases arrive without routing.'''
+        return self._graph.edges[upstream, downstream]['reach']
+
+    def simulate(self) -> Dict[str, TimeSeries]:
+        '''
+        Simulates every reservoir in the network, one branch at a time.
+        Returns:
+            A Dict[str, TimeSeries] with the simulation results (values) labeled by node name (key). Nodes with upstream reservoirs have an 'upstream' inflow variable.
+        '''
+        routed, results = self._routed(), {}
+        for branch in self._branches:
+            results |= simulate_branch(*self._branch_arguments(branch, routed))
+            self._route(branch, results, routed)
+        return results
+    def simulate_parallel(self, max_workers: Union[int, None] = None) -> Dict[str, TimeSeries]:
+        '''
+        Simulates every reservoir in the network, running independent branches (see branches) at the same time on a pool of worker processes.
+        Args:
+            max_workers [int]: the number of worker processes, by default the number of processors on the machine.
+        Returns:
+            The same results as simulate().
+        '''
+        routed, results = self._routed(), {}
+        waiting = {i: len({self._branch_index[u] for u in self._graph.predecessors(branch[0])}) for i, branch in enumerate(self._branches)}
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            def submit(i: int) -> None:
+                futures[pool.submit(simulate_branch, *self._branch_arguments(self._branches[i], routed))] = i
+            futures = {}
+            for i in [i for i, n in waiting.items() if n == 0]:
+                submit(i)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    branch = self._branches[futures.pop(future)]
+                    results |= future.result()
+                    self._route(branch, results, routed)
+                    for i in {self._branch_index[v] for v, _ in self.downstream(branch[-1])}:
+                        waiting[i] -= 1
+                        if waiting[i] == 0:
+                            submit(i)
+        return results
+    def _routed(self) -> Dict[str, np.ndarray]:
+        '''Preallocates the arrays summing the releases routed into the first node of each branch with upstream nodes.'''
+        n = len(self.node(self._schedule[0]).timeseries) if self._schedule else 0
+        return {branch[0]: np.zeros(n) for branch in self._branches if self._graph.in_degree(branch[0]) > 0}
+    def _branch_arguments(self, branch: List[str], routed: Dict[str, np.ndarray]) -> Tuple[List[Node], Union[np.ndarray, None], List[float], List[Union[Reach, None]]]:
+        edges = [self._graph.edges[u, v] for u, v in zip(branch[:-1], branch[1:])]
+        return [self.node(name) for name in branch], routed.get(branch[0]), [e['fraction'] for e in edges], [e['reach'] for e in edges]
+    def _route(self, branch: List[str], results: Dict[str, TimeSeries], routed: Dict[str, np.ndarray]) -> None:
+        '''Adds the releases from the last node in a simulated branch to the downstream branches.'''
+        downstream = self.downstream(branch[-1])
+        if downstream:
+            releases = releases_from(results[branch[-1]], self.node(branch[-1]).reservoir)
+            for v, fraction in downstream:
+                reach = self.reach(branch[-1], v)
+                routed[v] += fraction * (releases if reach == None else reach.route(releases))
+
+def simulate_branch(nodes: List[Node], upstream: Union[np.ndarray, None], fractions: List[float], reaches: Union[List[Union[Reach, None]], None] = None) -> Dict[str, TimeSeries]:
+    '''
+    Simulates a chain of reservoirs (see Network.branches), this is a module level function so it can be run on worker processes.
+    Args:
+        nodes [List[Node]]: the reservoirs, from upstream to downstream.
+        upstream [np.ndarray]: the releases routed into the first reservoir, None if it has no upstream reservoirs.
+        fractions [List[float]]: the fraction of each reservoir's releases routed into the next reservoir.
+        reaches [List[Reach]]: the channel reach between each reservoir and the next reservoir, None (or a list of None) for no routing.
+    Returns:
+        A Dict[str, TimeSeries] with the simulation results (values) labeled by node name (key).
+    '''
+    results = {}
+    for i, node in enumerate(nodes):
+        timeseries = node.timeseries if upstream is None else node.timeseries.with_columns({UPSTREAM: upstream}, {UPSTREAM: Category.INFLOW})
+        results[node.name] = Simulation(timeseries, node.reservoir, node.f_operations).simulate()
+        if i < len(fractions):
+            releases = releases_from(results[node.name], node.reservoir)
+            reach = None if reaches == None else reaches[i]
+            upstream = fractions[i] * (releases if reach == None else reach.route(releases))
+    return results
 
-print(G)
-print(G.nodes)
\ No newline at end of file
+def releases_from(result: TimeSeries, reservoir: Reservoir) -> np.ndarray:
+    '''Sums the releases from the reservoir outlets in a simulation result, outlets the operations policy never released through are counted as zero.'''
+    return sum((np.asarray(result.input(x.name), dtype=float) for x in reservoir.outlet_bank if x.name in result.variables), np.zeros(len(result)))
@@ -13,8 +13,9 @@
 #region Dependencies
 #%%
 import sys
+import bisect
 from enum import Enum
-from typing import List, Dict, Tuple, Callable, Any, Protocol
+from typing import List, Dict, Tuple, Callable, Any, Protocol, Union
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
 
@@ -24,7 +25,8 @@ import numpy as np
 
 sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
 from src.data import Input, Category, TimeStep
-from src.outlet import Outlet
+from src.outlet import Outlet, OutletBank, by_location
+from src.reservoir import Zones
 import src.utilities as utilities
 #endregion
 
@@ -51,6 +53,24 @@ class Operations(Protocol):
         Returns:
             A Dict[str, float] with reservoir releases (values) labeled with the Outlet.name from which they are made (key).
         '''
+    def operate_batch(states: Dict[str, np.ndarray], outlets: OutletBank) -> Dict[str, np.ndarray]:
+        '''
+        An optional function that makes the same releases as operate() for many reservoir states at once (e.g. ensemble members), used by the array engine (see engine.simulate()) when it is available.
+        
+        Args:
+            states [Dict[str, np.ndarray]]: arrays with one value per state. These contain the 'inflow', 'outflow' and 'storage' totals, each named input variable, 
+                and the day of the water year: 'dowy' (for dated timesteps).
+            outlets [OutletBank]: outlets from which releases are made.
+        Returns:
+            A Dict[str, np.ndarray] with reservoir releases (values) labeled with the Outlet.name from which they are made (key).
+        '''
+
+def batch_operations(f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]]) -> Union[Callable[[Dict[str, np.ndarray], OutletBank], Dict[str, np.ndarray]], None]:
+    '''Finds the operate_batch function for an operations function (an operate_batch attribute) or a bound operate method (the object's operate_batch method), None if there is none.'''
+    f = getattr(f_operations, 'operate_batch', None)
+    if f is None and getattr(f_operations, '__name__', None) == 'operate':
+        f = getattr(getattr(f_operations, '__self__', None), 'operate_batch', None)
+    return f
 
 class Rule_Curve:
     '''
@@ -77,6 +97,7 @@ class Rule_Curve:
         self._days = [i for i, _ in self.day_of_water_year_target_pairs]
         self._targets = [ j for _, j in self.day_of_water_year_target_pairs]
         self._is_valid, self._messages = self.__validate_rules()
+        self._table = np.array([self.__interpolate(dowy) for dowy in range(self.end_of_water_year + 1)], dtype=float)
     
     def __validate_rules(self) -> Tuple[bool, List[str]]:
         is_valid, errors = True, []
@@ -114,6 +135,11 @@ class Rule_Curve:
         '''The integer end of the water year value of 365 or 366.'''
         return self._end_of_water_year
     
+    @property
+    def table(self) -> np.ndarray:
+        '''The target volumes for each day of the water year, indexed by day of the water year (with the target for day 0 at the start of the array), precomputed at construction.'''
+        return self._table
+    
     def target_volume(self, dowy: int) -> float:
         ''' Computes the target_volume for a given day of the water year. 
         Args:
@@ -121,27 +147,43 @@ class Rule_Curve:
         Returns:
             (float): A target volume.
         '''
-        is_valid, error = utilities.is_on_range(dowy, 0, self.end_of_water_year)
-        if not is_valid:
-            raise error
-        else:
-            n = len(self.day_of_water_year_target_pairs)
-            last_day, last_target = self.days[-1], self.targets[-1]
-            first_day, first_target = self.days[0], self.targets[0]
-            if dowy < first_day: # interpolate_from_previous_water_year
-                dowy = self.end_of_water_year - last_day + dowy
-                xs, ys = [0, self.end_of_water_year - last_day + first_day], [last_target, first_target]
-            elif dowy > last_day: #interpolate_to_next_water_year
-                dowy = dowy - last_day
-                xs, ys = [0, self.end_of_water_year - last_day + first_day], [last_target, first_target]
-            else: #interpolate between rules
-                for i in range(n):           
-                    if dowy == self.days[i]:
-                        return self.targets[i]
-                    if dowy < self.days[i]:
-                        xs, ys = [self.days[i - 1], self.days[i]], [self.targets[i - 1], self.targets[i]]
-                        break
-            return self._interpolator(dowy, xs, ys)
+        if not 0 <= dowy <= self.end_of_water_year:
+            raise utilities.InputOutOfRangeError(dowy, (0, self.end_of_water_year), '', '')
+        if dowy == int(dowy):
+            return self._table.item(int(dowy))
+        return self.__interpolate(dowy)
+    def target_volumes(self, dowys: np.ndarray) -> np.ndarray:
+        '''
+        Looks up the target volumes for an array of days of the water year.
+        Args:
+            dowys (np.ndarray): integer days of the water year.
+        Returns:
+            (np.ndarray): the target volumes.
+        '''
+        dowys = np.asarray(dowys, dtype=int)
+        if dowys.size and (dowys.min() < 0 or dowys.max() > self.end_of_water_year):
+            x = dowys[(dowys < 0) | (dowys > self.end_of_water_year)][0]
+            raise utilities.InputOutOfRangeError(x, (0, self.end_of_water_year), 'dowys', 'Rule_Curve.target_volumes()')
+        return self._table[dowys]
+    def __interpolate(self, dowy: float) -> float:
+        '''Interpolates the target volume for a day of the water year from the rules, used to build the table.'''
+        n = len(self.day_of_water_year_target_pairs)
+        last_day, last_target = self.days[-1], self.targets[-1]
+        first_day, first_target = self.days[0], self.targets[0]
+        if dowy < first_day: # interpolate_from_previous_water_year
+            dowy = self.end_of_water_year - last_day + dowy
+            xs, ys = [0, self.end_of_water_year - last_day + first_day], [last_target, first_target]
+        elif dowy > last_day: #interpolate_to_next_water_year
+            dowy = dowy - last_day
+            xs, ys = [0, self.end_of_water_year - last_day + first_day], [last_target, first_target]
+        else: #interpolate between rules
+            for i in range(n):           
+                if dowy == self.days[i]:
+                    return self.targets[i]
+                if dowy < self.days[i]:
+                    xs, ys = [self.days[i - 1], self.days[i]], [self.targets[i - 1], self.targets[i]]
+                    break
+        return self._interpolator(dowy, xs, ys)
     def operate(self, t: TimeStep, outlets: List[Outlet]) -> Dict[str, float]:
         '''
         Makes release to achieve a target elevation based on the input storage and inflow, subject to constraints posed by the outlets.
@@ -154,19 +196,37 @@ class Rule_Curve:
         ''' 
         # TODO: #8 Test Rule_Cuve.operate() function
         releases = {}
-        outlets.sort(key=lambda x: x.location)
-        dowy: int = utilities.datetime_to_dowy(input.date)
+        dowy: int = t.calendar.dowy
         release = 0
         storage = t.inflows() + t.storage() - t.outflows()
         target_release: float = storage - self.target_volume(dowy) 
-        for outlet in outlets:
+        for outlet in by_location(outlets):
             if target_release > 0 and storage > 0:
-                release = min(target_release, outlet.max_release)
+                release = min(target_release, outlet.max_release(storage))
                 releases[outlet.name] = release
-                storage = storage - release
+                storage, target_release = storage - release, target_release - release
             else:
                 releases[outlet.name] = 0
         return releases
+    def operate_batch(self, states: Dict[str, np.ndarray], outlets: OutletBank) -> Dict[str, np.ndarray]:
+        '''
+        Makes the operate() releases for many states at once.
+        
+        Args:
+            states [Dict[str, np.ndarray]]: the 'inflow', 'outflow', 'storage' and 'dowy' arrays.
+            outlets [OutletBank]: outlets from which releases are made.
+        Returns:
+            A Dict[str, np.ndarray] with releases (values) labeled according the Outlet.name from which they are made.
+        '''
+        releases = {}
+        storage = states['inflow'] + states['storage'] - states['outflow']
+        target_release = storage - self.target_volumes(states['dowy'])
+        for i, outlet in enumerate(outlets):
+            isreleased = (target_release > 0) & (storage > 0)
+            release = np.where(isreleased, np.minimum(target_release, outlets.max_release(i, storage)), 0.0)
+            releases[outlet.name] = release
+            storage, target_release = storage - release, target_release - release
+        return releases
 
 @dataclass
 class Rules(ABC):
@@ -186,6 +246,168 @@ class Rules(ABC):
     @abstractmethod
     def operate(self, t: TimeStep, outlets: List[Outlet]) -> Dict[str, float]:
         pass
+
+class Zone_Rules(Rules):
+    '''
+    A Rules class that dispatches to the rule for the zone containing the available volume (storage + inflows - outflows), using precomputed zone boundaries.
+    '''
+    def __init__(self, zones: Zones, rules: Dict[Any, Callable[[TimeStep, List[Outlet]], Dict[str, float]]]):
+        '''
+        Args:
+            zones [Zones]: the reservoir zones, typically Reservoir.zones.
+            rules [Dict[Any, Callable[[TimeStep, List[Outlet]], Dict[str, float]]]]: the operations rule for each zone (e.g. keyed by the Zone enumeration).
+        '''
+        missing = [z for z in zones.zones if z not in rules]
+        if missing:
+            raise ValueError(f'The zones: {missing} have no rules, causing an error.')
+        super().__init__([rules[z] for z in zones.zones])
+        self._zones = zones
+    
+    @property
+    def zones(self) -> Zones:
+        return self._zones
+    def operate(self, t: TimeStep, outlets: List[Outlet]) -> Dict[str, float]:
+        '''Calls the rule for the zone containing the available volume.'''
+        return self.rules[self._zones.index(t.inflows() + t.storage() - t.outflows())](t, outlets)
+
+WATER_YEAR_START = datetime.date(1999, 10, 1)
+'''The first day of a leap water year, used to date the timesteps sampled by Tabulated_Operations so every day of the water year (1 - 366) has a date.'''
+
+class Tabulated_Operations:
+    '''
+    Caches the releases of an expensive operations function, sampled once on a grid of available volumes (storage + inflows - outflows) and days of the water year.
+    Releases are then linearly interpolated between the sampled volumes, for the sampled day. Volumes outside the grid and days that were not sampled are passed to the exact operations function.
+    NOTE: the cache is only valid for operations that are a function of the available volume and day of the water year, made through the outlets used to build it.
+    '''
+    def __init__(self, f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]], outlets: List[Outlet], volumes: List[float],
+                 dowys: Union[List[int], None] = range(1, 366), inputs: Union[Dict[str, Input], None] = None, tolerance: Union[float, None] = None) -> None:
+        '''
+        Args:
+            f_operations [Callable[[TimeStep, List[Outlet]], Dict[str, float]]]: the exact operations function (e.g. Zone_Rules.operate).
+            outlets [List[Outlet]]: the outlets from which releases are made, typically Reservoir.outlet_bank.
+            volumes [List[float]]: the strictly increasing available volumes at which the releases are sampled, these should include any volume at which the releases change slope (e.g. outlet locations and zone tops).
+            dowys [List[int]]: the days of the water year at which the releases are sampled, defaults to days 1 - 365. None for operations that do not depend on the date (the timesteps are sampled undated).
+            inputs [Dict[str, Input]]: constant inputs added to each sampled timestep (e.g. 'demand' and 'capacity' for the standard_operating_proceedures), these should not be inflows or outflows. Defaults to None.
+            tolerance [float]: if provided the largest error at the midpoints between sampled volumes (see max_error()) is checked, raising a ValueError if it is larger than the tolerance.
+        Returns:
+            None (instantiates an instance of the Tabulated_Operations class)
+        '''
+        volumes = np.asarray(volumes, dtype=float)
+        if volumes.ndim != 1 or volumes.size < 2 or np.any(np.diff(volumes) <= 0):
+            raise ValueError('The tabulated volumes must be a strictly increasing list of at least two values, causing an error.')
+        self._f = f_operations
+        self._outlets = outlets
+        self._names = [o.name for o in by_location(outlets)]
+        self._volumes, self._list = volumes, volumes.tolist()
+        self._inputs = {} if inputs == None else inputs
+        self._dowys = None if dowys is None else [int(d) for d in dowys]
+        self._rows = np.full(367, -1, dtype=int)
+        if self._dowys is not None:
+            self._rows[self._dowys] = np.arange(len(self._dowys))
+        days = [None] if self._dowys == None else self._dowys
+        self._table = np.array([[self._sample(v, d) for v in self._list] for d in days], dtype=float)
+        self._slopes = np.diff(self._table, axis=1) / np.diff(volumes)[None, :, None]
+        self._error = None
+        if tolerance != None and self.max_error() > tolerance:
+            raise ValueError(f'The tabulated operations error: {self._error} is larger than the tolerance: {tolerance}, causing an error. Add volumes (or days) to the table.')
+
+    @property
+    def volumes(self) -> np.ndarray:
+        '''The sampled available volumes.'''
+        return self._volumes
+    @property
+    def dowys(self) -> Union[List[int], None]:
+        '''The sampled days of the water year, None if the timesteps were sampled undated.'''
+        return self._dowys
+    @property
+    def names(self) -> List[str]:
+        '''The outlet names, in the order of the last axis of the table.'''
+        return self._names
+    @property
+    def table(self) -> np.ndarray:
+        '''The sampled releases with the shape: (days, volumes, outlets).'''
+        return self._table
+
+    def _timestep(self, volume: float, dowy: Union[int, None]) -> TimeStep:
+        date = 0 if dowy == None else WATER_YEAR_START + datetime.timedelta(days=int(dowy) - 1)
+        return TimeStep(date, {'inflow': Input(float(volume)), 'storage': Input(0.0, category=Category.STORAGE)} | self._inputs)
+    def _sample(self, volume: float, dowy: Union[int, None]) -> List[float]:
+        releases = self._f(self._timestep(volume, dowy), self._outlets)
+        return [releases[name] for name in self._names]
+    def _row(self, dowy: Union[int, None]) -> int:
+        '''The table row for the day of the water year, -1 if the day was not sampled.'''
+        if self._dowys == None:
+            return 0
+        return -1 if dowy == None else self._rows.item(dowy)
+    def _interpolate(self, volume: float, row: int) -> Union[Dict[str, float], None]:
+        '''Interpolates the releases from a row of the table, None if the row or volume is not in the table.'''
+        if row < 0 or not self._list[0] <= volume <= self._list[-1]:
+            return None
+        i = min(bisect.bisect_right(self._list, volume), len(self._list) - 1) - 1
+        return dict(zip(self._names, (self._table[row, i] + (volume - self._list[i]) * self._slopes[row, i]).tolist()))
+    def release(self, volume: float, dowy: Union[int, None] = None) -> Dict[str, float]:
+        '''
+        Computes the releases for an available volume and day of the water year, from the table if possible.
+        Args:
+            volume [float]: the available volume (storage + inflows - outflows).
+            dowy [int]: the day of the water year, ignored if the timesteps were sampled undated.
+        Returns:
+            A Dict[str, float] with releases (values) labeled according the Outlet.name from which they are made.
+        '''
+        releases = self._interpolate(volume, self._row(dowy))
+        return dict(zip(self._names, self._sample(volume, dowy))) if releases == None else releases
+    def operate(self, t: TimeStep, outlets: List[Outlet]) -> Dict[str, float]:
+        '''
+        Interpolates the releases for the timestep from the table, or calls the exact operations function if the available volume or day of the water year is not in the table.
+        
+        Args:
+            t [TimeStep]: data inputs used for operational rules
+            outlets [List[Outlet]]: outlets from which releases are made, these should be the outlets used to build the table.
+        Returns:
+            A Dict[str, float] with releases (values) labeled according the Outlet.name from which they are made.
+        '''
+        releases = self._interpolate(t.inflows() + t.storage() - t.outflows(), self._row(None if self._dowys is None else t.calendar.dowy))
+        return self._f(t, outlets) if releases == None else releases
+    def operate_batch(self, states: Dict[str, np.ndarray], outlets: OutletBank) -> Dict[str, np.ndarray]:
+        '''
+        Makes the operate() releases for many states at once (see Operations.operate_batch()).
+        States outside the table are passed to the exact operations function's operate_batch function if it has one, otherwise they are sampled one at a time.
+        '''
+        volume = np.asarray(states['inflow'] + states['storage'] - states['outflow'], dtype=float)
+        if self._dowys == None:
+            rows = np.zeros(volume.shape, dtype=int)
+        else:
+            rows = np.broadcast_to(self._rows[np.asarray(states['dowy'], dtype=int)], volume.shape)
+        i = np.clip(np.searchsorted(self._volumes, volume, side='right'), 1, self._volumes.size - 1) - 1
+        releases = self._table[rows, i] + (volume - self._volumes[i])[..., None] * self._slopes[rows, i]
+        outside = (rows < 0) | (volume < self._list[0]) | (volume > self._list[-1])
+        if np.any(outside):
+            f_batch = batch_operations(self._f)
+            if f_batch != None:
+                exact = f_batch(states, outlets)
+                releases[outside] = np.column_stack([np.broadcast_to(exact[name], volume.shape) for name in self._names])[outside]
+            else:
+                dowys = np.broadcast_to(states['dowy'], volume.shape) if self._dowys != None else np.full(volume.shape, None)
+                releases[outside] = [self._sample(v, d) for v, d in zip(volume[outside].tolist(), dowys[outside].tolist())]
+        return {name: releases[..., k] for k, name in enumerate(self._names)}
+    def max_error(self, volumes: Union[List[float], None] = None, dowys: Union[List[int], None] = None) -> float:
+        '''
+        Computes the largest absolute difference between the tabulated and exact releases.
+        Args:
+            volumes [List[float]]: the available volumes to check, defaults to the midpoints between the sampled volumes (where the linear interpolation error is typically largest).
+            dowys [List[int]]: the days of the water year to check, defaults to the sampled days.
+        Returns:
+            The largest error (float), across the outlets.
+        '''
+        volumes = ((self._volumes[1:] + self._volumes[:-1]) / 2).tolist() if volumes is None else volumes
+        days = ([None] if self._dowys is None else self._dowys) if dowys is None else dowys
+        error = 0.0
+        for d in days:
+            for v in volumes:
+                exact, approx = self._sample(v, d), self.release(v, d)
+                error = max(error, max(abs(exact[k] - approx[name]) for k, name in enumerate(self._names)))
+        self._error = error
+        return error
                 
 def passive_operations(t: TimeStep, outlets: List[Outlet], factor: float = 1) -> Dict[str, float]:
     '''
@@ -198,22 +420,31 @@ def passive_operations(t: TimeStep, outlets: List[Outlet], factor: float = 1) ->
         A Dict[str, float] releases (values) listed according to the Outlet.name (key) from which they are made.
     '''
     releases = {}
-    outlets.sort(key=lambda x: x.location)
     release = 0
     storage = t.inflows() + t.storage() - t.outflows()
-    for outlet in outlets:
+    for outlet in by_location(outlets):
         release = outlet.max_release(storage)
         releases[outlet.name] = release
         storage = storage - release
     return releases
+def passive_operations_batch(states: Dict[str, np.ndarray], outlets: OutletBank) -> Dict[str, np.ndarray]:
+    '''The passive_operations() policy for many states at once (see Operations.operate_batch()).'''
+    releases = {}
+    storage = states['inflow'] + states['storage'] - states['outflow']
+    for i, outlet in enumerate(outlets):
+        release = outlets.max_release(i, storage)
+        releases[outlet.name] = release
+        storage = storage - release
+    return releases
+passive_operations.operate_batch = passive_operations_batch
         
 def standard_operating_proceedures(t: TimeStep, outlets: List[Outlet]) -> Dict[str, float]:
     '''
     Implements standard operationg proceedure reservoir operations rules, meaning the demanded water is released, provided it is available as storage + inflow.
-    NOTE: requires demand and reservoir capacity be listed in the inputs argument as input.additional_inputs under the keys: ['demand', 'capacity']
+    NOTE: requires demand and reservoir capacity be listed in the timestep inputs under the keys: ['demand', 'capacity']
     
     Args:
-        input [Dict[str, Input]]: data inputs for the operational rules. MUST include the input.additional_inputs: ['demand', 'capacity'].
+        t [TimeStep]: data inputs for the operational rules. MUST include the inputs: ['demand', 'capacity'].
         outlets [List[Outlet]]: a list of outlets from which releases are made.
     Returns:
         A Dict[str, float]: listing releases (values) according to the Outlet.name (key) from which they are made.
@@ -222,14 +453,25 @@ def standard_operating_proceedures(t: TimeStep, outlets: List[Outlet]) -> Dict[s
     releases = {}
     release = 0
     storage = t.inflows() + t.storage() - t.outflows()
-    demand, capacity = input.additional_inputs['demand'], input.additional_inputs['capacity']
+    demand, capacity = t.inputs['demand'].value, t.inputs['capacity'].value
     target = max(demand, storage - capacity) if capacity < storage else min(storage, demand)
-    outlets.sort(key=lambda x: x.location)
-    for outlet in outlets:
+    for outlet in by_location(outlets):
         if target > 0:
-            release = min(demand, outlet.max_release(storage))
+            release = min(target, outlet.max_release(storage))
             releases[outlet.name] = release
-            storage = storage - release
+            storage, target = storage - release, target - release
         else:
-            releases[outlet.name] = release
-    return releases           
\ No newline at end of file
+            releases[outlet.name] = 0
+    return releases
+def standard_operating_proceedures_batch(states: Dict[str, np.ndarray], outlets: OutletBank) -> Dict[str, np.ndarray]:
+    '''The standard_operating_proceedures() policy for many states at once (see Operations.operate_batch()), the states must include the 'demand' and 'capacity' inputs.'''
+    releases = {}
+    storage = states['inflow'] + states['storage'] - states['outflow']
+    demand, capacity = states['demand'], states['capacity']
+    target = np.where(capacity < storage, np.maximum(demand, storage - capacity), np.minimum(storage, demand))
+    for i, outlet in enumerate(outlets):
+        release = np.where(target > 0, np.minimum(target, outlets.max_release(i, storage)), 0.0)
+        releases[outlet.name] = release
+        storage, target = storage - release, target - release
+    return releases
+standard_operating_proceedures.operate_batch = standard_operating_proceedures_batch
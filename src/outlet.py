@@ -17,6 +17,8 @@
 # %%
 import sys
 import typing
+import bisect
+from dataclasses import dataclass, field
 
 import numpy as np
 
@@ -24,6 +26,62 @@ sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
 import src.utilities as utilities
 #endregion
 
+# %%
+@dataclass(frozen=True)
+class RatingTable:
+    '''
+    A tabulated outlet capacity curve, which linearly interpolates the max release from a sorted table of volumes and max releases.
+    Use it as an Outlet.f_max_release function, it is picklable and can be written to (and read from) a dictionary.
+    '''
+    volumes: typing.Tuple[float, ...]
+    '''The reservoir volumes, in strictly ascending order.'''
+    releases: typing.Tuple[float, ...]
+    '''The max release at each volume.'''
+    below: float = 0.0
+    '''The max release for volumes below the table, 0 by default.'''
+    above: typing.Union[float, None] = None
+    '''The max release for volumes above the table, the last release in the table by default.'''
+    _slopes: typing.Tuple[float, ...] = field(init=False, repr=False, compare=False)
+    _xs: np.ndarray = field(init=False, repr=False, compare=False)
+    _ys: np.ndarray = field(init=False, repr=False, compare=False)
+    def __post_init__(self) -> None:
+        xs, ys = tuple(float(x) for x in self.volumes), tuple(float(y) for y in self.releases)
+        if len(xs) != len(ys) or len(xs) < 2:
+            raise ValueError(f'The rating table requires at least two volumes and one release for each volume, {len(xs)} volumes and {len(ys)} releases were provided, causing an error.')
+        if any(xs[i] >= xs[i + 1] for i in range(len(xs) - 1)):
+            raise ValueError('The rating table volumes must be in strictly ascending order, causing an error.')
+        object.__setattr__(self, 'volumes', xs)
+        object.__setattr__(self, 'releases', ys)
+        object.__setattr__(self, 'above', ys[-1] if self.above == None else float(self.above))
+        object.__setattr__(self, '_slopes', tuple((ys[i + 1] - ys[i]) / (xs[i + 1] - xs[i]) for i in range(len(xs) - 1)))
+        object.__setattr__(self, '_xs', np.array(xs))
+        object.__setattr__(self, '_ys', np.array(ys))
+    
+    def __call__(self, volume: float) -> float:
+        '''Interpolates the max release for a single volume.'''
+        xs = self.volumes
+        if volume < xs[0]:
+            return self.below
+        if volume >= xs[-1]:
+            return self.releases[-1] if volume == xs[-1] else self.above
+        if volume != volume: # nan
+            return np.nan
+        i = bisect.bisect_right(xs, volume) - 1
+        return self.releases[i] + self._slopes[i] * (volume - xs[i])
+    def interpolate(self, volumes: np.ndarray) -> np.ndarray:
+        '''Interpolates the max releases for an array of volumes.'''
+        v = np.asarray(volumes, dtype=float)
+        i = np.clip(np.searchsorted(self._xs, v, side='right') - 1, 0, len(self._xs) - 2)
+        y = self._ys[i] + np.asarray(self._slopes)[i] * (v - self._xs[i])
+        return np.where(v < self._xs[0], self.below, np.where(v > self._xs[-1], self.above, np.where(v == self._xs[-1], self._ys[-1], y)))
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        '''Returns the table as a json serializable dictionary.'''
+        return {'volumes': list(self.volumes), 'releases': list(self.releases), 'below': self.below, 'above': self.above}
+    @staticmethod
+    def from_dict(d: typing.Dict[str, typing.Any]) -> 'RatingTable':
+        '''Builds a table from the dictionary produced by to_dict().'''
+        return RatingTable(d['volumes'], d['releases'], d.get('below', 0.0), d.get('above', None))
+
 # %%
 class Outlet:
     '''
@@ -55,11 +113,16 @@ class Outlet:
         return self._f_max_release
     def __set_f_max_release(self, f_max_release: typing.Callable[[float], float]) -> typing.Callable[[float], float]:
         if f_max_release == None:
-            def inner(volume: float) -> float:
-                return volume - self.location if volume > self.location else 0
-            return inner
+            return self.release_above_location
         else:
             return f_max_release    
+    def release_above_location(self, volume: float) -> float:
+        '''The default f_max_release function, which releases all of the volume above the outlet location.'''
+        return volume - self.location if volume > self.location else 0
+    @property
+    def rating(self) -> typing.Union[RatingTable, None]:
+        '''The outlet's RatingTable if its max release is tabulated, None otherwise.'''
+        return self._f_max_release if isinstance(self._f_max_release, RatingTable) else None
     @property
     def is_valid(self) -> bool:
         return self._is_valid
@@ -81,15 +144,105 @@ class Outlet:
         '''
         return f'{self.name}(location: {round(self.location, digits)})'
 
-def select_outlets(names: typing.List[str], outlets: typing.List[Outlet]) -> typing.List[str]:
-    items = set()
-    for name in names:
-        items.update([x for x in outlets if x.name == name])
-    return list(items)
-def deselect_outlets(names: typing.List[str], outlets: typing.List[Outlet]) -> typing.List[str]:
-    items = set()
-    for name in names:
-        items.update([x for x in outlets if x.name != name])
-    return list(items)
-def select_outlet(name: str, outlets: typing.List[Outlet]) -> Outlet:
-    return [x for x in outlets if x.name == name][0]
\ No newline at end of file
+class OutletBank(typing.Sequence[Outlet]):
+    '''
+    A read only sequence of reservoir outlets, sorted by location (ties keep their original order), indexed by name, with the outlet locations stored in an array.
+    '''
+    def __init__(self, outlets: typing.Iterable[Outlet]) -> None:
+        self._outlets: typing.Tuple[Outlet, ...] = tuple(sorted(outlets, key=lambda x: x.location))
+        self._index: typing.Dict[str, int] = {x.name: i for i, x in enumerate(self._outlets)}
+        self._locations = np.array([x.location for x in self._outlets], dtype=float)
+        self._isdefault = np.array([x.f_max_release == x.release_above_location for x in self._outlets], dtype=bool)
+        self._ratings: typing.List[typing.Union[RatingTable, None]] = [x.rating for x in self._outlets]
+    
+    def __getitem__(self, i: typing.Union[int, slice]) -> typing.Union[Outlet, typing.Tuple[Outlet, ...]]:
+        return self._outlets[i]
+    def __len__(self) -> int:
+        return len(self._outlets)
+    def __iter__(self) -> typing.Iterator[Outlet]:
+        return iter(self._outlets)
+    def __contains__(self, x: typing.Union[str, Outlet]) -> bool:
+        return x in self._index if isinstance(x, str) else x in self._outlets
+    @property
+    def names(self) -> typing.List[str]:
+        '''The outlet names, in location order.'''
+        return list(self._index)
+    @property
+    def locations(self) -> np.ndarray:
+        '''The outlet locations, in ascending order.'''
+        return self._locations
+    @property
+    def isdefault(self) -> bool:
+        '''True if every outlet uses the default Outlet.release_above_location() max release function, False otherwise.'''
+        return bool(self._isdefault.all())
+    @property
+    def ratings(self) -> typing.List[typing.Union[RatingTable, None]]:
+        '''The RatingTable of each outlet, in location order, None for outlets without a tabulated max release.'''
+        return self._ratings
+    @property
+    def istabulated(self) -> bool:
+        '''True if every outlet uses either the default max release function or a RatingTable, False otherwise.'''
+        return all(d or r is not None for d, r in zip(self._isdefault, self._ratings))
+    def index(self, name: str) -> int:
+        '''The position of the named outlet in the bank.'''
+        return self._index[name]
+    def select(self, name: str) -> Outlet:
+        '''Returns the named outlet.'''
+        return self._outlets[self._index[name]]
+    def select_many(self, names: typing.Iterable[str]) -> typing.List[Outlet]:
+        '''Returns the named outlets, in location order.'''
+        return [self._outlets[i] for i in sorted(self._index[name] for name in set(names) if name in self._index)]
+    def deselect(self, names: typing.Iterable[str]) -> typing.List[Outlet]:
+        '''Returns the outlets that are not named, in location order.'''
+        names = set(names)
+        return [x for x in self._outlets if x.name not in names]
+    def max_release(self, i: int, volume: typing.Union[float, np.ndarray]) -> typing.Union[float, np.ndarray]:
+        '''
+        Computes the max release of the i-th outlet (in location order) for a storage volume or an array of storage volumes.
+        '''
+        v = np.asarray(volume, dtype=float)
+        if self._isdefault[i]:
+            location = self._locations[i]
+            return np.where(v > location, v - location, 0.0)
+        if self._ratings[i] is not None:
+            return self._ratings[i].interpolate(v)
+        x = self._outlets[i]
+        return np.array(x.max_release(volume) if v.ndim == 0 else [x.max_release(y) for y in v.tolist()], dtype=float)
+    def max_releases(self, volume: typing.Union[float, np.ndarray]) -> np.ndarray:
+        '''
+        Computes the max release of every outlet for a storage volume.
+        Args:
+            volume [float or np.ndarray]: a storage volume or an array of storage volumes.
+        Returns:
+            An array of max releases, with one row per outlet (in location order) and one column per volume if an array of volumes is provided.
+        '''
+        v = np.asarray(volume, dtype=float)
+        locations = self._locations.reshape((-1,) + (1,) * v.ndim)
+        releases = np.where(v > locations, v - locations, 0.0)
+        for i in np.flatnonzero(~self._isdefault):
+            x, rating = self._outlets[i], self._ratings[i]
+            if rating is not None:
+                releases[i] = rating.interpolate(v)
+            else:
+                releases[i] = x.max_release(volume) if v.ndim == 0 else np.array([x.max_release(y) for y in v.tolist()], dtype=float)
+        return releases
+
+def by_location(outlets: typing.Iterable[Outlet]) -> typing.Sequence[Outlet]:
+    '''Returns the outlets sorted by location, without sorting (or changing) the provided outlets. An OutletBank is already sorted and is returned as is.'''
+    return outlets if isinstance(outlets, OutletBank) else sorted(outlets, key=lambda x: x.location)
+def select_outlets(names: typing.List[str], outlets: typing.Iterable[Outlet]) -> typing.List[Outlet]:
+    '''Returns the named outlets, in the order they are provided.'''
+    if isinstance(outlets, OutletBank):
+        return outlets.select_many(names)
+    names = set(names)
+    return [x for x in outlets if x.name in names]
+def deselect_outlets(names: typing.List[str], outlets: typing.Iterable[Outlet]) -> typing.List[Outlet]:
+    '''Returns the outlets that are not named, in the order they are provided.'''
+    if isinstance(outlets, OutletBank):
+        return outlets.deselect(names)
+    names = set(names)
+    return [x for x in outlets if x.name not in names]
+def select_outlet(name: str, outlets: typing.Iterable[Outlet]) -> Outlet:
+    if isinstance(outlets, OutletBank):
+        return outlets.select(name)
+    return [x for x in outlets if x.name == name][0]
@@ -15,6 +15,8 @@
 # %%
 import sys
 import typing
+import bisect
+import collections
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -22,7 +24,7 @@ import matplotlib.pyplot as plt
 sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
 import src.utilities as utilities
 import src.outlet as outlet
-from src.outlet import Outlet
+from src.outlet import Outlet, OutletBank
 #endregion
 
 # %%
@@ -41,20 +43,131 @@ class Map:
     def inverse_f(self, y: float) -> float:
         return self._inverse_f(y)
 
+class TabulatedMap(Map):
+    '''
+    A Map built from a single table of volumes and a strictly monotone mapped variable (e.g. a volume-elevation rating). 
+    Both directions are linearly interpolated from the table: scalars with a bisect search and precomputed slopes, arrays with numpy.
+    Scalar inverse_f() results are cached (the least recently used results are dropped once the cache is full), so repeated lookups of constant thresholds (e.g. zone elevations) cost a dictionary lookup.
+    '''
+    MAX_CACHED_INVERSES = 1024
+    '''The maximum number of cached inverse_f() results.'''
+    def __init__(self, name: str, volumes: typing.List[float], values: typing.List[float]) -> None:
+        xs, ys = [float(x) for x in volumes], [float(y) for y in values]
+        if len(xs) != len(ys) or len(xs) < 2:
+            raise ValueError(f'The {name} map requires at least two volumes and one value for each volume, {len(xs)} volumes and {len(ys)} values were provided, causing an error.')
+        if any(xs[i] >= xs[i + 1] for i in range(len(xs) - 1)):
+            raise ValueError(f'The {name} map volumes must be in strictly ascending order, causing an error.')
+        if not (all(ys[i] < ys[i + 1] for i in range(len(ys) - 1)) or all(ys[i] > ys[i + 1] for i in range(len(ys) - 1))):
+            raise ValueError(f'The {name} map values must be strictly increasing or strictly decreasing, causing an error.')
+        super().__init__(name, None, None)
+        self._volumes, self._values = tuple(xs), tuple(ys)
+        # the inverse table is sorted by value, so it is reversed for a decreasing map.
+        yx = sorted(zip(ys, xs))
+        self._forward = TabulatedMap.__table(xs, ys)
+        self._inverse = TabulatedMap.__table([y for y, _ in yx], [x for _, x in yx])
+        self._inverses: typing.OrderedDict[float, float] = collections.OrderedDict()
+    @staticmethod
+    def __table(xs: typing.List[float], ys: typing.List[float]) -> typing.Tuple[typing.Tuple[float, ...], typing.Tuple[float, ...], typing.Tuple[float, ...], np.ndarray, np.ndarray]:
+        slopes = tuple((ys[i + 1] - ys[i]) / (xs[i + 1] - xs[i]) for i in range(len(xs) - 1))
+        return tuple(xs), tuple(ys), slopes, np.array(xs), np.array(ys)
+    @staticmethod
+    def __interpolate(table, x: typing.Union[float, np.ndarray]) -> typing.Union[float, np.ndarray]:
+        xs, ys, slopes, xarray, yarray = table
+        if isinstance(x, (int, float, np.number)):
+            if not xs[0] <= x <= xs[-1]:
+                return np.nan
+            if x == xs[-1]:
+                return ys[-1]
+            i = bisect.bisect_right(xs, x) - 1
+            return ys[i] + slopes[i] * (x - xs[i])
+        x = np.asarray(x, dtype=float)
+        return np.where((x < xarray[0]) | (x > xarray[-1]), np.nan, np.interp(x, xarray, yarray))
+    
+    @property
+    def volumes(self) -> typing.Tuple[float, ...]:
+        '''The table volumes.'''
+        return self._volumes
+    @property
+    def values(self) -> typing.Tuple[float, ...]:
+        '''The mapped variable value at each table volume.'''
+        return self._values
+    def f(self, volume: typing.Union[float, np.ndarray]) -> typing.Union[float, np.ndarray]:
+        '''Maps a volume (or an array of volumes) to the mapped variable, volumes outside the table return nan.'''
+        return TabulatedMap.__interpolate(self._forward, volume)
+    def inverse_f(self, y: typing.Union[float, np.ndarray]) -> typing.Union[float, np.ndarray]:
+        '''Maps a value (or an array of values) of the mapped variable to a volume, values outside the table return nan.'''
+        if isinstance(y, (int, float, np.number)):
+            x = self._inverses.get(y)
+            if x is None:
+                x = self._inverses[y] = TabulatedMap.__interpolate(self._inverse, y)
+                if len(self._inverses) > TabulatedMap.MAX_CACHED_INVERSES:
+                    self._inverses.popitem(last=False)
+            else:
+                self._inverses.move_to_end(y)
+            return x
+        return TabulatedMap.__interpolate(self._inverse, y)
+
+# %%
+class Zones:
+    '''
+    An ordered set of reservoir zones (e.g. operations.Zone values), declared by the volume at the top of each zone, from the bottom of the reservoir up.
+    A volume belongs to the lowest zone whose top is above it; volumes at or above the top of the highest declared zone belong to the top zone.
+    '''
+    def __init__(self, tops: typing.List[typing.Tuple[typing.Any, float]], top_zone: typing.Any) -> None:
+        '''
+        Args:
+            tops [List[Tuple[Any, float]]]: (zone, volume at the top of the zone) pairs, the volumes must be strictly ascending.
+            top_zone [Any]: the zone above the highest declared top (e.g. operations.Zone.SURCHARGE).
+        '''
+        volumes = [float(v) for _, v in tops]
+        if any(volumes[i] >= volumes[i + 1] for i in range(len(volumes) - 1)):
+            raise ValueError(f'The zone tops: {volumes} must be in strictly ascending order, causing an error.')
+        self._tops: typing.Tuple[float, ...] = tuple(volumes)
+        self._array = np.array(volumes)
+        self._zones: typing.Tuple[typing.Any, ...] = tuple(z for z, _ in tops) + (top_zone,)
+    @staticmethod
+    def from_map(map: Map, tops: typing.List[typing.Tuple[typing.Any, float]], top_zone: typing.Any) -> 'Zones':
+        '''Declares zones by the top of each zone in the units of a mapped variable (e.g. elevations), which are converted to volumes once with the Map.inverse_f() function.'''
+        return Zones([(z, map.inverse_f(y)) for z, y in tops], top_zone)
+    
+    @property
+    def zones(self) -> typing.Tuple[typing.Any, ...]:
+        '''The zones from the bottom of the reservoir up, including the top zone.'''
+        return self._zones
+    @property
+    def tops(self) -> typing.Tuple[float, ...]:
+        '''The volume at the top of each zone, excluding the top zone.'''
+        return self._tops
+    def index(self, volume: float) -> int:
+        '''The position (in zones) of the zone containing the volume.'''
+        return bisect.bisect_right(self._tops, volume)
+    def indices(self, volumes: np.ndarray) -> np.ndarray:
+        '''The positions (in zones) of the zones containing an array of volumes.'''
+        return np.searchsorted(self._array, np.asarray(volumes, dtype=float), side='right')
+    def classify(self, volume: float) -> typing.Any:
+        '''Returns the zone containing the volume.'''
+        return self._zones[bisect.bisect_right(self._tops, volume)]
+    def classify_many(self, volumes: np.ndarray) -> typing.List[typing.Any]:
+        '''Returns the zones containing an array of volumes.'''
+        return [self._zones[i] for i in self.indices(volumes).tolist()]
+
 # %%
 class Reservoir:
     '''
     Data object for the physical representation of a reservoir, exclusive of its operations and state (e.g. volume)
     '''
-    def __init__(self, capacity: float = 1, outlets: typing.List[outlet.Outlet] = 'spill', maps: typing.Set[Map] = None,  name = 'default') -> None:
+    def __init__(self, capacity: float = 1, outlets: typing.List[outlet.Outlet] = 'spill', maps: typing.Set[Map] = None,  name = 'default', zones: Zones = None) -> None:
         self._name = name
         self._errors = []
         self._messages = []
         self._is_valid = True
         # w/ validation logic
         self._capacity = self.__set_capacity(capacity)
-        self._outlets = self.__set_outlets(outlets)
+        # the outlets are held in a tuple, so the outlet bank built from them can not be made stale by changes to a list.
+        self._outlets = tuple(self.__set_outlets(outlets))
+        self._outlet_bank = OutletBank(self._outlets)
         self._maps = self.__set_maps(maps)
+        self._zones = zones
     
     @property
     def name(self) -> str:
@@ -69,7 +182,8 @@ class Reservoir:
             self._errors.append(error.message)
         return k
     @property
-    def outlets(self) -> typing.List[outlet.Outlet]:
+    def outlets(self) -> typing.Tuple[outlet.Outlet, ...]:
+        '''The reservoir outlets, which can not be changed after the reservoir is constructed.'''
         return self._outlets
     def __set_outlets(self, outlets: typing.List[outlet.Outlet]) -> typing.List[outlet.Outlet]:
         lst = []
@@ -114,6 +228,10 @@ class Reservoir:
                 self._errors.extend(outlet._errors)
         return lst
     @property
+    def outlet_bank(self) -> OutletBank:
+        '''The reservoir outlets sorted by location and indexed by name, this is the outlets sequence passed to operations functions during a Simulation.'''
+        return self._outlet_bank
+    @property
     def maps(self) -> typing.Dict[str, Map]:
         return self._maps 
     def __set_maps(self, maps: typing.Set[Map]) -> typing.Dict[str, Map]:
@@ -129,6 +247,15 @@ class Reservoir:
                     d[map.name] = map
             return d 
     @property
+    def zones(self) -> typing.Union[Zones, None]:
+        '''The declared reservoir Zones, None if no zones are declared.'''
+        return self._zones
+    def zone(self, volume: float) -> typing.Any:
+        '''Returns the declared zone containing the volume.'''
+        if self.zones == None:
+            raise AttributeError(f'The {self.name} reservoir has no declared zones, causing an error.')
+        return self.zones.classify(volume)
+    @property
     def is_valid(self) -> bool:
         return self._is_valid
     @property
@@ -138,13 +265,10 @@ class Reservoir:
     def errors(self) -> typing.List[str]:
         return self._errors  
     
-    def select_outlets(self, names: typing.List[str]) -> typing.List[str]:
-        lst = []
-        for name in names:
-            lst.append([x for x in self.outlets if x.name == name])
-        return lst
+    def select_outlets(self, names: typing.List[str]) -> typing.List[Outlet]:
+        return self.outlet_bank.select_many(names)
     def select_outlet(self, name: str) -> Outlet:
-        return [x for x in self.outlets if x.name == name][0]
+        return self.outlet_bank.select(name)
     
     def f(self, key: str, volume: float) -> float:
         '''
@@ -154,6 +278,14 @@ class Reservoir:
             return self.maps[key].f(volume)
         else:
             raise AttributeError(f'The requested variable: {key}, is not in the dictionary of mapped variables.') 
+    def inverse_f(self, key: str, y: float) -> float:
+        '''
+        Calls the inverse function of a named variable, mapping the named variable back to a volume.
+        '''
+        if key in self.maps:
+            return self.maps[key].inverse_f(y)
+        else:
+            raise AttributeError(f'The requested variable: {key}, is not in the dictionary of mapped variables.') 
     def plot_map(self, key: str, xy_pairs: typing.Tuple[typing.List[float], typing.List[float]] = None) -> None:
         fig, ax = plt.subplots(figsize = (10, 15))
         ax.set_title(f'Reservoir volume-{key} relationship')
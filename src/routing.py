@@ -0,0 +1,119 @@
+#region Header
+# %% [markdown]
+# # Routing
+# This file provides channel reaches, which route the releases from one reservoir (see node.py) into the inflows of a downstream reservoir.
+# A reach routes a whole array of releases (or an ensemble matrix with one row per member) at once, its coefficients are computed once when it is constructed.
+# The Muskingum recursion: O[t] = c0 I[t] + c1 I[t-1] + c2 O[t-1] is evaluated as a convolution with the precomputed geometric kernel: c2^k, so no timestep loop is needed.
+#
+# Author: John Kucharski | Date: 16 October 2026
+#
+# Status: open
+# Testing: partial
+#endregion
+
+#region Dependencies
+#%%
+from dataclasses import dataclass, field
+from typing import Protocol, Tuple, Union
+
+import numpy as np
+#endregion
+
+#%%
+class Reach(Protocol):
+    '''
+    Provides an interface for channel routing components.
+    '''
+    def route(self, inflows: np.ndarray) -> np.ndarray:
+        '''
+        Routes inflows through the reach.
+        Args:
+            inflows [np.ndarray]: an array of inflows with one value per timestep, or a matrix with one row per ensemble member and one column per timestep.
+        Returns:
+            The outflows from the reach, with the same shape as the inflows.
+        '''
+
+@dataclass(frozen=True)
+class Lag:
+    '''A reach that delays the inflows by a whole number of timesteps, without attenuation.'''
+    steps: int
+    '''The number of timesteps the inflows are delayed.'''
+    initial: Union[float, None] = None
+    '''The outflow before the first delayed inflow arrives, the first inflow by default (i.e. steady flow).'''
+    def __post_init__(self) -> None:
+        if self.steps < 0 or self.steps != int(self.steps):
+            raise ValueError(f'The lag: {self.steps} must be a non-negative integer number of timesteps, causing an error.')
+    def route(self, inflows: np.ndarray) -> np.ndarray:
+        inflows = np.asarray(inflows, dtype=float)
+        outflows = np.empty_like(inflows)
+        lag = min(int(self.steps), inflows.shape[-1])
+        outflows[..., lag:] = inflows[..., :inflows.shape[-1] - lag]
+        outflows[..., :lag] = (inflows[..., :1] if self.initial == None else self.initial)
+        return outflows
+
+@dataclass(frozen=True)
+class Muskingum:
+    '''
+    A Muskingum reach, which attenuates and delays the inflows.
+    The coefficients must be non-negative, which requires: 2 k x <= dt <= 2 k (1 - x) (otherwise split the reach into shorter reaches or change the timestep).
+    '''
+    k: float
+    '''The travel time through the reach, in timesteps (or the units of dt).'''
+    x: float = 0.2
+    '''The weighting factor on the range [0, 0.5], 0 for a linear reservoir and 0.5 for pure translation.'''
+    dt: float = 1.0
+    '''The timestep length, in the units of k.'''
+    initial: Union[float, None] = None
+    '''The outflow in the first timestep, the first inflow by default (i.e. steady flow).'''
+    coefficients: Tuple[float, float, float] = field(init=False, compare=False)
+    '''The (c0, c1, c2) coefficients, computed once.'''
+    _kernel: np.ndarray = field(init=False, repr=False, compare=False)
+    def __post_init__(self) -> None:
+        if self.k <= 0 or self.dt <= 0 or not 0 <= self.x <= 0.5:
+            raise ValueError(f'The Muskingum k: {self.k} and dt: {self.dt} must be positive and x: {self.x} must be on the range [0, 0.5], causing an error.')
+        d = 2 * self.k * (1 - self.x) + self.dt
+        c0, c1, c2 = (self.dt - 2 * self.k * self.x) / d, (self.dt + 2 * self.k * self.x) / d, (2 * self.k * (1 - self.x) - self.dt) / d
+        if c0 < 0 or c2 < 0:
+            raise ValueError(f'The Muskingum coefficients: {(c0, c1, c2)} are negative, because dt: {self.dt} is not on the range [2 k x, 2 k (1 - x)]: [{2 * self.k * self.x}, {2 * self.k * (1 - self.x)}], causing an error.')
+        # the geometric kernel c2^k is truncated where it drops below the floating point resolution.
+        n = 1 if c2 == 0 else int(np.ceil(np.log(np.finfo(float).eps) / np.log(c2))) + 1
+        object.__setattr__(self, 'coefficients', (c0, c1, c2))
+        object.__setattr__(self, '_kernel', c2 ** np.arange(n))
+    def route(self, inflows: np.ndarray) -> np.ndarray:
+        inflows = np.asarray(inflows, dtype=float)
+        n = inflows.shape[-1]
+        if n == 0:
+            return inflows.copy()
+        c0, c1, c2 = self.coefficients
+        first = inflows[..., :1] if self.initial == None else np.full(inflows.shape[:-1] + (1,), float(self.initial))
+        # O[t] = c2^t O[0] + sum_{j = 1...t} c2^(t - j) u[j], with u[j] = c0 I[j] + c1 I[j - 1].
+        u = np.zeros_like(inflows)
+        u[..., 1:] = c0 * inflows[..., 1:] + c1 * inflows[..., :-1]
+        kernel = self._kernel[:n]
+        if kernel.size <= 64:
+            outflows = np.zeros_like(inflows)
+            for lag, weight in enumerate(kernel.tolist()):
+                outflows[..., lag:] += weight * u[..., :n - lag]
+        else:
+            m = 1 << int(np.ceil(np.log2(n + kernel.size)))
+            outflows = np.fft.irfft(np.fft.rfft(u, m) * np.fft.rfft(kernel, m), m)[..., :n]
+        decay = np.zeros(n)
+        decay[:kernel.size] = kernel
+        return outflows + first * decay
+
+@dataclass(frozen=True)
+class Lag_And_Route:
+    '''A lag-and-route reach, which delays the inflows by a whole number of timesteps, then attenuates them through a linear reservoir (a Muskingum reach with x = 0).'''
+    steps: int
+    '''The number of timesteps the inflows are delayed.'''
+    k: float
+    '''The linear reservoir storage constant, in timesteps (or the units of dt).'''
+    dt: float = 1.0
+    '''The timestep length, in the units of k.'''
+    _lag: Lag = field(init=False, repr=False, compare=False)
+    _reservoir: Muskingum = field(init=False, repr=False, compare=False)
+    def __post_init__(self) -> None:
+        object.__setattr__(self, '_lag', Lag(self.steps))
+        object.__setattr__(self, '_reservoir', Muskingum(self.k, 0.0, self.dt))
+    def route(self, inflows: np.ndarray) -> np.ndarray:
+        return self._reservoir.route(self._lag.route(inflows))
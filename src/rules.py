@@ -0,0 +1,238 @@
+#region Header
+# %% [markdown]
+# # Rules
+# This file provides a declarative format for zone based reservoir operations, which is compiled once into lookup tables and evaluated for a single timestep (Simulation) or for many states at once (the array engine and ensembles).
+# Each zone declares (from the bottom of the reservoir up):
+#   - the volume at its top (none for the highest zone),
+#   - a release target: a fixed release (constant, or seasonal by day of the water year) plus the volume above a level (constant or seasonal, e.g. the top of the conservation pool),
+#   - the controlled outlets used to make the target release in priority order, with optional caps on each outlet and the total controlled release,
+#   - uncontrolled outlets (e.g. spillways), which release their maximum before the controlled outlets are used.
+# Policies are written to (and read from) json serializable dictionaries, and are picklable, so they can be loaded quickly on worker processes.
+#
+# Author: John Kucharski | Date: 16 October 2026
+#
+# Status: open
+# Testing: partial
+#endregion
+
+#region Dependencies
+#%%
+import sys
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Union, Sequence, Any
+
+import numpy as np
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.data import TimeStep
+from src.outlet import Outlet, OutletBank, by_location
+from src.reservoir import Zones
+#endregion
+
+#%%
+Seasonal = Union[float, List[Tuple[int, float]]]
+'''A constant value, or a list of (day of the water year, value) pairs that hold the value from that day until the next listed day (wrapping around the end of the water year).'''
+
+@dataclass(frozen=True)
+class Zone_Release:
+    '''The declared operations for a single reservoir zone.'''
+    name: str
+    '''Labels the zone.'''
+    top: Union[float, None] = None
+    '''The volume at the top of the zone, None for the highest zone.'''
+    release: Seasonal = 0.0
+    '''A fixed release target, 0 by default.'''
+    above: Union[Seasonal, None] = None
+    '''Adds the available volume (storage + inflows - outflows) above this volume to the release target, None by default (i.e. no volume is added).'''
+    outlets: Tuple[str, ...] = ()
+    '''The controlled outlets, in the order they are used to make the release target. Outlets that are not listed release nothing.'''
+    uncontrolled: Tuple[str, ...] = ()
+    '''Outlets that make their maximum release (counting toward the release target), in order, before the controlled outlets are used.'''
+    caps: Dict[str, float] = field(default_factory=dict)
+    '''Maximum releases for individual outlets.'''
+    cap: Union[float, None] = None
+    '''The maximum total release from the controlled outlets, None (no cap) by default.'''
+
+    def to_dict(self) -> Dict[str, Any]:
+        '''Returns the zone as a json serializable dictionary.'''
+        def listed(x: Union[Seasonal, None]) -> Union[float, List[List[float]], None]:
+            return x if x == None or np.isscalar(x) else [[int(d), float(v)] for d, v in x]
+        return {'name': self.name, 'top': self.top, 'release': listed(self.release), 'above': listed(self.above), 'outlets': list(self.outlets),
+                'uncontrolled': list(self.uncontrolled), 'caps': dict(self.caps), 'cap': self.cap}
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'Zone_Release':
+        '''Builds a zone from the dictionary produced by to_dict(), missing keys take their default values.'''
+        def seasonal(x: Union[float, List[List[float]], None]) -> Union[Seasonal, None]:
+            return x if x == None or np.isscalar(x) else [(int(day), float(v)) for day, v in x]
+        d = dict(d)
+        for k in ['release', 'above']:
+            if k in d:
+                d[k] = seasonal(d[k])
+        for k in ['outlets', 'uncontrolled']:
+            if k in d:
+                d[k] = tuple(d[k])
+        return Zone_Release(**d)
+
+def seasonal_table(x: Seasonal) -> np.ndarray:
+    '''
+    Tabulates a constant or seasonal value for each day of the water year.
+    Args:
+        x [Seasonal]: a constant, or (day of the water year, value) pairs.
+    Returns:
+        An array of 367 values indexed by the day of the water year (the value at index 0 is the value for day 1).
+    '''
+    if np.isscalar(x):
+        return np.full(367, float(x))
+    pairs = sorted((int(d), float(v)) for d, v in x)
+    if not pairs or pairs[0][0] < 1 or pairs[-1][0] > 366:
+        raise ValueError(f'The seasonal values: {x} must list at least one (day, value) pair, with days of the water year on the range [1, 366], causing an error.')
+    table = np.full(367, pairs[-1][1])
+    for d, v in pairs:
+        table[d:] = v
+    table[0] = table[1]
+    return table
+
+MAX_COMPILED_OUTLETS: int = 32
+'''The number of outlet sets a Rule_Policy keeps compiled plans for, the oldest plan is dropped when another set of outlets is compiled.'''
+class Rule_Policy:
+    '''
+    An operations policy compiled from a list of Zone_Release declarations, the zones are listed from the bottom of the reservoir up.
+    It implements the Operations protocol: operate() for Simulation objects and operate_batch() for the array engine.
+    '''
+    def __init__(self, zones: List[Zone_Release]) -> None:
+        '''
+        Args:
+            zones [List[Zone_Release]]: the zone declarations from the bottom of the reservoir up, every zone except the last must have a top.
+        Returns:
+            None (instantiates an instance of the Rule_Policy class)
+        '''
+        if not zones:
+            raise ValueError('A Rule_Policy requires at least one zone, causing an error.')
+        if any(z.top == None for z in zones[:-1]) or zones[-1].top != None:
+            raise ValueError(f'The top must be declared for every zone except the highest zone: {zones[-1].name}, causing an error.')
+        self._declared: Tuple[Zone_Release, ...] = tuple(zones)
+        self._zones = Zones([(z.name, z.top) for z in zones[:-1]], zones[-1].name)
+        self._release = np.array([seasonal_table(z.release) for z in zones])
+        self._above = np.array([seasonal_table(np.inf if z.above == None else z.above) for z in zones])
+        self._cap = np.array([np.inf if z.cap == None else float(z.cap) for z in zones])
+        self._isseasonal = any(not np.isscalar(x) for z in zones for x in [z.release, z.above] if x != None)
+        self._plans: Dict[int, Tuple[Sequence[Outlet], Dict[str, Any]]] = {}
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'Rule_Policy':
+        '''Builds a policy from the dictionary produced by to_dict().'''
+        return Rule_Policy([Zone_Release.from_dict(z) for z in d['zones']])
+    def to_dict(self) -> Dict[str, Any]:
+        '''Returns the policy declarations as a json serializable dictionary.'''
+        return {'zones': [z.to_dict() for z in self._declared]}
+    def __getstate__(self) -> Dict[str, Any]:
+        '''Pickles the compiled tables, without the outlet plans compiled by operate() calls.'''
+        return self.__dict__ | {'_plans': {}}
+
+    @property
+    def declared(self) -> Tuple[Zone_Release, ...]:
+        '''The zone declarations, from the bottom of the reservoir up.'''
+        return self._declared
+    @property
+    def zones(self) -> Zones:
+        '''The compiled zone boundaries.'''
+        return self._zones
+    @property
+    def isseasonal(self) -> bool:
+        '''True if a release or level target depends on the day of the water year (so timesteps must be dated), False otherwise.'''
+        return self._isseasonal
+
+    def compile(self, outlets: Sequence[Outlet]) -> Dict[str, Any]:
+        '''
+        Compiles the outlet rules for a set of outlets, raising a ValueError if a zone refers to an outlet that does not exist.
+        This is done once for each set of outlets passed to operate() or operate_batch().
+        Args:
+            outlets [Sequence[Outlet]]: the reservoir outlets, typically Reservoir.outlet_bank.
+        Returns:
+            A dictionary with the outlet names in location order: 'names', and for each zone: the (outlet, position, cap) tuples of its 'uncontrolled' and 'controlled' outlets.
+        '''
+        ordered = list(by_location(outlets))
+        index = {x.name: i for i, x in enumerate(ordered)}
+        def steps(z: Zone_Release, names: Tuple[str, ...]) -> List[Tuple[Outlet, int, float]]:
+            missing = [x for x in names if x not in index]
+            if missing:
+                raise ValueError(f'The zone: {z.name} uses the outlets: {missing}, which are not in the reservoir outlets: {list(index)}, causing an error.')
+            return [(ordered[index[x]], index[x], float(z.caps.get(x, np.inf))) for x in names]
+        return {'names': list(index), 'uncontrolled': [steps(z, z.uncontrolled) for z in self._declared], 'controlled': [steps(z, z.outlets) for z in self._declared]}
+    def _compiled(self, outlets: Sequence[Outlet]) -> Dict[str, Any]:
+        '''Returns the compiled plan for the outlets, cached for each set of outlets so that a policy shared by several reservoirs (e.g. in a network) compiles each set once.'''
+        cached = self._plans.get(id(outlets))
+        if cached == None or cached[0] is not outlets:
+            if len(self._plans) >= MAX_COMPILED_OUTLETS:
+                del self._plans[next(iter(self._plans))]
+            # the outlets are held with the plan, so their id is not reused by another set of outlets while the plan is cached.
+            cached = self._plans[id(outlets)] = (outlets, self.compile(outlets))
+        return cached[1]
+
+    def release(self, volume: float, dowy: int, outlets: Sequence[Outlet]) -> Dict[str, float]:
+        '''
+        Computes the releases for an available volume (storage + inflows - outflows).
+        Args:
+            volume [float]: the available volume.
+            dowy [int]: the day of the water year, ignored by policies that are not seasonal.
+            outlets [Sequence[Outlet]]: outlets from which releases are made.
+        Returns:
+            A Dict[str, float] with releases (values) labeled according the Outlet.name from which they are made.
+        '''
+        plan = self._compiled(outlets)
+        z = self._zones.index(volume)
+        target = self._release.item(z, dowy) + max(volume - self._above.item(z, dowy), 0.0)
+        releases = dict.fromkeys(plan['names'], 0.0)
+        for outlet, _, cap in plan['uncontrolled'][z]:
+            release = min(outlet.max_release(volume), cap)
+            releases[outlet.name] = release
+            volume, target = volume - release, target - release
+        target = min(target, self._cap.item(z))
+        for outlet, _, cap in plan['controlled'][z]:
+            if target <= 0:
+                break
+            release = min(target, outlet.max_release(volume), cap)
+            releases[outlet.name] = release
+            volume, target = volume - release, target - release
+        return releases
+    def operate(self, t: TimeStep, outlets: List[Outlet]) -> Dict[str, float]:
+        '''
+        Makes the declared releases for the zone containing the available volume (storage + inflows - outflows).
+
+        Args:
+            t [TimeStep]: data inputs used for operational rules, these must be dated if the policy is seasonal.
+            outlets [List[Outlet]]: outlets from which releases are made.
+        Returns:
+            A Dict[str, float] with releases (values) labeled according the Outlet.name from which they are made.
+        '''
+        return self.release(t.inflows() + t.storage() - t.outflows(), t.calendar.dowy if self._isseasonal else 1, outlets)
+    def operate_batch(self, states: Dict[str, np.ndarray], outlets: OutletBank) -> Dict[str, np.ndarray]:
+        '''
+        Makes the operate() releases for many states at once (see Operations.operate_batch()).
+        '''
+        plan = self._compiled(outlets)
+        volume = np.asarray(states['inflow'] + states['storage'] - states['outflow'], dtype=float)
+        dowy = np.asarray(states['dowy'], dtype=int) if self._isseasonal else 1
+        z = self._zones.indices(volume)
+        target = self._release[z, dowy] + np.maximum(volume - self._above[z, dowy], 0.0)
+        releases = np.zeros((len(plan['names']),) + volume.shape)
+        for k in np.unique(z).tolist():
+            isin = z == k
+            v, tk = volume[isin], target[isin]
+            for _, i, cap in plan['uncontrolled'][k]:
+                release = np.minimum(_max_release(outlets, i, v), cap)
+                releases[i, isin] = release
+                v, tk = v - release, tk - release
+            tk = np.minimum(tk, self._cap[k])
+            for _, i, cap in plan['controlled'][k]:
+                release = np.where(tk > 0, np.minimum(np.minimum(_max_release(outlets, i, v), cap), tk), 0.0)
+                releases[i, isin] = release
+                v, tk = v - release, tk - release
+        return {name: releases[i] for i, name in enumerate(plan['names'])}
+
+def _max_release(outlets: Sequence[Outlet], i: int, volume: np.ndarray) -> np.ndarray:
+    '''The max releases of the i-th outlet (in location order) for an array of volumes, vectorized if the outlets are an OutletBank.'''
+    if isinstance(outlets, OutletBank):
+        return outlets.max_release(i, volume)
+    outlet = by_location(outlets)[i]
+    return np.array([outlet.max_release(v) for v in volume.tolist()], dtype=float)
@@ -0,0 +1,63 @@
+#region Header
+# %% [markdown]
+# # Scenarios
+# This file provides a runner for independent simulation scenarios, which are farmed out to a pool of worker processes.
+# Scenario reservoirs, operations policies and timeseries are pickled and sent to the workers, so they must be built from picklable parts:
+# module level functions, bound methods (e.g. Rule_Curve.operate) and the callable objects returned by the utilities.f_* functions, but not lambdas or nested functions.
+#
+# Author: John Kucharski | Date: 16 October 2026
+#
+# Status: open
+# Testing: partial
+#endregion
+
+#region Dependencies
+#%%
+import sys
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Callable, Union, Iterable, Iterator, Any
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.data import TimeStep, TimeSeries
+from src.outlet import Outlet
+from src.reservoir import Reservoir
+from src.simulation import Simulation, Retention
+#endregion
+
+#%%
+@dataclass
+class Scenario:
+    '''A single simulation job.'''
+    name: str
+    '''Labels the scenario result.'''
+    reservoir: Reservoir
+    '''The reservoir to simulate.'''
+    f_operations: Callable[[TimeStep, List[Outlet]], Dict[str, float]]
+    '''The operations policy, it must be picklable (e.g. a module level function or a bound method).'''
+    timeseries: TimeSeries
+    '''The simulation inputs.'''
+    retention: Union[Retention, None] = None
+    '''The simulation results to keep (see Simulation.simulate()), every result is kept by default.'''
+
+    def run(self) -> Tuple[str, Any]:
+        '''Simulates the scenario and returns the scenario name and simulation result.'''
+        return self.name, Simulation(self.timeseries, self.reservoir, self.f_operations).simulate(retention=self.retention)
+
+def run_scenario(scenario: Scenario) -> Tuple[str, Any]:
+    '''The job run by the worker processes, see Scenario.run().'''
+    return scenario.run()
+
+def run_scenarios(scenarios: Iterable[Scenario], max_workers: Union[int, None] = None) -> Iterator[Tuple[str, Any]]:
+    '''
+    Simulates scenarios in a pool of worker processes.
+    Args:
+        scenarios [Iterable[Scenario]]: the scenarios to simulate, each scenario is pickled and sent to a worker process.
+        max_workers [int]: the number of worker processes, the number of processors on the machine by default.
+    Returns:
+        An iterator of (scenario name, simulation result) pairs, in the order that the scenarios finish.
+    '''
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_scenario, x) for x in scenarios]
+        for future in as_completed(futures):
+            yield future.result()
@@ -15,8 +15,12 @@
 from ast import Call, Or
 import sys
 import copy
+import time
+import datetime
 from dataclasses import dataclass
-from typing import List, Dict, Tuple, Callable, Union
+from collections import deque
+from collections.abc import Sequence
+from typing import List, Dict, Tuple, Callable, Union, Iterable, Iterator, Deque, Any, Protocol
 
 import numpy as np
 import pandas as pd
@@ -29,6 +33,7 @@ from src.reservoir import Reservoir
 
 import src.operations as operations
 import src.utilities as utilities
+import src.engine as engine
 #endregion 
                        
 #%%
@@ -58,14 +63,199 @@ import src.utilities as utilities
     
 #     def run(self, input: Input) -> Any:
 #         return self._fn(input)    
+class Retention(Protocol):
+    '''
+    Provides an interface for the simulation results kept by Simulation.simulate().
+    '''
+    def add(self, t: TimeStep) -> None:
+        '''Receives each simulated timestep, in order, as soon as it is computed.'''
+    def result(self) -> Any:
+        '''Returns the retained results once the simulation is complete.'''
+class KeepAll:
+    '''Retains every simulated timestep, the result is a TimeSeries.'''
+    def __init__(self) -> None:
+        self._timesteps: List[TimeStep] = []
+    def add(self, t: TimeStep) -> None:
+        self._timesteps.append(t)
+    def result(self) -> TimeSeries:
+        return TimeSeries(self._timesteps)
+class KeepVariables:
+    '''Retains the named variables as arrays, the result is a Dict[str, np.ndarray] with the timestep dates listed under the 'date' key.'''
+    def __init__(self, names: List[str], n: int = 1024) -> None:
+        '''
+        Args:
+            names [List[str]]: the names of the retained input variables, timesteps without the variable are given a nan value.
+            n [int]: the initial length of the arrays, which are doubled in length when they are filled. 1024 by default.
+        '''
+        self._names = names
+        self._n = 0
+        self._dates: List[Union[datetime.date, int]] = []
+        self._values: Dict[str, np.ndarray] = {k: np.full(max(n, 1), np.nan) for k in names}
+    def add(self, t: TimeStep) -> None:
+        if self._names and self._n == len(self._values[self._names[0]]):
+            self._values = {k: np.concatenate([v, np.full(len(v), np.nan)]) for k, v in self._values.items()}
+        for k in self._names:
+            if k in t.inputs:
+                self._values[k][self._n] = t.inputs[k].value
+        self._dates.append(t.date)
+        self._n += 1
+    def result(self) -> Dict[str, np.ndarray]:
+        return {'date': np.array(self._dates)} | {k: v[:self._n].copy() for k, v in self._values.items()}
+@dataclass
+class Summary:
+    '''Running summary statistics for a single variable.'''
+    count: int = 0
+    '''The number of values.'''
+    total: float = 0.0
+    '''The sum of the values.'''
+    mean: float = 0.0
+    '''The mean of the values.'''
+    minimum: float = np.inf
+    '''The smallest value.'''
+    maximum: float = -np.inf
+    '''The largest value.'''
+    m2: float = 0.0
+    '''The sum of squared differences from the mean (Welford's algorithm), used to compute the variance.'''
+    def add(self, x: float) -> None:
+        '''Updates the statistics with the value x, nan values are ignored.'''
+        if x != x: 
+            return
+        self.count += 1
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.minimum, self.maximum = min(self.minimum, x), max(self.maximum, x)
+    @property
+    def variance(self) -> float:
+        '''The sample variance of the values.'''
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+class KeepSummary:
+    '''Retains running summary statistics in constant memory, the result is a Dict[str, Summary] with entries for the 'inflow', 'outflow' and 'storage' sums and each named variable.'''
+    def __init__(self, names: Union[List[str], None] = None) -> None:
+        '''
+        Args:
+            names [List[str]]: optional names of additional input variables to summarize.
+        '''
+        self._names = [] if names == None else names
+        self._summaries: Dict[str, Summary] = {k: Summary() for k in ['inflow', 'outflow', 'storage'] + self._names}
+    def add(self, t: TimeStep) -> None:
+        self._summaries['inflow'].add(t.inflows())
+        self._summaries['outflow'].add(t.outflows())
+        self._summaries['storage'].add(t.storage())
+        for k in self._names:
+            if k in t.inputs:
+                self._summaries[k].add(t.inputs[k].value)
+    def result(self) -> Dict[str, Summary]:
+        return self._summaries
+class Window(Sequence):
+    '''
+    The simulated timesteps passed to the Output functions by Simulation.stream(), indexed by their position in the simulation (so ts[t] is always the current timestep).
+    Only the most recent timesteps (from start) are held: indexing a timestep that has left the window raises an IndexError, slices (e.g. ts[:t]) are clamped to the held timesteps,
+    and iteration, reversed() and index() cover only the held timesteps. len() is the number of timesteps simulated so far, including those that have left the window.
+    '''
+    __slots__ = ('_steps', '_start')
+    def __init__(self) -> None:
+        self._steps: List[TimeStep] = []
+        self._start: int = 0
+    @property
+    def start(self) -> int:
+        '''The index of the earliest timestep held in the window.'''
+        return self._start
+    def _index(self, t: int) -> int:
+        i = t - self._start if t >= 0 else len(self._steps) + t
+        if not 0 <= i < len(self._steps):
+            raise IndexError(f'The timestep: {t} is outside of the window: [{self._start}, {len(self)}), causing an error.')
+        return i
+    def __len__(self) -> int:
+        return self._start + len(self._steps)
+    def __getitem__(self, t: Union[int, slice]) -> Union[TimeStep, List[TimeStep]]:
+        if isinstance(t, slice):
+            return [self._steps[i - self._start] for i in range(*t.indices(len(self))) if i >= self._start]
+        return self._steps[self._index(t)]
+    def __setitem__(self, t: int, step: TimeStep) -> None:
+        self._steps[self._index(t)] = step
+    def __iter__(self) -> Iterator[TimeStep]:
+        return iter(self._steps)
+    def __reversed__(self) -> Iterator[TimeStep]:
+        return reversed(self._steps)
+    def index(self, step: TimeStep, *args) -> int:
+        '''Returns the position in the simulation of a held timestep.'''
+        return self._start + self._steps.index(step, *[max(0, i - self._start) for i in args])
+    def append(self, step: TimeStep) -> None:
+        self._steps.append(step)
+    def trim(self, n: int) -> None:
+        '''Drops the earliest timesteps, so that at most n timesteps are held.'''
+        drop = len(self._steps) - n
+        if drop > 0:
+            del self._steps[:drop]
+            self._start += drop
+@dataclass
+class Phase:
+    '''The wall time and number of calls recorded for a part of the simulation.'''
+    calls: int = 0
+    seconds: float = 0.0
+    @property
+    def mean(self) -> float:
+        return self.seconds / self.calls if self.calls else 0.0
+class Profile:
+    '''
+    Records the wall time and call counts for each phase of a simulation, and for each named Output.
+    The phases are: PRE_OPERATIONS and POST_OPERATIONS outputs, OPERATIONS (the operations function), ADD_INPUTS (TimeStep copies made by TimeStep.addinputs()),
+    UPDATE_STORAGE, ENGINE (simulations run by the array engine, see engine.simulate()) and PRECOMPUTE_OUTPUTS (outputs computed before the simulation loop, see Simulation.prepare()).
+    '''
+    PRE_OPERATIONS = 'pre_operations'
+    OPERATIONS = 'operations'
+    POST_OPERATIONS = 'post_operations'
+    ADD_INPUTS = 'add_inputs'
+    UPDATE_STORAGE = 'update_storage'
+    ENGINE = 'engine'
+    PRECOMPUTE_OUTPUTS = 'precompute_outputs'
+    def __init__(self) -> None:
+        self.phases: Dict[str, Phase] = {}
+        self.outputs: Dict[str, Phase] = {}
+    def record(self, phase: str, start: float, output: Union[str, None] = None) -> float:
+        '''Adds the time since start to the phase (and named output), returning the current time so that it can be used to start the next phase.'''
+        end = time.perf_counter()
+        for d, k in ((self.phases, phase), (self.outputs, output)):
+            if k != None:
+                x = d.get(k) or d.setdefault(k, Phase())
+                x.calls += 1
+                x.seconds += end - start
+        return end
+    @staticmethod
+    def now() -> float:
+        '''Returns the current time, used to start the first phase.'''
+        return time.perf_counter()
+    def report(self) -> Dict[str, Any]:
+        '''Returns the recorded times as a dictionary: {'seconds': total, 'phases': {phase: {'calls', 'seconds', 'mean'}}, 'outputs': {name: {'calls', 'seconds', 'mean'}}}.'''
+        def summarize(d: Dict[str, Phase]) -> Dict[str, Dict[str, float]]:
+            return {k: {'calls': v.calls, 'seconds': v.seconds, 'mean': v.mean} for k, v in d.items()}
+        return {'seconds': sum(v.seconds for v in self.phases.values()), 'phases': summarize(self.phases), 'outputs': summarize(self.outputs)}
+class _Unprofiled:
+    '''Stands in for a Profile in simulations that are not profiled, so that the same step function runs without timing each phase.'''
+    @staticmethod
+    def now() -> float:
+        return 0.0
+    @staticmethod
+    def record(phase: str, start: float, output: Union[str, None] = None) -> float:
+        return start
+_UNPROFILED = _Unprofiled()
 class Simulation(object):
     '''
     A simulation container holds the input needed for a simulation. 
     '''
-    def __init__(self, timeseries: TimeSeries, reservoir = Reservoir(), operations = Callable[[TimeStep, List[Outlet]], Dict[str, float]]):
+    def __init__(self, timeseries: TimeSeries, reservoir = Reservoir(), operations = Callable[[TimeStep, List[Outlet]], Dict[str, float]], profile: bool = False):
         self._reservoir: Reservoir = reservoir
         self._timeseries: TimeSeries = timeseries
         self._operations: Callable[[Dict[str, Input], List[Outlet]], Dict[str, float]] = operations
+        self._storage_key: Union[str, None] = timeseries.storage_key if timeseries != None else None
+        self.profile: Union[Profile, None] = Profile() if profile else None
+        '''
+        The Profile of the last simulation if the Simulation was created with profile=True, None otherwise.
+        Unprofiled simulations run the same step function, which records each phase through a no-op stand-in (a few empty calls per timestep) rather than a Profile.
+        '''
+        self._prepared: Union[TimeSeries, None] = None
         #self.result: Union[TimeSeries, None] = None
     @property    
     def reservoir(self):
@@ -79,11 +269,19 @@ class Simulation(object):
     # @result.setter
     # def result(self, result: Union[TimeSeries, None]):
     #     self._result = result
+    def prepare(self) -> TimeSeries:
+        '''
+        Returns the simulation timeseries with the outputs that only read exogenous inputs computed for the full record (see Output.reads and TimeSeries.precompute_outputs()), 
+        so that only the outputs that depend on the simulated storage and releases are computed in the simulation loop. This is done once, on first use.
+        '''
+        if self._prepared is None:
+            self._prepared = self.timeseries.precompute_outputs(self.reservoir.outlet_bank.names)
+        return self._prepared
     def operate(self, ts: TimeStep) -> TimeStep:
-        return ts.addinputs({k: Input(value=v, category=Category.OUTFLOW, isoutput=True) for k, v in self._operations(ts, self.reservoir.outlets).items()})
+        return ts.addinputs({k: Input(value=v, category=Category.OUTFLOW, isoutput=True) for k, v in self._operations(ts, self.reservoir.outlet_bank).items()})
     def update_storage(self, ts: TimeStep) -> Input:
         '''Computes storage and returns it as an input for the simulate function to incorporate into the next timestep in the timeseries.'''
-        return {self.timeseries.storage_key: Input(value=ts.inflows() + ts.storage() - ts.outflows(), category=Category.STORAGE, isoutput=True)}
+        return {self._storage_key: Input(value=ts.inflows() + ts.storage() - ts.outflows(), category=Category.STORAGE, isoutput=True)}
     # def _run_timestep(self, ts: TimeStep) -> Tuple[TimeStep, Dict[str, Input]]:
     #     '''Mutates the current timestep and returns inputs for the simulate function to incorporate into the next timestep in the timeseries.'''
     #     if ts.outputs:
@@ -96,13 +294,83 @@ class Simulation(object):
     #     else:
     #         ts = self._run_operations(ts)
     #     return ts
-    def simulate(self) -> TimeSeries:
-        ts: List[TimeStep] = []
+    def simulate(self, retention: Union['Retention', None] = None, window: Union[int, None] = None, arrays: Union[bool, None] = None) -> Any:
+        '''
+        Runs the simulation.
+        Args:
+            retention [Retention]: the simulation results to keep, KeepAll() by default (see KeepVariables() and KeepSummary() for bounded memory alternatives).
+            window [int]: the number of simulated timesteps (including the current one) that outputs can look back on (see stream()). By default all timesteps are kept when every result is retained and 2 are kept otherwise.
+            arrays [bool]: True to run the simulation with the array engine (see engine.simulate()), False to step through TimeStep objects. By default the array engine is used when every result is retained and the engine supports the simulation. True can not be combined with a retention.
+        Returns:
+            The result of the retention policy, a TimeSeries by default.
+        '''
+        if self.profile != None:
+            self.profile = Profile()
+            if self._prepared is None:
+                start = time.perf_counter()
+                if self.prepare() is not self.timeseries:
+                    self.profile.record(Profile.PRECOMPUTE_OUTPUTS, start)
+        if arrays and retention != None:
+            raise ValueError('The array engine returns every result, so it can not be run with a retention policy, causing an error.')
+        timeseries = self.prepare()
+        if arrays or arrays == None and retention == None and engine.supports(timeseries, self.reservoir, self._operations):
+            start = time.perf_counter()
+            result = engine.simulate(timeseries, self.reservoir, self._operations)
+            if self.profile != None:
+                self.profile.record(Profile.ENGINE, start)
+            return result
+        retention = KeepAll() if retention == None else retention
+        if window == None and not isinstance(retention, KeepAll): window = 2
+        for t in self.stream(window=window):
+            retention.add(t)
+        return retention.result()
+    def stream(self, timesteps: Union[Iterable[TimeStep], None] = None, window: Union[int, None] = 2) -> Iterator[TimeStep]:
+        '''
+        Runs the simulation, yielding each simulated timestep as soon as it is computed.
+        Args:
+            timesteps [Iterable[TimeStep]]: the timesteps to simulate, the Simulation timeseries (with outputs precomputed where possible, see prepare()) by default.
+            window [int]: the number of simulated timesteps (including the current one) that outputs can look back on, 2 by default. None keeps every timestep.
+                Outputs receive a Window, which is indexed by the position of the timestep in the simulation, so ts[t] is the current timestep and ts[t - window] raises an IndexError.
+        Returns:
+            A generator of simulated timesteps.
+        '''
+        ts = Window()
         newinputs: Dict[str, Input] = {}
-        for t in range(len(self.timeseries.timesteps)):
-            ts.append(self.timeseries.timesteps[t] if t == 0 else self.timeseries.timesteps[t].addinputs(newinputs))
+        profile = _UNPROFILED if self.profile == None else self.profile
+        for timestep in self.prepare().timesteps if timesteps == None else timesteps:
+            t = len(ts)
+            if t == 0 and not newinputs:
+                ts.append(timestep)
+            else:
+                start = profile.now()
+                ts.append(timestep.addinputs(newinputs))
+                profile.record(Profile.ADD_INPUTS, start)
             ts, newinputs = self._stepforward(ts, t, newinputs)
-        return TimeSeries(ts)    
+            yield ts[t]
+            if window != None:
+                ts.trim(window - 1)
+    def simulate_chunks(self, chunks: Iterable[TimeSeries], window: int = 2) -> Iterator[TimeSeries]:
+        '''
+        Simulates a timeseries that arrives in chunks (e.g. from data.read_csv()), each chunk is consumed as it arrives so only one chunk of inputs and results is held in memory.
+        Args:
+            chunks [Iterable[TimeSeries]]: consecutive pieces of the timeseries, the first must contain the initial storage.
+            window [int]: the number of simulated timesteps (including the current one) that outputs can look back on, 2 by default.
+        Returns:
+            A generator yielding the simulated TimeSeries for each chunk. 
+        '''
+        sizes: Deque[int] = deque()
+        def timesteps() -> Iterator[TimeStep]:
+            for chunk in chunks:
+                self._storage_key = chunk.storage_key
+                sizes.append(len(chunk))
+                yield from chunk.timesteps
+        results: List[TimeStep] = []
+        for t in self.stream(timesteps(), window):
+            results.append(t)
+            if len(results) == sizes[0]:
+                sizes.popleft()
+                yield TimeSeries(results)
+                results = []
         #     if ts[t].outputs: # then there are outputs to compute
         #         ispreops = True
         #         for output in ts[t].outputs.values():
@@ -117,21 +385,33 @@ class Simulation(object):
         #         ts[t] = self.operate(ts[t])
         #     newinputs = newinputs | self.update_storage(ts[t])
         # return TimeSeries(ts)
-    def _stepforward(self, ts: List[TimeStep], t: int, newinput: Dict[str, Input], factor: float = 1) -> Tuple[List[TimeStep], Dict[str, Input]]:
-        if ts[t].outputs: # then there are outputs to compute
-            ispreops = True
-            for output in ts[t].outputs.values():
-                if output.runorder == RunOrder.PRE_OPERATIONS: 
-                    ts[t] = ts[t].addinputs(output.run(ts, t))
-                if output.runorder == RunOrder.POST_OPERATIONS:
-                    if ispreops: # then operate
-                        ts[t] = self.operate(ts[t])
-                        ispreops = False
-                    newinputs = newinput | output.run(ts, t)
-        else: # only operate
-            ts[t] = self.operate(ts[t])
+    def _stepforward(self, ts: Window, t: int, newinput: Dict[str, Input], factor: float = 1) -> Tuple[Window, Dict[str, Input]]:
+        profile = _UNPROFILED if self.profile == None else self.profile
+        start = profile.now()
+        ispreops = True
+        for name, output in ts[t].outputs.items():
+            if output.runorder == RunOrder.PRE_OPERATIONS:
+                inputs = output.run(ts, t)
+                start = profile.record(Profile.PRE_OPERATIONS, start, name)
+                ts[t] = ts[t].addinputs(inputs)
+                start = profile.record(Profile.ADD_INPUTS, start)
+            if output.runorder == RunOrder.POST_OPERATIONS:
+                if ispreops: # then operate
+                    start = self._operate(ts, t, profile, start)
+                    ispreops = False
+                newinput = newinput | output.run(ts, t)
+                start = profile.record(Profile.POST_OPERATIONS, start, name)
+        if ispreops: # then there were no post operations outputs
+            start = self._operate(ts, t, profile, start)
         newinputs = newinput | self.update_storage(ts[t])
+        profile.record(Profile.UPDATE_STORAGE, start)
         return ts, newinputs
+    def _operate(self, ts: Window, t: int, profile: Union[Profile, '_Unprofiled'], start: float) -> float:
+        '''Adds the releases from the operations function to the current timestep, returning the time recorded by the profile.'''
+        releases = self._operations(ts[t], self.reservoir.outlet_bank)
+        start = profile.record(Profile.OPERATIONS, start)
+        ts[t] = ts[t].addinputs({k: Input(value=v, category=Category.OUTFLOW, isoutput=True) for k, v in releases.items()})
+        return profile.record(Profile.ADD_INPUTS, start)
                         
              
         
@@ -0,0 +1,164 @@
+#region Header
+# %% [markdown]
+# # Benchmarks
+# This file times the simulation hot paths on synthetic reservoirs and timeseries and reports throughput (steps per second) and peak memory as json,
+# so that results from different commits (or package versions) can be compared. It is not collected by the unit tests, run it as a script:
+#
+#   python -m src.tests.benchmark --quick
+#   python -m src.tests.benchmark --steps 1000 1000000 --outlets 1 50 --outputs 0 10 --output results.json
+#
+# Each case is timed without tracemalloc (seconds, steps_per_second), then run once more with tracemalloc to measure the peak memory (peak_bytes).
+# Inputs are generated from a seeded random number generator so the runs are reproducible.
+#
+# Author: John Kucharski | Date: 16 October 2026
+#
+# Status: open
+# Testing: n/a
+#endregion
+
+#region Dependencies
+#%%
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import itertools
+import tracemalloc
+from typing import List, Dict, Callable, Union, Any
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+import src.data as data
+import src.operations as operations
+import src.simulation as simulation
+from src.outlet import Outlet
+from src.reservoir import Reservoir
+#endregion
+
+#%%
+STEPS = [1000, 10000, 100000, 1000000]
+'''The default simulation horizons.'''
+OUTLETS = [1, 10, 50]
+'''The default number of reservoir outlets.'''
+OUTPUTS = [0, 1, 10]
+'''The default number of Output extensions.'''
+QUICK = {'steps': [1000, 10000], 'outlets': [1, 10], 'outputs': [0, 1]}
+'''The smaller grid run with the --quick option.'''
+CAPACITY = 100.0
+'''The capacity of the synthetic reservoirs.'''
+
+def synthetic_reservoir(outlets: int) -> Reservoir:
+    '''A reservoir with the number of outlets evenly spaced between the bottom and top of the reservoir.'''
+    return Reservoir(capacity=CAPACITY, outlets=[Outlet(f'outlet_{i}', CAPACITY * i / outlets) for i in range(outlets)])
+def synthetic_dataframe(steps: int, seed: int = 0) -> pd.DataFrame:
+    '''A daily inflow record starting on 1 October 2000, with a initial storage of half the reservoir capacity.'''
+    rng = np.random.default_rng(seed)
+    storage = np.full(steps, np.nan)
+    storage[0] = CAPACITY / 2
+    return pd.DataFrame({'inflow': rng.gamma(2, 3, steps), 'storage': storage}, index=pd.date_range('2000-10-01', periods=steps, freq='D'))
+def synthetic_outputs(outputs: int) -> Dict[str, data.Output]:
+    '''Output extensions that alternate between pre and post operations runorders.'''
+    def output(name: str) -> Callable[[List[data.TimeStep], int], Dict[str, float]]:
+        return lambda ts, t: {name: ts[t].inflows() / 2}
+    runorders = [data.RunOrder.PRE_OPERATIONS, data.RunOrder.POST_OPERATIONS]
+    return {f'output_{i}': data.Output(output(f'output_{i}'), data.Category.OTHER, runorders[i % 2]) for i in range(outputs)}
+def synthetic_timeseries(steps: int, outputs: int = 0, seed: int = 0) -> data.TimeSeries:
+    return data.TimeSeries.from_dataframe(synthetic_dataframe(steps, seed), synthetic_outputs(outputs) if outputs else None)
+def synthetic_rule_curve() -> operations.Rule_Curve:
+    return operations.Rule_Curve([(datetime.datetime(2021, 10, 1), 0.4 * CAPACITY), (datetime.datetime(2022, 4, 1), 0.4 * CAPACITY), (datetime.datetime(2022, 6, 1), 0.8 * CAPACITY)])
+
+#%%
+def measure(f: Callable[[], Any], repeat: int = 1) -> Dict[str, float]:
+    '''Returns the fastest wall time of repeat calls to f, and the peak memory allocated by one more call to f.'''
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    f()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak}
+def record(benchmark: str, steps: int, f: Callable[[], Any], repeat: int = 1, **parameters) -> Dict[str, Any]:
+    result = measure(f, repeat)
+    return {'benchmark': benchmark, 'steps': steps} | parameters | result | {'steps_per_second': steps / result['seconds'] if result['seconds'] > 0 else np.inf}
+
+def bench_simulate(steps: int, outlets: int, outputs: int, repeat: int = 1) -> Dict[str, Any]:
+    '''Times Simulation.simulate(), which uses the array engine when there are no outputs.'''
+    sim = simulation.Simulation(synthetic_timeseries(steps, outputs), synthetic_reservoir(outlets), operations.passive_operations)
+    engine = outputs == 0
+    return record('simulate', steps, sim.simulate, repeat, outlets=outlets, outputs=outputs, engine=engine)
+def bench_from_dataframe(steps: int, outputs: int, repeat: int = 1) -> Dict[str, Any]:
+    '''Times TimeSeries.from_dataframe().'''
+    df, extensions = synthetic_dataframe(steps), synthetic_outputs(outputs) if outputs else None
+    return record('from_dataframe', steps, lambda: data.TimeSeries.from_dataframe(df, extensions), repeat, outputs=outputs)
+def bench_target_volume(steps: int, repeat: int = 1) -> Dict[str, Any]:
+    '''Times Rule_Curve.target_volume() over every day of the water year, repeated to fill the horizon.'''
+    curve, days = synthetic_rule_curve(), [1 + t % 365 for t in range(steps)]
+    return record('target_volume', steps, lambda: [curve.target_volume(d) for d in days], repeat)
+def bench_optimize(steps: int, outlets: int, repeat: int = 1) -> Dict[str, Any]:
+    '''Times Optimization.optimize() for a simple policy tree, or reports why it was skipped (e.g. the optional ptreeopt package is not installed).'''
+    try:
+        import ptreeopt
+        from src.optimization import Optimization
+    except ImportError as e:
+        return {'benchmark': 'optimize', 'steps': steps, 'outlets': outlets, 'skipped': str(e)}
+    sim = simulation.Simulation(synthetic_timeseries(steps), synthetic_reservoir(outlets), operations.passive_operations)
+    model = Optimization(sim, {'storage': ['<', CAPACITY]}, {'storage': (0, CAPACITY)}, [0.5, 1.0])
+    tree = ptreeopt.PTree([[0, CAPACITY / 2], 0.5, 1.0])
+    return record('optimize', steps, lambda: model.optimize(tree), repeat, outlets=outlets)
+
+#%%
+def run(steps: List[int] = STEPS, outlets: List[int] = OUTLETS, outputs: List[int] = OUTPUTS, repeat: int = 1,
+        timestep_limit: Union[int, None] = 100000) -> Dict[str, Any]:
+    '''
+    Runs the benchmark grid.
+    Args:
+        steps [List[int]]: the simulation horizons.
+        outlets [List[int]]: the number of reservoir outlets.
+        outputs [List[int]]: the number of Output extensions.
+        repeat [int]: the number of timed runs of each case, the fastest is reported.
+        timestep_limit [int]: the longest horizon simulated with TimeStep objects (i.e. with outputs or by Optimization.optimize()), None for no limit.
+    Returns:
+        A json serializable dictionary with a 'machine' description and a list of 'results'.
+    '''
+    results = []
+    for n in steps:
+        results.append(bench_target_volume(n, repeat))
+        for k in outputs:
+            results.append(bench_from_dataframe(n, k, repeat))
+        for m, k in itertools.product(outlets, outputs):
+            if k == 0 or timestep_limit == None or n <= timestep_limit:
+                results.append(bench_simulate(n, m, k, repeat))
+        if timestep_limit == None or n <= timestep_limit:
+            results.extend(bench_optimize(n, m, repeat) for m in outlets)
+    machine = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(), 'processor': platform.processor(),
+               'date': datetime.datetime.now().isoformat(timespec='seconds')}
+    return {'machine': machine, 'results': results}
+
+def main(args: Union[List[str], None] = None) -> None:
+    parser = argparse.ArgumentParser(description='Times Simulation.simulate(), TimeSeries.from_dataframe(), Rule_Curve.target_volume() and Optimization.optimize(), printing json results.')
+    parser.add_argument('--steps', type=int, nargs='+', default=STEPS)
+    parser.add_argument('--outlets', type=int, nargs='+', default=OUTLETS)
+    parser.add_argument('--outputs', type=int, nargs='+', default=OUTPUTS)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timestep-limit', type=int, default=100000, help='the longest horizon simulated with TimeStep objects, 0 for no limit.')
+    parser.add_argument('--quick', action='store_true', help='runs a small grid, overriding the steps, outlets and outputs arguments.')
+    parser.add_argument('--output', type=str, default=None, help='a json file path, the results are printed by default.')
+    options = parser.parse_args(args)
+    grid = QUICK if options.quick else {'steps': options.steps, 'outlets': options.outlets, 'outputs': options.outputs}
+    report = run(**grid, repeat=options.repeat, timestep_limit=options.timestep_limit or None)
+    text = json.dumps(report, indent=2, default=float)
+    if options.output == None:
+        print(text)
+    else:
+        with open(options.output, 'w') as f:
+            f.write(text)
+
+if __name__ == '__main__':
+    main()
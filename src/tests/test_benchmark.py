@@ -0,0 +1,34 @@
+#region Header
+# %% [markdown]
+# # Unit Tests for benchmark.py
+# 
+# Author: John Kucharski | Date: 16 Oct 2026
+# 
+# Status: open 
+# Testing: n/a
+#endregion
+
+#region Dependencies
+# %%
+import sys
+import json
+import unittest
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+import src.tests.benchmark as benchmark
+#endregion
+
+#%%
+class Test_Benchmark(unittest.TestCase):
+    def test_run_reports_every_case_as_json(self):
+        report = json.loads(json.dumps(benchmark.run(steps=[50], outlets=[1, 3], outputs=[0, 2]), default=float))
+        names = [x['benchmark'] for x in report['results']]
+        self.assertEqual(names.count('simulate'), 4)
+        self.assertEqual(names.count('from_dataframe'), 2)
+        self.assertEqual(names.count('optimize'), 2)
+        for x in report['results']:
+            if 'skipped' not in x:
+                self.assertGreater(x['steps_per_second'], 0)
+                self.assertGreater(x['peak_bytes'], 0)
+    def test_synthetic_reservoir_has_evenly_spaced_outlets(self):
+        self.assertListEqual(sorted(x.location for x in benchmark.synthetic_reservoir(4).outlets), [0, 25, 50, 75])
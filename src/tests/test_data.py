@@ -11,13 +11,17 @@
 #region Dependencies
 # %%
 import sys
+import decimal
 import unittest
+import pathlib
 import datetime
 
 import numpy as np
+import pandas as pd
 
 sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
 import src.data as data
+import src.utilities as utilities
 #endregion
 
 #%%
@@ -38,3 +42,185 @@ class Test_Data(unittest.TestCase):
     def test_to_dict_default_with_additional_input_marked_as_output_is_represed(self):
          test_obj = data.Input(datetime.datetime(2021, 9, 10), 10, additional_inputs= {'temp': data.Additional_Input(72), 'salinity': data.Additional_Input(2, output=True)})
          self.assertEqual(test_obj.to_dict(), {'date': test_obj.date.strftime("%d %b %Y"), 'inflow': 10, 'storage': np.NaN, 'temp': 72})     
+
+#%%
+class Test_TimeSeries(unittest.TestCase):
+    def timeseries(self) -> data.TimeSeries:
+        return data.TimeSeries([
+            data.TimeStep(datetime.date(2021, 9, 10), inputs={'inflow': data.Input(1), 'storage': data.Input(5, category=data.Category.STORAGE)}),
+            data.TimeStep(datetime.date(2021, 9, 11), inputs={'inflow': data.Input(2), 'outflow': data.Input(1, category=data.Category.OUTFLOW)}),
+            data.TimeStep(datetime.date(2021, 9, 12), inputs={'inflow': data.Input(3), 'season': data.Input('fall', category=data.Category.OTHER)})])
+    def test_columns_store_one_array_per_variable(self):
+        ts = self.timeseries()
+        self.assertListEqual(ts.variables, ['inflow', 'storage', 'outflow', 'season'])
+        self.assertListEqual(list(ts.input('inflow')), [1, 2, 3])
+    def test_inflows_outflows_storage_return_sums_by_timestep(self):
+        ts = self.timeseries()
+        self.assertListEqual(list(ts.inflows()), [1, 2, 3])
+        self.assertListEqual(list(ts.outflows()), [0, 1, 0])
+        self.assertListEqual(list(ts.storage()), [5, 0, 0])
+    def test_storage_key_is_found_in_first_timestep(self):
+        self.assertEqual(self.timeseries().storage_key, 'storage')
+    def test_timestep_view_returns_only_present_inputs(self):
+        t = self.timeseries().timesteps[2]
+        self.assertTrue(t.isview)
+        self.assertListEqual(list(t.inputs.keys()), ['inflow', 'season'])
+        self.assertEqual(t.inputs['season'].value, 'fall')
+        self.assertEqual(t.inflows(), 3)
+    def test_timestep_view_addinputs_does_not_change_timeseries(self):
+        ts = self.timeseries()
+        t = ts.timesteps[1].addinputs({'storage': data.Input(7, category=data.Category.STORAGE)})
+        self.assertFalse(t.isview)
+        self.assertEqual(t.storage(), 7)
+        self.assertEqual(ts.timesteps[1].storage(), 0)
+    def test_from_columns_matches_timesteps(self):
+        ts = data.TimeSeries.from_columns([0, 1], {'inflow': [1, 2], 'storage': [5, np.nan]}, {'inflow': data.Category.INFLOW, 'storage': data.Category.STORAGE})
+        self.assertEqual(len(ts), 2)
+        self.assertEqual(ts.timesteps[1].inflows(), 2)
+        self.assertEqual(ts.timesteps[0].print(), '0 (inflow: 1, storage: 5.0)')
+    def test_with_columns_adds_variables_without_copying(self):
+        ts = data.TimeSeries.from_columns([0, 1], {'inflow': np.array([1.0, 2.0]), 'storage': [5, np.nan]}, {'inflow': data.Category.INFLOW, 'storage': data.Category.STORAGE})
+        added = ts.with_columns({'upstream': np.array([3.0, 4.0])}, {'upstream': data.Category.INFLOW})
+        self.assertListEqual(added.variables, ['inflow', 'storage', 'upstream'])
+        self.assertListEqual(added.inflows().tolist(), [4.0, 6.0])
+        self.assertIs(added.input('inflow'), ts.input('inflow'))
+        self.assertNotIn('upstream', ts.variables)
+    def test_timestep_with_two_storage_inputs_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            data.TimeStep(0, inputs={'a': data.Input(1, category=data.Category.STORAGE), 'b': data.Input(1, category=data.Category.STORAGE)})
+
+#%%
+class Test_TimeStep(unittest.TestCase):
+    def test_addinputs_does_not_change_original_timestep(self):
+        t = data.TimeStep(0, inputs={'inflow': data.Input(1), 'storage': data.Input(2, category=data.Category.STORAGE)})
+        u = t.addinputs({'spill': data.Input(1, category=data.Category.OUTFLOW)})
+        self.assertListEqual(list(t.inputs.keys()), ['inflow', 'storage'])
+        self.assertEqual(u.outflows(), 1)
+    def test_addinputs_shares_existing_inputs(self):
+        t = data.TimeStep(0, inputs={'inflow': data.Input(1)})
+        u = t.addinputs({'storage': data.Input(2, category=data.Category.STORAGE)})
+        self.assertIs(u.inputs['inflow'], t.inputs['inflow'])
+    def test_addinputs_overrides_existing_inputs(self):
+        t = data.TimeStep(0, inputs={'inflow': data.Input(1)})
+        u = t.addinputs({'inflow': data.Input(3)})
+        self.assertEqual(u.inflows(), 3)
+        self.assertEqual(len(u.inputs), 1)
+    def test_addinputs_collapses_layers_after_max_input_layers(self):
+        t = data.TimeStep(0, inputs={'inflow': data.Input(0)})
+        for i in range(2 * data.MAX_INPUT_LAYERS):
+            t = t.addinputs({f'x{i}': data.Input(i, category=data.Category.OTHER)})
+        self.assertLessEqual(len(t.inputs.maps), data.MAX_INPUT_LAYERS)
+        self.assertEqual(len(t.inputs), 2 * data.MAX_INPUT_LAYERS + 1)
+    def test_addinputs_updates_category_totals(self):
+        t = data.TimeStep(0, inputs={'inflow': data.Input(1), 'storage': data.Input(np.nan, category=data.Category.STORAGE)})
+        u = t.addinputs({'storage': data.Input(2, category=data.Category.STORAGE), 'spill': data.Input(1, category=data.Category.OUTFLOW), 'inflow': data.Input(4)})
+        self.assertListEqual(u.totals(), [4, 1, 2])
+        self.assertTrue(np.isnan(t.storage()))
+    def test_addinputs_rescans_totals_for_non_real_values(self):
+        t = data.TimeStep(0, inputs={'inflow': data.Input(decimal.Decimal('1.5'))})
+        u = t.addinputs({'inflow': data.Input(decimal.Decimal('2.5'))})
+        self.assertEqual(u.inflows(), decimal.Decimal('2.5'))
+    def test_input_is_immutable(self):
+        x = data.Input(1)
+        with self.assertRaises(AttributeError):
+            x.value = 2
+
+#%%
+class Test_From_DataFrame(unittest.TestCase):
+    def dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame({'inflow': [1.0, 2.0, 3.0], 'storage': [5.0, np.nan, np.nan], 'concentration': [1.0, np.nan, np.nan]}, index=[0, 1, 2])
+    def test_categories_assigned_by_column_name(self):
+        ts = data.TimeSeries.from_dataframe(self.dataframe())
+        self.assertListEqual([ts.category(k) for k in ts.variables], [data.Category.INFLOW, data.Category.STORAGE, data.Category.OTHER])
+    def test_nan_values_are_marked_as_outputs(self):
+        t = data.TimeSeries.from_dataframe(self.dataframe()).timesteps[1]
+        self.assertTrue(t.inputs['concentration'].isoutput)
+        self.assertFalse(t.inputs['inflow'].isoutput)
+    def test_outputs_list_is_attached_to_each_row(self):
+        output = data.Output(fn=lambda ts, t: {'concentration': 1}, category=data.Category.OTHER)
+        ts = data.TimeSeries.from_dataframe(self.dataframe(), output.to_dict('salinity', n=3, t=2))
+        self.assertListEqual([list(t.outputs.keys()) for t in ts.timesteps], [['salinity'], [], ['salinity']])
+    def test_outputs_dictionary_is_shared_by_all_rows(self):
+        output = data.Output(fn=lambda ts, t: {'concentration': 1}, category=data.Category.OTHER)
+        ts = data.TimeSeries.from_dataframe(self.dataframe(), {'salinity': output})
+        self.assertIs(ts.timesteps[0].outputs, ts.timesteps[2].outputs)
+    def test_scheduled_outputs_match_outputs_list(self):
+        output = data.Output(fn=lambda ts, t: {'concentration': 1}, category=data.Category.OTHER)
+        expected = data.TimeSeries.from_dataframe(self.dataframe(), output.to_dict('salinity', values_list=True, n=3, t=2, starting_position=1))
+        ts = data.TimeSeries.from_dataframe(self.dataframe(), {'salinity': output.every(2, 1)})
+        self.assertListEqual([dict(t.outputs) for t in ts.timesteps], [dict(t.outputs) for t in expected.timesteps])
+        self.assertListEqual(list(ts._outputs), [1])
+    def test_output_plan_sorts_once_and_shares_rows_with_the_same_outputs(self):
+        pre = data.Output(fn=lambda ts, t: {'x': 1}, category=data.Category.OTHER)
+        post = data.Output(fn=lambda ts, t: {'y': 1}, category=data.Category.INFLOW, runorder=data.RunOrder.POST_OPERATIONS)
+        plan = data.schedule_outputs({'post': post, 'pre': pre.every(3)}, 10)
+        self.assertListEqual(plan.names, ['pre', 'post'])
+        self.assertListEqual(list(plan[0].keys()), ['pre', 'post'])
+        self.assertListEqual(list(plan[1].keys()), ['post'])
+        self.assertIs(plan[0], plan[9])
+        self.assertIs(plan[1], plan[8])
+        self.assertEqual(len(plan._plans), 2)
+        np.testing.assert_array_equal(plan.rows('pre'), [0, 3, 6, 9])
+    def test_output_plan_long_cycle_matches_schedule(self):
+        output = data.Output(fn=lambda ts, t: {'x': 1}, category=data.Category.OTHER)
+        schedule = {'a': output.every(97, 5), 'b': output.every(89, 2)}
+        plan = data.OutputPlan(schedule, 20000)
+        self.assertIsNone(plan._cycle)
+        expected = [i for i in range(20000) if any(x.isdue(i) for x in schedule.values())]
+        self.assertListEqual(list(plan), expected)
+        self.assertListEqual(list(plan[5 + 97 * 89].keys()), ['a'])
+    def test_output_period_less_than_one_raises_ValueError(self):
+        output = data.Output(fn=lambda ts, t: {'x': 1}, category=data.Category.OTHER)
+        with self.assertRaises(ValueError):
+            output.every(0)
+    def test_outputs_of_wrong_length_raises_ValueError(self):
+        output = data.Output(fn=lambda ts, t: {'concentration': 1}, category=data.Category.OTHER)
+        with self.assertRaises(ValueError):
+            data.TimeSeries.from_dataframe(self.dataframe(), output.to_dict('salinity', n=2))
+    def test_copy_false_shares_dataframe_buffers(self):
+        df = self.dataframe()
+        ts = data.TimeSeries.from_dataframe(df, copy=False)
+        self.assertTrue(np.shares_memory(ts.input('inflow'), df['inflow'].to_numpy(copy=False)))
+
+#%%
+class Test_Read_CSV(unittest.TestCase):
+    path = str(pathlib.Path(__file__).parents[1] / 'examples' / 'default.csv')
+    def test_read_csv_yields_chunks_of_chunksize(self):
+        chunks = list(data.read_csv(self.path, chunksize=3, storage=0, date_format='%m/%d/%y'))
+        self.assertListEqual([len(c) for c in chunks], [3, 1])
+    def test_read_csv_adds_storage_to_first_row(self):
+        chunks = list(data.read_csv(self.path, chunksize=3, storage=0, date_format='%m/%d/%y'))
+        self.assertEqual(chunks[0].timesteps[0].storage(), 0)
+        self.assertTrue(np.isnan(chunks[1].timesteps[0].storage()))
+    def test_read_csv_lower_cases_column_names(self):
+        chunk = next(data.read_csv(self.path, chunksize=3, storage=0, date_format='%m/%d/%y'))
+        self.assertEqual(chunk.category('inflow'), data.Category.INFLOW)
+    def test_parse_usace_export_drops_non_numeric_rows(self):
+        df = pd.DataFrame({'Date / Time': ['01Jan1990, 24:00', '02Jan1990, 24:00'], 'WILSON DAM FLOW-IN': ['100', 'M']})
+        result = data.parse_usace_export(df, rename={'WILSONDAMFLOW-IN': 'inflow'})
+        self.assertListEqual(list(result.inflow), [100])
+        self.assertEqual(result.index[0], pd.Timestamp(1990, 1, 1))
+
+class Test_Calendar(unittest.TestCase):
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.date_range('1999-09-01', '2005-01-31', freq='D')
+    def test_calendar_matches_scalar_conversions(self):
+        dates = self.dates()
+        cal = data.Calendar.from_dates(list(dates))
+        for t, d in enumerate(dates):
+            self.assertTupleEqual(cal[t], (utilities.datetime_to_dowy(d), d.year + 1 if d.month >= 10 else d.year, d.month, d.is_leap_year))
+    def test_timeseries_calendar_is_built_once(self):
+        ts = data.TimeSeries.from_dataframe(pd.DataFrame({'inflow': 1.0, 'storage': 0.0}, index=self.dates()))
+        self.assertIs(ts.calendar, ts.calendar)
+        self.assertEqual(ts.calendar.water_year[0], 1999)
+        self.assertEqual(ts.calendar.water_year[30], 2000)
+    def test_timestep_calendar_reads_timeseries_calendar(self):
+        ts = data.TimeSeries.from_dataframe(pd.DataFrame({'inflow': 1.0, 'storage': 0.0}, index=self.dates()))
+        ts.calendar
+        step = ts.timesteps[400].addinputs({'x': data.Input(1)})
+        self.assertTupleEqual(step.calendar, ts.calendar[400])
+        self.assertTupleEqual(data.TimeStep(datetime.date(2000, 2, 29), {}).calendar, ts.calendar[181])
+    def test_integer_timesteps_have_no_calendar(self):
+        ts = data.TimeSeries.from_columns([0, 1], {'storage': [0, 1]}, {'storage': data.Category.STORAGE})
+        with self.assertRaises(ValueError):
+            ts.calendar
@@ -0,0 +1,151 @@
+#region Header
+# %% [markdown]
+# # Unit Tests for engine.py
+# 
+# Author: John Kucharski | Date: 16 Oct 2026
+# 
+# Status: open 
+# Testing: n/a
+#endregion
+
+#region Dependencies
+# %%
+import sys
+import unittest
+import datetime
+
+import numpy as np
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.outlet import Outlet, RatingTable
+import src.data as data
+import src.engine as engine
+import src.reservoir as reservoir
+import src.operations as ops
+import src.simulation as simulation
+#endregion
+
+#%%
+def random_timeseries(n: int = 400, demand: bool = False, seed: int = 1) -> data.TimeSeries:
+    '''A seeded record of daily gamma distributed inflows starting on 1 January 2001, with an initial storage of 10 (shared by the engine, node and scenarios tests).'''
+    rng = np.random.default_rng(seed)
+    columns = {'inflow': rng.gamma(2, 3, n), 'storage': np.r_[10.0, np.full(n - 1, np.nan)]}
+    categories = {'inflow': data.Category.INFLOW, 'storage': data.Category.STORAGE}
+    if demand:
+        columns |= {'demand': rng.uniform(0, 10, n), 'capacity': np.full(n, 18.0)}
+        categories |= {'demand': data.Category.OTHER, 'capacity': data.Category.OTHER}
+    dates = [datetime.date(2001, 1, 1) + datetime.timedelta(days=t) for t in range(n)]
+    return data.TimeSeries.from_columns(dates, columns, categories)
+
+class Test_Engine(unittest.TestCase):
+    def reservoir(self) -> reservoir.Reservoir:
+        return reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 5), Outlet('high', 15)])
+    def assertSameResults(self, ts: data.TimeSeries, f_operations, res: 'reservoir.Reservoir' = None) -> None:
+        res = self.reservoir() if res == None else res
+        expected = simulation.Simulation(ts, res, f_operations).simulate(arrays=False)
+        actual = engine.simulate(ts, res, f_operations)
+        self.assertListEqual(actual.variables, expected.variables)
+        for k in expected.variables:
+            np.testing.assert_array_equal(actual.input(k), expected.input(k))
+        np.testing.assert_array_equal(actual.isoutput('storage'), expected.isoutput('storage'))
+    def test_policy_identifies_built_in_policies(self):
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 5)])
+        self.assertEqual(engine.policy(ops.passive_operations), engine.PASSIVE)
+        self.assertEqual(engine.policy(curve.operate), engine.RULE_CURVE)
+        self.assertIsNone(engine.policy(lambda t, outlets: {}))
+    def test_passive_operations_matches_simulate(self):
+        self.assertSameResults(random_timeseries(), ops.passive_operations)
+    def test_standard_operating_proceedures_matches_simulate(self):
+        self.assertSameResults(random_timeseries(demand=True), ops.standard_operating_proceedures)
+    def test_rule_curve_matches_simulate(self):
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2021, 4, 1), 12)])
+        self.assertSameResults(random_timeseries(), curve.operate)
+    def test_rating_table_outlets_match_simulate(self):
+        res = reservoir.Reservoir(capacity=20, outlets=[Outlet('gate', 2, RatingTable([2, 10, 20], [0, 3, 4])), Outlet('spill', 15)])
+        self.assertSameResults(random_timeseries(), ops.passive_operations, res)
+        self.assertSameResults(random_timeseries(demand=True), ops.standard_operating_proceedures, res)
+    def test_custom_outlets_match_simulate(self):
+        res = reservoir.Reservoir(capacity=20, outlets=[Outlet('gate', 0, lambda v: min(v, 1)), Outlet('spill', 15)])
+        self.assertSameResults(random_timeseries(), ops.passive_operations, res)
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2021, 4, 1), 12)])
+        self.assertSameResults(random_timeseries(), curve.operate, res)
+    def test_supports_is_false_when_demand_is_missing_from_any_row(self):
+        ts = random_timeseries(demand=True)
+        present = np.arange(len(ts)) != 200
+        gaps = data.TimeSeries.from_columns(ts.dates(), {k: ts.input(k) for k in ts.variables}, {k: ts.category(k) for k in ts.variables}, masks={'demand': present})
+        self.assertTrue(engine.supports(ts, self.reservoir(), ops.standard_operating_proceedures))
+        self.assertFalse(engine.supports(gaps, self.reservoir(), ops.standard_operating_proceedures))
+    def test_supports_is_false_for_policies_without_operate_batch(self):
+        self.assertFalse(engine.supports(random_timeseries(), self.reservoir(), lambda t, outlets: ops.passive_operations(t, outlets)))
+    def test_custom_policy_with_operate_batch_matches_simulate(self):
+        def half(t: data.TimeStep, outlets) -> dict:
+            return {x.name: min(x.max_release(t.inflows() + t.storage()), t.inflows() / 2) for x in outlets}
+        half.operate_batch = lambda states, outlets: {x.name: np.minimum(outlets.max_release(i, states['inflow'] + states['storage']), states['inflow'] / 2) for i, x in enumerate(outlets)}
+        self.assertTrue(engine.supports(random_timeseries(), self.reservoir(), half))
+        self.assertSameResults(random_timeseries(), half)
+    def test_tabulated_operations_matches_simulate(self):
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2021, 4, 1), 12)])
+        table = ops.Tabulated_Operations(curve.operate, self.reservoir().outlet_bank, np.linspace(0, 40, 81))
+        self.assertTrue(engine.supports(random_timeseries(), self.reservoir(), table.operate))
+        self.assertSameResults(random_timeseries(), table.operate)
+    def test_simulate_uses_engine_when_supported(self):
+        ts = random_timeseries()
+        result = simulation.Simulation(ts, self.reservoir(), ops.passive_operations).simulate()
+        np.testing.assert_array_equal(result.storage(), engine.simulate(ts, self.reservoir(), ops.passive_operations).storage())
+
+class Test_Simulate_Ensemble(unittest.TestCase):
+    def reservoir(self) -> reservoir.Reservoir:
+        return reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 5), Outlet('high', 15)])
+    def traces(self, m: int = 3, n: int = 200) -> np.ndarray:
+        return np.random.default_rng(2).gamma(2, 3, (m, n))
+    def assertMatchesMembers(self, f_operations, inputs: dict = None) -> None:
+        traces = self.traces()
+        dates = [datetime.date(2001, 1, 1) + datetime.timedelta(days=t) for t in range(traces.shape[1])]
+        result = engine.simulate_ensemble(self.reservoir(), f_operations, traces, 10, dates, inputs)
+        for i in range(len(traces)):
+            columns = {'inflow': traces[i], 'storage': np.r_[10.0, np.full(traces.shape[1] - 1, np.nan)]} | ({} if inputs == None else inputs)
+            ts = data.TimeSeries.from_columns(dates, columns, {k: data.category_from_name(k) for k in columns})
+            expected = simulation.Simulation(ts, self.reservoir(), f_operations).simulate(arrays=False)
+            np.testing.assert_array_equal(result.storage[i], expected.storage())
+            np.testing.assert_array_equal(result.outlets['low'][i], expected.input('low'))
+            np.testing.assert_array_equal(result.releases[i], expected.outflows())
+    def test_ensemble_keeps_releases_with_names_that_are_not_outlets(self):
+        def divert(t: data.TimeStep, outlets) -> dict:
+            return ops.passive_operations(t, outlets) | {'diversion': 1.0}
+        traces = self.traces()
+        result = engine.simulate_ensemble(self.reservoir(), divert, traces, 10)
+        np.testing.assert_array_equal(result.outlets['diversion'], np.ones(traces.shape))
+        columns = {'inflow': traces[0], 'storage': np.r_[10.0, np.full(traces.shape[1] - 1, np.nan)]}
+        expected = simulation.Simulation(data.TimeSeries.from_columns(range(traces.shape[1]), columns, {k: data.category_from_name(k) for k in columns}), self.reservoir(), divert).simulate(arrays=False)
+        np.testing.assert_array_equal(result.storage[0], expected.storage())
+    def test_batch_policy_keeps_releases_with_names_that_are_not_outlets(self):
+        def divert(t: data.TimeStep, outlets) -> dict:
+            return ops.passive_operations(t, outlets) | {'diversion': 1.0}
+        divert.operate_batch = lambda states, outlets: ops.passive_operations.operate_batch(states, outlets) | {'diversion': np.ones(len(states['storage']))}
+        traces = self.traces()
+        result = engine.simulate_ensemble(self.reservoir(), divert, traces, 10)
+        np.testing.assert_array_equal(result.outlets['diversion'], np.ones(traces.shape))
+        columns = {'inflow': traces[0], 'storage': np.r_[10.0, np.full(traces.shape[1] - 1, np.nan)]}
+        ts = data.TimeSeries.from_columns(range(traces.shape[1]), columns, {k: data.category_from_name(k) for k in columns})
+        expected = simulation.Simulation(ts, self.reservoir(), divert).simulate(arrays=False)
+        actual = simulation.Simulation(ts, self.reservoir(), divert).simulate()
+        self.assertTrue(engine.supports(ts, self.reservoir(), divert))
+        np.testing.assert_array_equal(result.storage[0], expected.storage())
+        np.testing.assert_array_equal(actual.storage(), expected.storage())
+        np.testing.assert_array_equal(actual.input('diversion'), expected.input('diversion'))
+    def test_passive_operations_matches_each_member(self):
+        self.assertMatchesMembers(ops.passive_operations)
+    def test_standard_operating_proceedures_matches_each_member(self):
+        self.assertMatchesMembers(ops.standard_operating_proceedures, {'demand': np.linspace(0, 10, 200), 'capacity': np.full(200, 18.0)})
+    def test_rule_curve_matches_each_member(self):
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2021, 4, 1), 12)])
+        self.assertMatchesMembers(curve.operate)
+    def test_rating_table_outlets_match_each_member(self):
+        self.reservoir = lambda: reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 2, RatingTable([2, 10, 20], [0, 3, 4])), Outlet('spill', 15)])
+        self.assertMatchesMembers(ops.passive_operations)
+    def test_custom_policy_matches_each_member(self):
+        self.assertMatchesMembers(lambda t, outlets: ops.passive_operations(t, outlets))
+    def test_results_have_one_row_per_member(self):
+        result = engine.simulate_ensemble(self.reservoir(), ops.passive_operations, self.traces(m=5, n=7), np.arange(5.0))
+        self.assertTupleEqual(result.storage.shape, (5, 7))
+        self.assertListEqual(list(result.storage[:, 0]), [0, 1, 2, 3, 4])
@@ -0,0 +1,90 @@
+#region Header
+# %% [markdown]
+# # Unit Tests for node.py
+#
+# Author: John Kucharski | Date: 16 Oct 2026
+#
+# Status: open
+# Testing: n/a
+#endregion
+
+#region Dependencies
+# %%
+import sys
+import unittest
+import datetime
+
+import numpy as np
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.outlet import Outlet
+import src.data as data
+import src.node as node
+import src.routing as routing
+import src.reservoir as reservoir
+import src.operations as ops
+import src.simulation as simulation
+from src.tests.test_engine import random_timeseries
+#endregion
+
+#%%
+def cascade_node(name: str, seed: int, f_operations=ops.passive_operations) -> node.Node:
+    return node.Node(name, reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 5), Outlet('high', 15)], name=name), f_operations, random_timeseries(200, seed=seed))
+
+class Test_Network(unittest.TestCase):
+    def test_schedule_lists_upstream_nodes_first(self):
+        network = node.Network([cascade_node('c', 3), cascade_node('b', 2), cascade_node('a', 1)], [('a', 'b'), ('b', 'c')])
+        self.assertListEqual(network.schedule, ['a', 'b', 'c'])
+    def test_cycle_raises_error(self):
+        with self.assertRaises(ValueError):
+            node.Network([cascade_node('a', 1), cascade_node('b', 2)], [('a', 'b'), ('b', 'a')])
+    def test_edge_to_missing_node_raises_error(self):
+        with self.assertRaises(ValueError):
+            node.Network([cascade_node('a', 1)], [('a', 'b')])
+    def test_routed_fractions_above_one_raise_error(self):
+        with self.assertRaises(ValueError):
+            node.Network([cascade_node('a', 1), cascade_node('b', 2), cascade_node('c', 3)], [('a', 'b', 0.6), ('a', 'c', 0.6)])
+    def test_cascade_matches_simulating_each_reservoir_in_turn(self):
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2021, 4, 1), 12)])
+        upper, lower = cascade_node('upper', 1), cascade_node('lower', 2, curve.operate)
+        results = node.Network([lower, upper], [('upper', 'lower')]).simulate()
+        expected_upper = simulation.Simulation(upper.timeseries, upper.reservoir, upper.f_operations).simulate(arrays=False)
+        releases = np.array(expected_upper.input('low')) + np.array(expected_upper.input('high'))
+        inputs = data.TimeSeries.from_columns(lower.timeseries.dates(), {'inflow': lower.timeseries.input('inflow'), 'upstream': releases, 'storage': lower.timeseries.input('storage')},
+                                              {'inflow': data.Category.INFLOW, 'upstream': data.Category.INFLOW, 'storage': data.Category.STORAGE})
+        expected_lower = simulation.Simulation(inputs, lower.reservoir, lower.f_operations).simulate(arrays=False)
+        np.testing.assert_array_almost_equal(results['upper'].input('storage'), expected_upper.input('storage'))
+        np.testing.assert_array_almost_equal(results['lower'].input('upstream'), releases)
+        np.testing.assert_array_almost_equal(results['lower'].input('storage'), expected_lower.input('storage'))
+    def test_confluence_sums_routed_fractions(self):
+        network = node.Network([cascade_node('a', 1), cascade_node('b', 2), cascade_node('c', 3)], [('a', 'c', 0.5), ('b', 'c')])
+        results = network.simulate()
+        expected = 0.5 * node.releases_from(results['a'], network.node('a').reservoir) + node.releases_from(results['b'], network.node('b').reservoir)
+        np.testing.assert_array_almost_equal(results['c'].input('upstream'), expected)
+        self.assertNotIn('upstream', results['a'].variables)
+    def test_branches_split_at_confluences_and_diversions(self):
+        nodes = [cascade_node(x, i) for i, x in enumerate('abcdefg')]
+        network = node.Network(nodes, [('a', 'b'), ('b', 'd'), ('c', 'd'), ('d', 'e'), ('e', 'f', 0.5), ('e', 'g', 0.5)])
+        self.assertListEqual(sorted(network.branches), [['a', 'b'], ['c'], ['d', 'e'], ['f'], ['g']])
+    def test_simulate_parallel_matches_simulate(self):
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2021, 4, 1), 12)])
+        nodes = [cascade_node('a', 1), cascade_node('b', 2, curve.operate), cascade_node('c', 3), cascade_node('d', 4)]
+        network = node.Network(nodes, [('a', 'b'), ('b', 'd'), ('c', 'd')])
+        expected, actual = network.simulate(), network.simulate_parallel(max_workers=2)
+        self.assertSetEqual(set(actual), set(expected))
+        for name in expected:
+            np.testing.assert_array_equal(actual[name].input('storage'), expected[name].input('storage'))
+    def test_upstream_policy_releasing_through_some_outlets(self):
+        def low_only(t: data.TimeStep, outlets) -> dict:
+            return {'low': min(1.0, t.inflows() + t.storage())}
+        upper = cascade_node('upper', 1, low_only)
+        results = node.Network([upper, cascade_node('lower', 2)], [('upper', 'lower')]).simulate()
+        self.assertNotIn('high', results['upper'].variables)
+        np.testing.assert_array_almost_equal(results['lower'].input('upstream'), results['upper'].input('low'))
+    def test_reach_routes_releases_into_downstream_inflows(self):
+        reach = routing.Muskingum(2, 0.2)
+        network = node.Network([cascade_node('a', 1), cascade_node('b', 2)], [('a', 'b')], reaches={('a', 'b'): reach})
+        results = network.simulate()
+        np.testing.assert_array_almost_equal(results['b'].input('upstream'), reach.route(node.releases_from(results['a'], network.node('a').reservoir)))
+        with self.assertRaises(ValueError):
+            node.Network([cascade_node('a', 1), cascade_node('b', 2)], [('a', 'b')], reaches={('b', 'a'): reach})
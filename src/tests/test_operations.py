@@ -21,6 +21,7 @@ from src.outlet import Outlet
 import src.reservoir as reservoir
 import src.operations as ops
 import src.data as data
+import src.utilities as utilities
 #endregion
 
 #%%
@@ -57,6 +58,20 @@ class Test_Operations(unittest.TestCase):
     def test_target_volume_dowy_last_wy_to_current_wy_returns_expected_interpolated_target(self):
         obj = ops.Rule_Curve(date_target_pairs= [(datetime.datetime(2021, 9, 27), 0), (datetime.datetime(2021, 10, 2), 0), (datetime.datetime(2021, 9, 30), 1)])
         self.assertEquals(obj.target_volume(1), 0.5)           
+    def test_target_volume_table_matches_interpolated_targets(self):
+        obj = ops.Rule_Curve(date_target_pairs= [(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2022, 4, 1), 12), (datetime.datetime(2022, 6, 15), 20)])
+        self.assertEqual(len(obj.table), 366)
+        self.assertEqual(obj.target_volume(1), 8)
+        self.assertAlmostEqual(obj.target_volume(100), 8 + 4 * (100 - 1) / (183 - 1))
+        self.assertAlmostEqual(obj.target_volume(300), 20 - 12 * (300 - 258) / (366 - 258))
+    def test_target_volume_out_of_range_raises_error(self):
+        obj = ops.Rule_Curve(date_target_pairs= [(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2022, 4, 1), 12)])
+        self.assertRaises(utilities.InputOutOfRangeError, obj.target_volume, 366)
+        self.assertRaises(utilities.InputOutOfRangeError, obj.target_volumes, [1, 366])
+    def test_target_volumes_matches_target_volume(self):
+        obj = ops.Rule_Curve(date_target_pairs= [(datetime.datetime(2021, 9, 27), 0), (datetime.datetime(2021, 10, 2), 0), (datetime.datetime(2021, 9, 30), 1)])
+        days = np.arange(0, 366)
+        self.assertListEqual(list(obj.target_volumes(days)), [obj.target_volume(d) for d in days])
     #endregion
     
     #region 'set_release' tests
@@ -75,6 +90,65 @@ class Test_Operations(unittest.TestCase):
         outlets = reservoir.Reservoir().outlets
         result = ops.passive_operations(input, outlets)
         self.assertDictEqual(result, {'spill': 1})
+    def test_zone_rules_dispatch_by_available_volume(self):
+        zones = reservoir.Zones([(ops.Zone.INACTIVE, 2), (ops.Zone.CONSERVATION, 6)], ops.Zone.FLOOD)
+        rules = ops.Zone_Rules(zones, {ops.Zone.INACTIVE: lambda t, o: {'zone': 0}, ops.Zone.CONSERVATION: lambda t, o: {'zone': 1}, ops.Zone.FLOOD: lambda t, o: {'zone': 2}})
+        def step(storage: float) -> data.TimeStep:
+            return data.TimeStep(datetime.date(2021, 9, 3), {'inflow': data.Input(1), 'storage': data.Input(storage, category=data.Category.STORAGE)})
+        self.assertListEqual([rules.operate(step(s), [])['zone'] for s in [0, 1, 4, 5, 9]], [0, 1, 1, 2, 2])
+    def test_zone_rules_requires_a_rule_for_each_zone(self):
+        zones = reservoir.Zones([(ops.Zone.INACTIVE, 2)], ops.Zone.FLOOD)
+        self.assertRaises(ValueError, ops.Zone_Rules, zones, {ops.Zone.INACTIVE: ops.passive_operations})
+    def test_operate_batch_matches_operate(self):
+        res = reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 2), Outlet('high', 12)])
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2022, 4, 1), 12)])
+        storage = np.linspace(0, 25, 26)
+        states = {'inflow': np.full(26, 2.0), 'outflow': np.full(26, 1.0), 'storage': storage, 'demand': np.full(26, 3.0), 'capacity': np.full(26, 18.0), 'dowy': 100}
+        for f in [ops.passive_operations, ops.standard_operating_proceedures, curve.operate]:
+            actual = ops.batch_operations(f)(states, res.outlet_bank)
+            for j, s in enumerate(storage):
+                t = data.TimeStep(datetime.date(2022, 1, 8), {'inflow': data.Input(2.0), 'release': data.Input(1.0, category=data.Category.OUTFLOW), 'storage': data.Input(s, category=data.Category.STORAGE),
+                                                               'demand': data.Input(3.0, category=data.Category.OTHER), 'capacity': data.Input(18.0, category=data.Category.OTHER)})
+                self.assertDictEqual({k: v[j] for k, v in actual.items()}, f(t, res.outlet_bank))
+    def test_batch_operations_is_none_without_operate_batch(self):
+        self.assertIsNone(ops.batch_operations(lambda t, outlets: {}))
+    def test_tabulated_operations_matches_exact_operations_at_and_between_volumes(self):
+        res = reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 2), Outlet('high', 12)])
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2022, 4, 1), 12)])
+        table = ops.Tabulated_Operations(curve.operate, res.outlet_bank, np.linspace(0, 40, 81), tolerance=0.25)
+        self.assertEqual(table.table.shape, (365, 81, 2))
+        for v in [0, 3.25, 10.5, 39.9]:
+            t = data.TimeStep(datetime.date(2022, 1, 8), {'inflow': data.Input(v), 'storage': data.Input(0, category=data.Category.STORAGE)})
+            for k, x in curve.operate(t, res.outlet_bank).items():
+                self.assertAlmostEqual(table.operate(t, res.outlet_bank)[k], x)
+    def test_tabulated_operations_coarse_table_raises_error_above_tolerance(self):
+        res = reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 2), Outlet('high', 12)])
+        table = ops.Tabulated_Operations(ops.passive_operations, res.outlet_bank, [0, 40], dowys=None)
+        self.assertGreater(table.max_error(), 0)
+        with self.assertRaises(ValueError):
+            ops.Tabulated_Operations(ops.passive_operations, res.outlet_bank, [0, 40], dowys=None, tolerance=0.1)
+    def test_tabulated_operations_outside_table_calls_exact_operations(self):
+        res = reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 2), Outlet('high', 12)])
+        table = ops.Tabulated_Operations(lambda t, outlets: ops.passive_operations(t, outlets), res.outlet_bank, [0, 2, 12], dowys=None)
+        t = data.TimeStep(0, {'inflow': data.Input(30), 'storage': data.Input(0, category=data.Category.STORAGE)})
+        self.assertDictEqual(table.operate(t, res.outlet_bank), ops.passive_operations(t, res.outlet_bank))
+        actual = table.operate_batch({'inflow': np.array([1.0, 30.0]), 'outflow': np.zeros(2), 'storage': np.zeros(2)}, res.outlet_bank)
+        np.testing.assert_array_almost_equal(actual['low'], [0, 28])
+    def test_tabulated_operations_operate_batch_matches_operate(self):
+        res = reservoir.Reservoir(capacity=20, outlets=[Outlet('low', 2), Outlet('high', 12)])
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2022, 4, 1), 12)])
+        table = ops.Tabulated_Operations(curve.operate, res.outlet_bank, np.linspace(0, 20, 11))
+        storage = np.linspace(0, 25, 26)
+        actual = table.operate_batch({'inflow': np.full(26, 2.0), 'outflow': np.full(26, 1.0), 'storage': storage, 'dowy': 100}, res.outlet_bank)
+        for j, s in enumerate(storage):
+            t = data.TimeStep(datetime.date(2022, 1, 8), {'inflow': data.Input(2.0), 'release': data.Input(1.0, category=data.Category.OUTFLOW), 'storage': data.Input(s, category=data.Category.STORAGE)})
+            for k, x in table.operate(t, res.outlet_bank).items():
+                self.assertAlmostEqual(actual[k][j], x)
+    def test_passive_operations_does_not_sort_outlets(self):
+        t = data.TimeStep(datetime.date(2021, 9, 3), {'inflow': data.Input(4), 'storage': data.Input(0, category=data.Category.STORAGE)})
+        outlets = [Outlet('high', 3), Outlet('low', 1)]
+        self.assertDictEqual(ops.passive_operations(t, outlets), {'low': 3, 'high': 0})
+        self.assertListEqual([x.name for x in outlets], ['high', 'low'])
     
     # def test_standard_operating_proceedures_rule_curve_target_volume_default_reservoir_with_default_outlet_simple_rules_volume_of_1_returns_release_of_1(self):
     #     simple_rule = [(1, 0), (362, 0), (364, 1)]
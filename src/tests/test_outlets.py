@@ -50,4 +50,54 @@ class Test_Outlets(unittest.TestCase):
         self.assertEqual('default outlet: The location input value: -1, of the Outlet.__set_location() method is not on the valid range: [0, inf].', z)
     def test_max_release_neg1_returns_0(self):
         obj = outlet.Outlet()
-        self.assertEqual(0, obj.max_release(-1)) 
\ No newline at end of file
+        self.assertEqual(0, obj.max_release(-1)) 
+# %%
+class Test_OutletBank(unittest.TestCase):
+    def outlets(self):
+        return [outlet.Outlet('spill', 10), outlet.Outlet('gate', 2, lambda v: min(v, 3)), outlet.Outlet('low', 0)]
+    def test_outlets_are_sorted_by_location(self):
+        bank = outlet.OutletBank(self.outlets())
+        self.assertListEqual(bank.names, ['low', 'gate', 'spill'])
+        self.assertListEqual(list(bank.locations), [0, 2, 10])
+    def test_select_and_deselect_by_name(self):
+        bank = outlet.OutletBank(self.outlets())
+        self.assertEqual(bank.select('gate').location, 2)
+        self.assertListEqual([x.name for x in bank.select_many(['spill', 'low'])], ['low', 'spill'])
+        self.assertListEqual([x.name for x in bank.deselect(['spill', 'low'])], ['gate'])
+    def test_deselect_outlets_removes_every_named_outlet(self):
+        self.assertListEqual([x.name for x in outlet.deselect_outlets(['spill', 'low'], self.outlets())], ['gate'])
+    def test_max_releases_matches_outlet_max_release(self):
+        outlets = self.outlets()
+        bank = outlet.OutletBank(outlets)
+        volumes = np.array([-1, 0, 1.5, 5, 12])
+        expected = [[x.max_release(v) for v in volumes] for x in bank]
+        self.assertListEqual(bank.max_releases(volumes).tolist(), expected)
+        self.assertListEqual(bank.max_releases(5).tolist(), [5, 3, 0])
+    def test_isdefault_is_false_with_custom_max_release(self):
+        self.assertFalse(outlet.OutletBank(self.outlets()).isdefault)
+        self.assertTrue(outlet.OutletBank(self.outlets()[::2]).isdefault)
+
+# %%
+class Test_RatingTable(unittest.TestCase):
+    def table(self):
+        return outlet.RatingTable([0, 10, 20, 40], [0, 5, 6, 10])
+    def test_call_matches_np_interp_on_table(self):
+        table = self.table()
+        for v in np.linspace(0, 40, 81):
+            self.assertAlmostEqual(table(v), np.interp(v, table.volumes, table.releases))
+    def test_interpolate_matches_call(self):
+        table, volumes = self.table(), np.linspace(-5, 45, 101)
+        self.assertListEqual(table.interpolate(volumes).tolist(), [table(v) for v in volumes])
+    def test_extrapolation_defaults_to_0_below_and_last_release_above(self):
+        self.assertEqual(self.table()(-1), 0)
+        self.assertEqual(self.table()(50), 10)
+        self.assertEqual(outlet.RatingTable([0, 1], [0, 1], above=np.inf)(2), np.inf)
+    def test_unsorted_volumes_raise_error(self):
+        self.assertRaises(ValueError, outlet.RatingTable, [0, 2, 1], [0, 1, 2])
+    def test_to_dict_round_trip(self):
+        self.assertEqual(outlet.RatingTable.from_dict(self.table().to_dict()), self.table())
+    def test_outlet_rating_and_bank_max_releases(self):
+        gate = outlet.Outlet('gate', 0, self.table())
+        self.assertIs(gate.rating, gate.f_max_release)
+        self.assertIsNone(outlet.Outlet().rating)
+        self.assertListEqual(outlet.OutletBank([gate]).max_releases(np.array([5, 30])).tolist(), [[2.5, 8]])
@@ -50,12 +50,78 @@ class Test_Map(unittest.TestCase):
         f = utilities.f_interpolate_from_data([0, 1, 2], [1, 2, 3])
         obj = reservoir.Map(name='simple', f=f)
         self.assertEqual(obj.f(0.5), 1.5)
+
+# %%
+class Test_TabulatedMap(unittest.TestCase):
+    def elevation(self) -> reservoir.TabulatedMap:
+        return reservoir.TabulatedMap('elevation', [0, 10, 20, 40], [100, 110, 130, 135])
+    def test_f_and_inverse_f_match_interpolation(self):
+        obj = self.elevation()
+        for v in np.linspace(0, 40, 41):
+            self.assertAlmostEqual(obj.f(v), np.interp(v, obj.volumes, obj.values))
+            self.assertAlmostEqual(obj.inverse_f(obj.f(v)), v)
+    def test_vectorized_f_and_inverse_f_match_scalar_calls(self):
+        obj, volumes = self.elevation(), np.linspace(-5, 45, 51)
+        np.testing.assert_array_almost_equal(obj.f(volumes), [obj.f(v) for v in volumes])
+        np.testing.assert_array_almost_equal(obj.inverse_f(obj.f(volumes)), [obj.inverse_f(obj.f(v)) for v in volumes])
+    def test_values_outside_table_return_nan(self):
+        self.assertTrue(np.isnan(self.elevation().f(41)))
+        self.assertTrue(np.isnan(self.elevation().inverse_f(99)))
+    def test_inverse_cache_keeps_recently_used_values(self):
+        obj = self.elevation()
+        for i in range(reservoir.TabulatedMap.MAX_CACHED_INVERSES):
+            obj.inverse_f(100 + i / reservoir.TabulatedMap.MAX_CACHED_INVERSES)
+        obj.inverse_f(120)
+        obj.inverse_f(115)
+        self.assertIn(120, obj._inverses)
+        self.assertIn(115, obj._inverses)
+        self.assertEqual(len(obj._inverses), reservoir.TabulatedMap.MAX_CACHED_INVERSES)
+    def test_decreasing_map_inverse(self):
+        obj = reservoir.TabulatedMap('depth', [0, 10, 20], [30, 20, 0])
+        self.assertEqual(obj.inverse_f(10), 15)
+        self.assertEqual(obj.inverse_f(25), 5)
+    def test_non_monotone_values_raise_error(self):
+        self.assertRaises(ValueError, reservoir.TabulatedMap, 'x', [0, 1, 2], [0, 2, 1])
+    def test_reservoir_inverse_f_uses_named_map(self):
+        obj = reservoir.Reservoir(capacity=40, maps=[self.elevation()])
+        self.assertEqual(obj.inverse_f('elevation', 120), 15)
+        self.assertEqual(obj.f('elevation', 15), 120)
  
+# %%
+class Test_Zones(unittest.TestCase):
+    def zones(self) -> reservoir.Zones:
+        return reservoir.Zones([('inactive', 10), ('conservation', 50), ('flood', 90)], 'surcharge')
+    def test_classify_uses_half_open_zones(self):
+        obj = self.zones()
+        self.assertListEqual([obj.classify(v) for v in [0, 10, 49.9, 50, 89, 90, 100]], ['inactive', 'conservation', 'conservation', 'flood', 'flood', 'surcharge', 'surcharge'])
+    def test_classify_many_matches_classify(self):
+        obj, volumes = self.zones(), np.linspace(-10, 110, 121)
+        self.assertListEqual(obj.classify_many(volumes), [obj.classify(v) for v in volumes])
+        self.assertListEqual(obj.indices(volumes).tolist(), [obj.index(v) for v in volumes])
+    def test_from_map_converts_tops_to_volumes(self):
+        elevation = reservoir.TabulatedMap('elevation', [0, 100], [1000, 1100])
+        obj = reservoir.Zones.from_map(elevation, [('inactive', 1010), ('conservation', 1050)], 'flood')
+        self.assertTupleEqual(obj.tops, (10, 50))
+    def test_unsorted_tops_raise_error(self):
+        self.assertRaises(ValueError, reservoir.Zones, [('a', 5), ('b', 1)], 'c')
+    def test_reservoir_zone(self):
+        obj = reservoir.Reservoir(capacity=100, zones=self.zones())
+        self.assertEqual(obj.zone(60), 'flood')
+        self.assertRaises(AttributeError, reservoir.Reservoir().zone, 1)
+
 # %%
 class Test_Reservoir(unittest.TestCase):
     # %% [markdown]
     # default Reservoir good data tests.
     # %%
+    def test_outlet_bank_is_not_changed_by_the_outlets_list(self):
+        outlets = [outlet.Outlet('low', 5), outlet.Outlet('high', 15)]
+        obj = reservoir.Reservoir(capacity=20, outlets=outlets)
+        outlets.append(outlet.Outlet('spill', 18))
+        self.assertListEqual(sorted(x.name for x in obj.outlets), ['high', 'low'])
+        self.assertListEqual(sorted(obj.outlet_bank.names), ['high', 'low'])
+        with self.assertRaises(AttributeError):
+            obj.outlets.append(outlet.Outlet('spill', 18))
     def test_default_reservoir_returns_default_name(self):
         obj = reservoir.Reservoir()
         self.assertEqual('default', obj.name)
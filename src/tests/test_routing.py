@@ -0,0 +1,61 @@
+#region Header
+# %% [markdown]
+# # Unit Tests for routing.py
+#
+# Author: John Kucharski | Date: 16 Oct 2026
+#
+# Status: open
+# Testing: n/a
+#endregion
+
+#region Dependencies
+# %%
+import sys
+import pickle
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+import src.routing as routing
+#endregion
+
+#%%
+def muskingum_loop(reach: routing.Muskingum, inflows: np.ndarray) -> np.ndarray:
+    c0, c1, c2 = reach.coefficients
+    outflows = np.empty(len(inflows))
+    outflows[0] = inflows[0] if reach.initial == None else reach.initial
+    for t in range(1, len(inflows)):
+        outflows[t] = c0 * inflows[t] + c1 * inflows[t - 1] + c2 * outflows[t - 1]
+    return outflows
+
+class Test_Routing(unittest.TestCase):
+    def inflows(self, n: int = 500) -> np.ndarray:
+        return np.random.default_rng(1).gamma(2, 3, n)
+    def test_lag_delays_inflows(self):
+        np.testing.assert_array_equal(routing.Lag(2).route([1.0, 2.0, 3.0, 4.0]), [1.0, 1.0, 1.0, 2.0])
+        np.testing.assert_array_equal(routing.Lag(2, initial=0).route([1.0, 2.0, 3.0, 4.0]), [0.0, 0.0, 1.0, 2.0])
+    def test_muskingum_coefficients_sum_to_one(self):
+        self.assertAlmostEqual(sum(routing.Muskingum(2, 0.2).coefficients), 1.0)
+    def test_muskingum_negative_coefficients_raise_error(self):
+        with self.assertRaises(ValueError):
+            routing.Muskingum(1, 0.4, dt=2)
+    def test_muskingum_non_positive_timestep_raises_error(self):
+        with self.assertRaises(ValueError):
+            routing.Muskingum(1, 0.0, dt=0.0)
+    def test_muskingum_matches_recursion(self):
+        for reach in [routing.Muskingum(1.5, 0.2), routing.Muskingum(200, 0.0, initial=0)]:
+            np.testing.assert_array_almost_equal(reach.route(self.inflows()), muskingum_loop(reach, self.inflows()))
+    def test_muskingum_routes_each_ensemble_member(self):
+        reach, inflows = routing.Muskingum(3, 0.1), np.vstack([self.inflows(), 2 * self.inflows()])
+        actual = reach.route(inflows)
+        for i in range(2):
+            np.testing.assert_array_almost_equal(actual[i], reach.route(inflows[i]))
+    def test_muskingum_conserves_volume(self):
+        reach = routing.Muskingum(2, 0.2, initial=0)
+        inflows = np.r_[0.0, self.inflows(100), np.zeros(200)]
+        self.assertAlmostEqual(reach.route(inflows).sum(), inflows.sum())
+    def test_lag_and_route_lags_then_attenuates(self):
+        reach = routing.Lag_And_Route(3, 2)
+        np.testing.assert_array_almost_equal(reach.route(self.inflows()), routing.Muskingum(2, 0).route(routing.Lag(3).route(self.inflows())))
+        self.assertEqual(pickle.loads(pickle.dumps(reach)), reach)
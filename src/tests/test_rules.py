@@ -0,0 +1,122 @@
+#region Header
+# %% [markdown]
+# # Unit Tests for rules.py
+#
+# Author: John Kucharski | Date: 16 Oct 2026
+#
+# Status: open
+# Testing: n/a
+#endregion
+
+#region Dependencies
+# %%
+import sys
+import json
+import pickle
+import unittest
+import datetime
+
+import numpy as np
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.outlet import Outlet
+import src.data as data
+import src.rules as rules
+import src.engine as engine
+import src.simulation as simulation
+import src.reservoir as reservoir
+import src.utilities as utilities
+#endregion
+
+#%%
+SUMMER = utilities.datetime_to_dowy(datetime.date(2021, 4, 2))
+def wilson_like() -> rules.Rule_Policy:
+    return rules.Rule_Policy([
+        rules.Zone_Release('inactive', top=10),
+        rules.Zone_Release('conservation', top=50, release=[(1, 0.5), (SUMMER, 1.5)], outlets=('gate',)),
+        rules.Zone_Release('flood', top=75, above=50, outlets=('gate', 'spillway', 'emergency'), caps={'gate': 8}),
+        rules.Zone_Release('surcharge', above=50, uncontrolled=('emergency', 'spillway'), outlets=('gate',), caps={'gate': 8})])
+def wilson_reservoir() -> reservoir.Reservoir:
+    return reservoir.Reservoir(capacity=100, outlets=[Outlet('gate', 0), Outlet('spillway', 60), Outlet('emergency', 80)])
+def hand_written(t: data.TimeStep, outlets) -> dict:
+    '''The wilson_like() policy, written out as zone functions (as in the wilson example).'''
+    storage = t.inflows() + t.storage() - t.outflows()
+    gate, spillway, emergency = [x for x in outlets]
+    releases = {'gate': 0.0, 'spillway': 0.0, 'emergency': 0.0}
+    if storage < 10:
+        return releases
+    if storage < 50:
+        release = 1.5 if t.calendar.dowy >= SUMMER else 0.5
+        releases['gate'] = min(release, gate.max_release(storage))
+        return releases
+    target = storage - 50
+    if storage < 75:
+        for x in outlets:
+            out = min(target, x.max_release(storage), 8 if x.name == 'gate' else np.inf)
+            releases[x.name], storage, target = out, storage - out, target - out
+        return releases
+    for x in [emergency, spillway]:
+        releases[x.name] = x.max_release(storage)
+        storage, target = storage - releases[x.name], target - releases[x.name]
+    releases['gate'] = max(min(target, gate.max_release(storage), 8), 0.0)
+    return releases
+
+class Test_Rules(unittest.TestCase):
+    def test_seasonal_table_holds_values_until_next_day_and_wraps(self):
+        table = rules.seasonal_table([(100, 2.0), (200, 3.0)])
+        self.assertListEqual(table[[1, 99, 100, 199, 200, 366]].tolist(), [3.0, 3.0, 2.0, 2.0, 3.0, 3.0])
+    def test_seasonal_table_out_of_range_day_raises_error(self):
+        with self.assertRaises(ValueError):
+            rules.seasonal_table([(0, 1.0)])
+    def test_policy_requires_top_for_every_zone_but_the_last(self):
+        with self.assertRaises(ValueError):
+            rules.Rule_Policy([rules.Zone_Release('low'), rules.Zone_Release('high')])
+    def test_unknown_outlet_raises_error(self):
+        policy = rules.Rule_Policy([rules.Zone_Release('all', outlets=('tunnel',))])
+        with self.assertRaises(ValueError):
+            policy.release(1, 1, wilson_reservoir().outlet_bank)
+    def test_operate_matches_hand_written_zone_rules(self):
+        policy, res = wilson_like(), wilson_reservoir()
+        for date in [datetime.date(2022, 1, 8), datetime.date(2022, 6, 1)]:
+            for v in np.linspace(0, 120, 49):
+                t = data.TimeStep(date, {'inflow': data.Input(v), 'storage': data.Input(0, category=data.Category.STORAGE)})
+                expected = hand_written(t, res.outlet_bank)
+                for k, x in policy.operate(t, res.outlet_bank).items():
+                    self.assertAlmostEqual(x, expected[k])
+    def test_operate_batch_matches_operate(self):
+        policy, res = wilson_like(), wilson_reservoir()
+        volume = np.linspace(0, 120, 49)
+        dowys = np.where(np.arange(49) % 2 == 0, 100, 250)
+        actual = policy.operate_batch({'inflow': volume, 'outflow': np.zeros(49), 'storage': np.zeros(49), 'dowy': dowys}, res.outlet_bank)
+        for j, v in enumerate(volume):
+            expected = policy.release(v, dowys[j], res.outlets)
+            for k, x in expected.items():
+                self.assertAlmostEqual(actual[k][j], x)
+    def test_shared_policy_compiles_each_outlet_set_once(self):
+        policy, calls = wilson_like(), []
+        compile = policy.compile
+        policy.compile = lambda outlets: calls.append(outlets) or compile(outlets)
+        a, b = wilson_reservoir().outlet_bank, wilson_reservoir().outlet_bank
+        for outlets in [a, b, a, b]:
+            policy.release(30, SUMMER, outlets)
+        self.assertEqual(len(calls), 2)
+    def test_to_dict_round_trips_through_json(self):
+        policy = wilson_like()
+        copy = rules.Rule_Policy.from_dict(json.loads(json.dumps(policy.to_dict())))
+        self.assertTupleEqual(copy.declared, policy.declared)
+        self.assertDictEqual(copy.release(30, SUMMER, wilson_reservoir().outlet_bank), policy.release(30, SUMMER, wilson_reservoir().outlet_bank))
+    def test_pickled_policy_makes_the_same_releases(self):
+        policy, res = wilson_like(), wilson_reservoir()
+        policy.release(90, 1, res.outlet_bank)
+        copy = pickle.loads(pickle.dumps(policy))
+        self.assertDictEqual(copy.release(90, 1, res.outlet_bank), policy.release(90, 1, res.outlet_bank))
+    def test_policy_runs_on_the_array_engine(self):
+        rng = np.random.default_rng(1)
+        dates = [datetime.date(2001, 1, 1) + datetime.timedelta(days=t) for t in range(400)]
+        ts = data.TimeSeries.from_columns(dates, {'inflow': rng.gamma(2, 6, 400), 'storage': np.r_[40.0, np.full(399, np.nan)]},
+                                          {'inflow': data.Category.INFLOW, 'storage': data.Category.STORAGE})
+        policy, res = wilson_like(), wilson_reservoir()
+        self.assertTrue(engine.supports(ts, res, policy.operate))
+        expected = simulation.Simulation(ts, res, hand_written).simulate(arrays=False)
+        actual = engine.simulate(ts, res, policy.operate)
+        np.testing.assert_array_almost_equal(actual.input('storage'), expected.input('storage'))
@@ -0,0 +1,56 @@
+#region Header
+# %% [markdown]
+# # Unit Tests for scenarios.py
+# 
+# Author: John Kucharski | Date: 16 Oct 2026
+# 
+# Status: open 
+# Testing: n/a
+#endregion
+
+#region Dependencies
+# %%
+import sys
+import pickle
+import unittest
+import datetime
+
+import numpy as np
+
+sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
+from src.outlet import Outlet
+import src.data as data
+import src.reservoir as reservoir
+import src.operations as ops
+import src.simulation as simulation
+import src.scenarios as scenarios
+import src.utilities as utilities
+from src.tests.test_engine import random_timeseries
+#endregion
+
+#%%
+def model() -> reservoir.Reservoir:
+    f = utilities.f_close_on_domain(utilities.f_interpolate_from_data([0, 10, 20], [0, 2, 6], extrapolate_hi=6), 0, 20)
+    maps = [reservoir.Map('elevation', utilities.f_interpolate_from_data([0, 20], [100, 140]), utilities.f_interpolate_from_data([100, 140], [0, 20]))]
+    return reservoir.Reservoir(capacity=20, outlets=[Outlet('gate', 2, f), Outlet('spill', 15)], maps=maps)
+
+class Test_Pickle(unittest.TestCase):
+    def test_reservoir_with_interpolated_outlets_and_maps_pickles(self):
+        copy = pickle.loads(pickle.dumps(model()))
+        self.assertEqual(copy.select_outlet('gate').max_release(15), 4)
+        self.assertEqual(copy.select_outlet('spill').max_release(16), 1)
+        self.assertEqual(copy.f('elevation', 10), 120)
+    def test_rule_curve_operations_pickle(self):
+        curve = ops.Rule_Curve([(datetime.datetime(2021, 10, 1), 8), (datetime.datetime(2021, 4, 1), 12)])
+        copy = pickle.loads(pickle.dumps(curve.operate))
+        self.assertEqual(copy.__self__.target_volume(100), curve.target_volume(100))
+
+class Test_Run_Scenarios(unittest.TestCase):
+    def test_results_match_serial_simulations(self):
+        jobs = [scenarios.Scenario(f'trace_{i}', model(), ops.passive_operations, random_timeseries(100, seed=i), simulation.KeepSummary()) for i in range(4)]
+        results = dict(scenarios.run_scenarios(jobs, max_workers=2))
+        self.assertSetEqual(set(results), {x.name for x in jobs})
+        for x in jobs:
+            expected = x.run()[1]
+            self.assertEqual(results[x.name]['storage'], expected['storage'])
+            self.assertEqual(results[x.name]['outflow'], expected['outflow'])
@@ -21,6 +21,9 @@ import numpy as np
 sys.path.insert(0, '/Users/johnkucharski/Documents/source/canteen')
 import src.simulation as simulation
 import src.data as data
+import src.reservoir as reservoir
+import src.operations as operations
+from src.outlet import Outlet
 #endregion
 
 class Test_Simulation(unittest.TestCase):
@@ -75,4 +78,143 @@ class Test_Simulation(unittest.TestCase):
     #            'storage': [0, 1, 1], 
     #            'spill': [0, 1, 1],
     #            'x': [1, 2, 3]}
-    #     self.assertDictEqual(act, exp)
\ No newline at end of file
+    #     self.assertDictEqual(act, exp)
+class Test_Simulate_Chunks(unittest.TestCase):
+    def timeseries(self, n: int = 6) -> data.TimeSeries:
+        return data.TimeSeries([data.TimeStep(t, inputs={'inflow': data.Input(t % 3)} | ({'storage': data.Input(0, category=data.Category.STORAGE)} if t == 0 else {})) for t in range(n)])
+    def chunks(self, n: int = 6, size: int = 4) -> typing.Iterator[data.TimeSeries]:
+        ts = self.timeseries(n)
+        for i in range(0, n, size):
+            yield data.TimeSeries.from_columns(ts.dates()[i:i + size], {k: ts.input(k)[i:i + size] for k in ts.variables}, {k: ts.category(k) for k in ts.variables}) if i == 0 else \
+                data.TimeSeries.from_columns(ts.dates()[i:i + size], {'inflow': ts.input('inflow')[i:i + size]}, {'inflow': data.Category.INFLOW}, storage_key='storage')
+    def test_simulate_chunks_matches_simulate(self):
+        sim = simulation.Simulation(self.timeseries(), reservoir.Reservoir(), operations.passive_operations)
+        expected = sim.simulate()
+        actual = list(simulation.Simulation(None, reservoir.Reservoir(), operations.passive_operations).simulate_chunks(self.chunks()))
+        self.assertListEqual([len(x) for x in actual], [4, 2])
+        self.assertListEqual(list(np.concatenate([x.storage() for x in actual])), list(expected.storage()))
+        self.assertListEqual(list(np.concatenate([x.outflows() for x in actual])), list(expected.outflows()))
+
+class Test_Retention(unittest.TestCase):
+    def simulation(self, n: int = 10, outputs: typing.Dict[str, data.Output] = None) -> simulation.Simulation:
+        ts = data.TimeSeries([data.TimeStep(t, inputs={'inflow': data.Input(t % 3)} | ({'storage': data.Input(0, category=data.Category.STORAGE)} if t == 0 else {}), outputs=outputs) for t in range(n)])
+        return simulation.Simulation(ts, reservoir.Reservoir(), operations.passive_operations)
+    def test_stream_yields_simulated_timesteps(self):
+        sim = self.simulation()
+        self.assertListEqual([t.storage() for t in sim.stream()], list(sim.simulate().storage()))
+    def test_keep_variables_returns_arrays(self):
+        sim = self.simulation()
+        result = sim.simulate(simulation.KeepVariables(['storage', 'spill'], n=3))
+        self.assertListEqual(list(result['spill']), list(sim.simulate().input('spill')))
+        self.assertListEqual(list(result['date']), list(range(10)))
+    def test_keep_summary_returns_running_statistics(self):
+        sim = self.simulation()
+        result = sim.simulate(simulation.KeepSummary(['spill']))
+        expected = sim.simulate().outflows()
+        self.assertEqual(result['spill'].count, 10)
+        self.assertAlmostEqual(result['outflow'].mean, np.mean(expected))
+        self.assertAlmostEqual(result['outflow'].variance, np.var(expected, ddof=1))
+        self.assertEqual(result['outflow'].maximum, np.max(expected))
+    def test_array_engine_with_retention_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            self.simulation().simulate(simulation.KeepSummary(['spill']), arrays=True)
+    def test_stream_window_bounds_timesteps_passed_to_outputs(self):
+        lengths = []
+        def fn(ts: typing.List[data.TimeStep], t: int) -> typing.Dict[str, float]:
+            lengths.append(len(ts) - ts.start)
+            return {'x': t}
+        sim = self.simulation(outputs={'x': data.Output(fn, data.Category.OTHER)})
+        list(sim.stream(window=3))
+        self.assertEqual(max(lengths), 3)
+    def test_stream_window_keeps_absolute_timestep_indices(self):
+        indices = []
+        def fn(ts: typing.List[data.TimeStep], t: int) -> typing.Dict[str, float]:
+            indices.append((t, ts[t].date, ts[t - 1].date if t > 0 else None))
+            return {'x': t}
+        sim = self.simulation(n=5, outputs={'x': data.Output(fn, data.Category.OTHER)})
+        result = sim.simulate(simulation.KeepVariables(['x'], n=5))
+        self.assertListEqual(indices, [(0, 0, None), (1, 1, 0), (2, 2, 1), (3, 3, 2), (4, 4, 3)])
+        self.assertListEqual(list(result['x']), [0, 1, 2, 3, 4])
+        window = simulation.Window()
+        for step in sim.timeseries.timesteps:
+            window.append(step)
+        window.trim(2)
+        with self.assertRaises(IndexError):
+            window[2]
+    def test_window_slices_are_clamped_to_held_timesteps(self):
+        window = simulation.Window()
+        for step in self.simulation(n=5).timeseries.timesteps:
+            window.append(step)
+        window.trim(2)
+        self.assertEqual(window.start, 3)
+        self.assertListEqual([x.date for x in window[:5]], [3, 4])
+        self.assertListEqual([x.date for x in window[:4]], [3])
+        self.assertListEqual([x.date for x in window[::-1]], [4, 3])
+        self.assertListEqual([x.date for x in reversed(window)], [4, 3])
+        self.assertEqual(window.index(window[4]), 4)
+    def test_pre_operations_outputs_do_not_skip_operations(self):
+        sim = self.simulation(outputs={'x': data.Output(lambda ts, t: {'x': 1}, data.Category.OTHER)})
+        self.assertListEqual(list(sim.simulate().outflows()), list(self.simulation().simulate().outflows()))
+
+class Test_Profile(unittest.TestCase):
+    def simulation(self, n: int = 10, profile: bool = True) -> simulation.Simulation:
+        outputs = {'pre': data.Output(lambda ts, t: {'pre': 1}, data.Category.OTHER), 
+                   'post': data.Output(lambda ts, t: {'post': 2}, data.Category.OTHER, data.RunOrder.POST_OPERATIONS)}
+        ts = data.TimeSeries([data.TimeStep(t, inputs={'inflow': data.Input(t % 3)} | ({'storage': data.Input(0, category=data.Category.STORAGE)} if t == 0 else {}), outputs=outputs) for t in range(n)])
+        return simulation.Simulation(ts, reservoir.Reservoir(), operations.passive_operations, profile=profile)
+    def test_profile_is_none_by_default(self):
+        self.assertIsNone(self.simulation(profile=False).profile)
+    def test_profile_counts_calls_by_phase_and_output(self):
+        sim = self.simulation()
+        sim.simulate()
+        report = sim.profile.report()
+        self.assertDictEqual({k: v['calls'] for k, v in report['phases'].items()}, 
+                             {'pre_operations': 10, 'operations': 10, 'post_operations': 10, 'update_storage': 10, 'add_inputs': 29})
+        self.assertDictEqual({k: v['calls'] for k, v in report['outputs'].items()}, {'pre': 10, 'post': 10})
+        self.assertGreater(report['seconds'], 0)
+    def test_profiled_simulation_matches_simulation(self):
+        expected, actual = self.simulation(profile=False).simulate(), self.simulation().simulate()
+        self.assertListEqual(list(actual.storage()), list(expected.storage()))
+        np.testing.assert_array_equal(actual.input('post'), expected.input('post'))
+    def test_profile_records_array_engine(self):
+        sim = simulation.Simulation(Test_Retention().simulation().timeseries, reservoir.Reservoir(), operations.passive_operations, profile=True)
+        sim.simulate()
+        self.assertListEqual(list(sim.profile.report()['phases']), ['engine'])
+
+class Test_Precompute_Outputs(unittest.TestCase):
+    def timeseries(self, reads: typing.Union[typing.Tuple[str, ...], None], vectorized: bool = False, n: int = 20) -> data.TimeSeries:
+        half = data.Output(lambda ts, t: {'half': ts[t].inputs['inflow'].value / 2}, data.Category.OUTFLOW, reads=reads,
+                           vectorized=(lambda ts: {'half': ts.input('inflow') / 2}) if vectorized else None)
+        lagged = data.Output(lambda ts, t: {'lagged': ts[t].inputs['inflow'].value}, data.Category.OTHER, data.RunOrder.POST_OPERATIONS, reads=reads)
+        tracked = data.Output(lambda ts, t: {'tracked': ts[t].storage()}, data.Category.OTHER, reads=('storage',))
+        outputs = {'half': half, 'lagged': lagged, 'tracked': tracked}
+        return data.TimeSeries([data.TimeStep(t, inputs={'inflow': data.Input(float(t % 4))} | ({'storage': data.Input(1.0, category=data.Category.STORAGE)} if t == 0 else {}), outputs=outputs)
+                                for t in range(n)])
+    def simulate(self, ts: data.TimeSeries) -> data.TimeSeries:
+        return simulation.Simulation(ts, reservoir.Reservoir(outlets=[Outlet('spill', 3)]), operations.passive_operations).simulate()
+    def test_only_outputs_reading_exogenous_inputs_are_precomputed(self):
+        ts = self.timeseries(reads=('inflow',)).precompute_outputs(['spill'])
+        self.assertListEqual(list(ts[0].outputs), ['tracked'])
+        self.assertListEqual(ts.input('half')[:4].tolist(), [0.0, 0.5, 1.0, 1.5])
+        self.assertIsNotNone(ts.mask('lagged'))
+        self.assertListEqual(ts.input('lagged')[1:4].tolist(), [0.0, 1.0, 2.0])
+    def test_outputs_reading_precomputed_outputs_match_simulation_loop(self):
+        def chain(reads: bool) -> data.TimeSeries:
+            a = data.Output(lambda ts, t: {'a': ts[t].inputs['inflow'].value + 1}, data.Category.OTHER, reads=('inflow',) if reads else None)
+            b = data.Output(lambda ts, t: {'b': 2 * ts[t].inputs['a'].value}, data.Category.OTHER, reads=('a',) if reads else None)
+            return data.TimeSeries([data.TimeStep(t, inputs={'inflow': data.Input(float(t % 4))} | ({'storage': data.Input(1.0, category=data.Category.STORAGE)} if t == 0 else {}), outputs={'a': a, 'b': b})
+                                    for t in range(10)])
+        self.assertListEqual(list(chain(True).precompute_outputs(['spill'])[0].outputs), [])
+        expected = simulation.Simulation(chain(False), reservoir.Reservoir(outlets=[Outlet('spill', 3)]), operations.passive_operations).simulate(arrays=False)
+        actual = simulation.Simulation(chain(True), reservoir.Reservoir(outlets=[Outlet('spill', 3)]), operations.passive_operations).simulate(arrays=False)
+        for k in ['storage', 'a', 'b']:
+            np.testing.assert_array_equal(np.asarray(actual.input(k), dtype=float), np.asarray(expected.input(k), dtype=float))
+    def test_undeclared_outputs_are_not_precomputed(self):
+        ts = self.timeseries(reads=None)
+        self.assertIs(ts.precompute_outputs(['spill']), ts)
+    def test_precomputed_outputs_match_simulation_loop(self):
+        expected = self.simulate(self.timeseries(reads=None))
+        for vectorized in [False, True]:
+            actual = self.simulate(self.timeseries(reads=('inflow',), vectorized=vectorized))
+            for k in ['storage', 'half', 'lagged', 'tracked', 'spill']:
+                np.testing.assert_array_equal(np.asarray(actual.input(k), dtype=float), np.asarray(expected.input(k), dtype=float))
@@ -87,6 +87,13 @@ class Test_Utilities(unittest.TestCase):
         '''
         feb29 = datetime.datetime(year = 2020, month = 2, day = 29)
         self.assertEqual(utilities.datetime_to_dowy(feb29), 152)
+    def test_datetime_to_dowy_every_day_matches_day_of_year_conversion(self):
+        '''
+        Tests that each day from 2019 to 2021 is converted to the same day of the water year as doy_to_dowy(day of the year)
+        '''
+        for t in range(3 * 366):
+            date = datetime.date(2019, 1, 1) + datetime.timedelta(days=t)
+            self.assertEqual(utilities.datetime_to_dowy(date), utilities.doy_to_dowy(date.timetuple().tm_yday, date.year % 4 == 0))
 
     
     # %% [markdown]
@@ -51,9 +51,12 @@ def doy_to_dowy(julian_day: int, is_leap_year: bool = False) -> int:
     else:
         dowy = julian_day - (oct_01 - 1)
     return dowy
+DAYS_BEFORE_MONTH = (0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+'''The number of days before the first of each month (indexed by month number) in a non leap year.'''
 def datetime_to_dowy(datetimeobj: datetime.datetime) -> int:
-    doy = datetimeobj.timetuple().tm_yday
+    '''Converts a date or datetime to the day of the water year.'''
     leapyear = calendar.isleap(datetimeobj.year)
+    doy = DAYS_BEFORE_MONTH[datetimeobj.month] + datetimeobj.day + (leapyear and datetimeobj.month > 2)
     return doy_to_dowy(doy, leapyear)       
 
 # %%[markdown]
@@ -406,43 +409,71 @@ def joules_to_celcius(heat: float, volume: float) -> float:
 #region Closures
 # %%[markdown]
 # ## Closures
+# The functions below return instances of the callable classes that follow them, rather than nested functions, so that the functions (and the outlets, maps and simulations that use them) can be pickled and sent to other processes.
 def f_close_on_domain(f: typing.Callable[[float], float], min: float, max: float) -> typing.Callable[[float], float]: 
-    def inner(x: float) -> float:
-        is_valid, _ = is_on_range(x, min, max)
+    return Closed_On_Domain(f, min, max)
+def f_close_on_range(f: typing.Callable[[float], float], min: float, max: float) -> typing.Callable[[float], float]:
+    return Closed_On_Range(f, min, max)
+def f_set_min_and_min(f: typing.Callable[[float], float], min: float = -np.inf, max: float = np.inf) -> typing.Callable[[float], float]:
+    return Bounded(f, min, max)
+def f_interpolate_from_data(xs: typing.List[float], ys: typing.List[float], interpolation: typing.Callable[[float, typing.List[float], typing.List[float]], float] = np.interp, extrapolate_lo: float = None, extrapolate_hi: float = None) -> typing.Callable[[float], float]: 
+    return Interpolated(xs, ys, interpolation, extrapolate_lo, extrapolate_hi)
+
+@dataclasses.dataclass(frozen=True)
+class Closed_On_Domain:
+    '''Returns f(x) for x on [min, max], np.nan otherwise.'''
+    f: typing.Callable[[float], float]
+    min: float
+    max: float
+    def __call__(self, x: float) -> float:
+        is_valid, _ = is_on_range(x, self.min, self.max)
         if is_valid:
-            return f(x)
+            return self.f(x)
         else:
             return np.nan
-    return inner
-def f_close_on_range(f: typing.Callable[[float], float], min: float, max: float) -> typing.Callable[[float], float]:
-    def inner(x: float):
-        is_valid, _ = is_on_range(f(x), min, max)
+@dataclasses.dataclass(frozen=True)
+class Closed_On_Range:
+    '''Returns f(x) if f(x) is on [min, max], np.nan otherwise.'''
+    f: typing.Callable[[float], float]
+    min: float
+    max: float
+    def __call__(self, x: float) -> float:
+        is_valid, _ = is_on_range(self.f(x), self.min, self.max)
         if is_valid:
-            return f(x)
+            return self.f(x)
         else:
             return np.nan
-    return inner  
-def f_set_min_and_min(f: typing.Callable[[float], float], min: float = -np.inf, max: float = np.inf) -> typing.Callable[[float], float]:
-    def inner(x: float):
-        y = f(x)
-        if y < min or np.isnan(y):
-            return min
-        if y > max or np.isnan(y):
-            return max
+@dataclasses.dataclass(frozen=True)
+class Bounded:
+    '''Returns f(x) limited to [min, max], nan values are set to min.'''
+    f: typing.Callable[[float], float]
+    min: float = -np.inf
+    max: float = np.inf
+    def __call__(self, x: float) -> float:
+        y = self.f(x)
+        if y < self.min or np.isnan(y):
+            return self.min
+        if y > self.max or np.isnan(y):
+            return self.max
         else:
             return y
-    return inner   
-def f_interpolate_from_data(xs: typing.List[float], ys: typing.List[float], interpolation: typing.Callable[[float, typing.List[float], typing.List[float]], float] = np.interp, extrapolate_lo: float = None, extrapolate_hi: float = None) -> typing.Callable[[float], float]: 
-    def inner(x: float) -> float:
-        on_range, _ = is_on_range(x, xs[0], xs[len(xs) - 1])
+@dataclasses.dataclass(frozen=True)
+class Interpolated:
+    '''Interpolates y at x from the xs, ys data, returning the extrapolate_lo or extrapolate_hi values (or np.nan if these are None) off of the xs range.'''
+    xs: typing.List[float]
+    ys: typing.List[float]
+    interpolation: typing.Callable[[float, typing.List[float], typing.List[float]], float] = np.interp
+    extrapolate_lo: float = None
+    extrapolate_hi: float = None
+    def __call__(self, x: float) -> float:
+        on_range, _ = is_on_range(x, self.xs[0], self.xs[len(self.xs) - 1])
         if on_range:
-            return interpolation(x, xs, ys)
+            return self.interpolation(x, self.xs, self.ys)
         else:
-            if x < xs[0]:
-                return extrapolate_lo if extrapolate_lo != None else np.nan
+            if x < self.xs[0]:
+                return self.extrapolate_lo if self.extrapolate_lo != None else np.nan
             else: # since its not on range it must be x > x[1]
-                return extrapolate_hi if extrapolate_hi != None else np.nan
-    return inner    
+                return self.extrapolate_hi if self.extrapolate_hi != None else np.nan
 #endregion
  
 #region Validation   